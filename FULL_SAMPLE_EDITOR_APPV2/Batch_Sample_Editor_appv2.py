@@ -0,0 +1,6 @@
+# Batch_Sample_Editor_appv2.py
+import sys
+from batch_module import main
+
+if __name__ == "__main__":
+    sys.exit(main())
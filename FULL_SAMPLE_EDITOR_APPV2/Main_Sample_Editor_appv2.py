@@ -2,8 +2,10 @@
 import sys
 from PyQt5.QtWidgets import QApplication
 from UI_Sample_Editor_app import SampleChopperApp
+from trace_module import enable_from_env
 
 def main():
+    enable_from_env()  # SAMPLE_EDITOR_TRACE=trace.json records per-stage spans of this session
     app = QApplication(sys.argv)
     window = SampleChopperApp()  # Match the class name from the UI file
     window.show()
@@ -0,0 +1,6 @@
+# Service_Sample_Editor_appv2.py
+import sys
+from service_module import main
+
+if __name__ == "__main__":
+    sys.exit(main())
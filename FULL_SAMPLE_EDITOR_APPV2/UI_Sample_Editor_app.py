@@ -2,21 +2,40 @@ import os
 import sys
 import shutil
 import atexit
-import librosa
 import numpy as np
-import soundfile as sf 
-import simpleaudio as sa
-import matplotlib.pyplot as plt
 from PyQt5.QtCore import Qt
-from PyQt5.QtCore import QTimer
+from PyQt5.QtCore import QTimer, QSize
+from PyQt5.QtGui import QIcon
 from PyQt5.QtWidgets import QInputDialog
-from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QPushButton, QMainWindow, QApplication, QFileDialog, QVBoxLayout, QPushButton, QWidget, QHBoxLayout, QLabel, QSlider, QScrollBar, QTreeWidget, QTreeWidgetItem, QCheckBox, QLineEdit, QScrollArea
+from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QPushButton, QMainWindow, QApplication, QFileDialog, QVBoxLayout, QPushButton, QWidget, QHBoxLayout, QLabel, QSlider, QScrollBar, QTreeWidget, QTreeWidgetItem, QCheckBox, QLineEdit, QScrollArea, QComboBox
 from chopper_module import SampleChopper
 from list_module import SampleListManager
 from utility_module import UtilityProcessor
 from silence_module import SilenceProcessor
 from signature_module import SignatureProcessor
+from loudness_module import LoudnessAnalyzer
+from rename_module import RenamePlanner
+from startup_module import warm_imports
+from trace_module import traced
+from memory_module import MemoryBudgetError
+from service_module import JobClient
+from pipeline_module import import_samples, export_samples
+from session_module import SESSION_EXTENSION, save_session, load_session, restore_chopper, restore_samples
+from buffer_module import encode, play
+from store_module import read_file, output_subtype
+from thumbnail_module import get_thumbnail_cache, thumbnail_pixmap
+from preview_module import PreviewChain
+
+# Waveform view: "matplotlib" (default) or "qpainter", the QPainter widget that draws from the peak data
+WAVEFORM_BACKEND_ENV = "SAMPLE_EDITOR_WAVEFORM"
+
+# Size in pixels of the waveform thumbnails in the sample list
+THUMBNAIL_WIDTH = 96
+THUMBNAIL_HEIGHT = 20
+
+# Onset detectors offered in the chopping controls, see SampleChopper.onset_strength
+ONSET_METHODS = {"Onsets: Mel (librosa)": "librosa", "Onsets: Spectral Flux": "flux",
+                 "Onsets: Spectral Flux, Whitened": "flux_whitened"}
 
 
 
@@ -40,6 +59,7 @@ class SampleChopperApp(QMainWindow):
         # Initialize processors
         self.utility_processor = UtilityProcessor()
         self.silence_processor = SilenceProcessor()
+        self.preview_chain = PreviewChain(self.silence_processor, self.utility_processor)
 
         # Track whether the silence module is enabled
         self.crop_silences_enabled = False
@@ -51,8 +71,10 @@ class SampleChopperApp(QMainWindow):
         self.current_xlim = None
         self.zoom_level = 1.0
         self.markers = []
+        self.region_ends = {}  # Marker time -> region end, filled by split on silence
+        self.session_source = None  # Source reference of the last saved or opened session, saves rehashing
 
-        # Temporary folder for storing samples
+        # Temporary folder for the tag and analysis files, the samples themselves live in the sample store
         self.temp_folder = os.path.join(os.getcwd(), "temp_samples")
         os.makedirs(self.temp_folder, exist_ok=True)
 
@@ -75,6 +97,10 @@ class SampleChopperApp(QMainWindow):
         self.init_middle_section()
         self.init_bottom_section()
 
+        # Build the waveform canvas right after the window is shown and import the audio stack in the background
+        QTimer.singleShot(0, self.init_waveform_canvas)
+        warm_imports()
+
         # Register cleanup of temp folder at exit
         atexit.register(self.cleanup_temp_folder)
 
@@ -129,9 +155,19 @@ class SampleChopperApp(QMainWindow):
 
         # Left column: List of samples and tags
         self.sample_tree = QTreeWidget()
-        self.sample_tree.setHeaderLabels(["Sample Name", "Tag"])
+        self.sample_tree.setHeaderLabels(["Sample Name", "Tag", "Waveform"])
+        self.sample_tree.setIconSize(QSize(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT))
+        self.sample_tree.setColumnWidth(2, THUMBNAIL_WIDTH + 8)
         middle_layout.addWidget(self.sample_tree)
 
+        # Waveform thumbnails of the visible rows, made in the background and shown as they finish
+        self.thumbnails = get_thumbnail_cache()
+        self.thumbnail_timer = QTimer(self)
+        self.thumbnail_timer.setInterval(50)
+        self.thumbnail_timer.timeout.connect(self.poll_thumbnails)
+        self.sample_tree.verticalScrollBar().valueChanged.connect(self.schedule_thumbnails)
+        self.sample_tree.verticalScrollBar().rangeChanged.connect(self.schedule_thumbnails)
+
         # Connect double-click event for renaming samples or editing tags
         self.sample_tree.itemDoubleClicked.connect(self.handle_item_double_click)
 
@@ -167,6 +203,14 @@ class SampleChopperApp(QMainWindow):
         self.load_button.clicked.connect(self.load_audio)
         controls_layout.addWidget(self.load_button)
 
+        # Session buttons: markers, analysis, sample list and settings, reopened without decoding the source
+        self.save_session_button = QPushButton("Save Session", self)
+        self.save_session_button.clicked.connect(self.save_session)
+        controls_layout.addWidget(self.save_session_button)
+        self.open_session_button = QPushButton("Open Session", self)
+        self.open_session_button.clicked.connect(self.open_session)
+        controls_layout.addWidget(self.open_session_button)
+
         # Minimum Duration Slider
         self.min_duration_label = QLabel("Minimum Duration (s): 0.3")
         controls_layout.addWidget(self.min_duration_label)
@@ -194,11 +238,21 @@ class SampleChopperApp(QMainWindow):
         self.threshold_slider.valueChanged.connect(self.update_threshold)
         controls_layout.addWidget(self.threshold_slider)
 
+        # Onset detector selector
+        self.onset_method_combo = QComboBox(self)
+        self.onset_method_combo.addItems(list(ONSET_METHODS))
+        controls_layout.addWidget(self.onset_method_combo)
+
         # Detect Onsets button
         self.detect_onsets_button = QPushButton("Detect Onsets", self)
         self.detect_onsets_button.clicked.connect(self.detect_onsets)
         controls_layout.addWidget(self.detect_onsets_button)
 
+        # Split on Silence button (places a marker at every audible region, uses the silence threshold)
+        self.split_on_silence_button = QPushButton("Split on Silence", self)
+        self.split_on_silence_button.clicked.connect(self.split_on_silence)
+        controls_layout.addWidget(self.split_on_silence_button)
+
         # Chop Audio button
         self.chop_audio_button = QPushButton("Chop Audio", self)
         self.chop_audio_button.clicked.connect(self.chop_audio)
@@ -215,6 +269,11 @@ class SampleChopperApp(QMainWindow):
         self.crop_silences_checkbox.stateChanged.connect(self.toggle_crop_silences)
         silence_controls_layout.addWidget(self.crop_silences_checkbox)
 
+        # Live Preview toggle, plays the selected sample through the processing settings as they change
+        self.live_preview_checkbox = QCheckBox("Live Preview", self)
+        self.live_preview_checkbox.stateChanged.connect(self.preview_processing)
+        silence_controls_layout.addWidget(self.live_preview_checkbox)
+
         # Silence Threshold slider
         self.silence_threshold_label = QLabel("Silence Threshold (dB): -40")
         silence_controls_layout.addWidget(self.silence_threshold_label)
@@ -250,11 +309,26 @@ class SampleChopperApp(QMainWindow):
         self.sample_rate_input.editingFinished.connect(self.update_sample_rate)
         silence_controls_layout.addWidget(self.sample_rate_input)
 
+        # Resample quality selector
+        self.resample_quality_label = QLabel("Resample Quality:")
+        silence_controls_layout.addWidget(self.resample_quality_label)
+        self.resample_quality_combo = QComboBox(self)
+        self.resample_quality_combo.addItems(["fast", "hq", "vhq"])
+        self.resample_quality_combo.setCurrentText("hq")
+        self.resample_quality_combo.currentTextChanged.connect(self.update_resample_quality)
+        silence_controls_layout.addWidget(self.resample_quality_combo)
+
         # Normalize Samples toggle
         self.normalize_checkbox = QCheckBox("Normalize Samples", self)
         self.normalize_checkbox.stateChanged.connect(self.toggle_normalize_samples)
         silence_controls_layout.addWidget(self.normalize_checkbox)
 
+        # Normalization mode selector (RMS level or integrated loudness)
+        self.normalize_mode_combo = QComboBox(self)
+        self.normalize_mode_combo.addItems(["RMS dB", "LUFS"])
+        self.normalize_mode_combo.currentTextChanged.connect(self.update_normalize_mode)
+        silence_controls_layout.addWidget(self.normalize_mode_combo)
+
         # Target dB slider
         self.target_db_label = QLabel("Target dB for Normalization: -3")
         silence_controls_layout.addWidget(self.target_db_label)
@@ -264,6 +338,19 @@ class SampleChopperApp(QMainWindow):
         self.target_db_slider.valueChanged.connect(self.update_target_db)
         silence_controls_layout.addWidget(self.target_db_slider)
 
+        # Analyze Loudness button (writes a QC report and caches the measurements for export)
+        self.analyze_loudness_button = QPushButton("Analyze Loudness", self)
+        self.analyze_loudness_button.clicked.connect(self.analyze_loudness)
+        silence_controls_layout.addWidget(self.analyze_loudness_button)
+
+        # Samples no stage would change are exported as hardlinks to their source instead of copies
+        self.hardlink_unchanged_checkbox = QCheckBox("Hardlink Unchanged Samples", self)
+        silence_controls_layout.addWidget(self.hardlink_unchanged_checkbox)
+
+        # Export via the job service instead of processing inline (run Service_Sample_Editor_appv2.py serve)
+        self.use_job_service_checkbox = QCheckBox("Export via Job Service", self)
+        silence_controls_layout.addWidget(self.use_job_service_checkbox)
+
         # Save Samples button
         self.save_samples_button = QPushButton("Save Samples", self)
         self.save_samples_button.clicked.connect(self.save_samples_with_signature)
@@ -293,15 +380,24 @@ class SampleChopperApp(QMainWindow):
         self.zoom_out_button.clicked.connect(self.zoom_out)
         zoom_layout.addWidget(self.zoom_in_button)
         zoom_layout.addWidget(self.zoom_out_button)
+
+        # View mode, the spectrogram is computed in tiles in the background as they come into view
+        self.view_mode_combo = QComboBox(self)
+        self.view_mode_combo.addItems(["Waveform", "Spectrogram"])
+        self.view_mode_combo.currentTextChanged.connect(lambda _: self.update_waveform() if hasattr(self, 'chopper') else None)
+        zoom_layout.addWidget(self.view_mode_combo)
         bottom_layout.addLayout(zoom_layout)
 
-        # Waveform Display
-        self.fig, self.ax = plt.subplots(figsize=(8, 4))
-        self.canvas = FigureCanvas(self.fig)
+        # Redraws the spectrogram while background tiles come in
+        self.spectrogram_timer = QTimer(self)
+        self.spectrogram_timer.setInterval(100)
+        self.spectrogram_timer.timeout.connect(self.poll_spectrogram_tiles)
+        self.spectrogram_pending = 0
 
-        # Connect the canvas to mouse click events for adding/removing markers
-        self.fig.canvas.mpl_connect('button_press_event', self.on_click)
-        bottom_layout.addWidget(self.canvas)
+        # Waveform Display, the matplotlib canvas is added by init_waveform_canvas once the window is up
+        self.canvas = None
+        self.waveform_layout = QVBoxLayout()
+        bottom_layout.addLayout(self.waveform_layout)
 
         # Scrollbar for panning
         self.scrollbar = QScrollBar(Qt.Horizontal)
@@ -315,6 +411,30 @@ class SampleChopperApp(QMainWindow):
 
         self.layout.addLayout(bottom_layout)
 
+    def init_waveform_canvas(self):
+        """Creates the waveform canvas, deferred so importing matplotlib does not delay the first window."""
+        if self.canvas is not None:
+            return
+        if os.environ.get(WAVEFORM_BACKEND_ENV, "matplotlib") == "qpainter":
+            from waveform_widget_module import WaveformWidget
+
+            # The widget stands in for both the axes and the canvas
+            self.canvas = self.ax = self.fig = WaveformWidget()
+            self.canvas.mpl_connect('button_press_event', self.on_click)
+            self.waveform_layout.addWidget(self.canvas)
+            return
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+
+        self.fig = Figure(figsize=(8, 4))
+        self.ax = self.fig.add_subplot()
+        self.canvas = FigureCanvas(self.fig)
+
+        # Connect the canvas to mouse click events for adding/removing markers
+        self.fig.canvas.mpl_connect('button_press_event', self.on_click)
+        self.waveform_layout.addWidget(self.canvas)
+
 
 
 #TUTORIAL
@@ -444,13 +564,17 @@ class SampleChopperApp(QMainWindow):
         file_paths, _ = QFileDialog.getOpenFileNames(self, "Select Audio Files", "", "Audio Files (*.wav *.mp3)")
         
         if file_paths:
-            # Use the SampleListManager to handle loading samples
-            sample_items = self.sample_manager.load_samples(file_paths)
+            # Copy into the temp folder, measuring loudness on the way when LUFS normalization will need it
+            sample_items, errors = import_samples(self.sample_manager, file_paths,
+                                                  analyze=self.utility_processor.normalize_mode == "lufs")
+            for item, stage, message in errors:
+                self.show_error_message(f"Error loading {item['name']} ({stage}): {message}")
             
             # Add the loaded samples to the sample_tree in the UI
             for sample_name, tag in sample_items:
                 item = QTreeWidgetItem([sample_name, tag])
                 self.sample_tree.addTopLevelItem(item)
+            self.schedule_thumbnails()
 
             # Show a success message after loading samples
             success_msg = QLabel("Samples loaded successfully.")
@@ -509,6 +633,7 @@ class SampleChopperApp(QMainWindow):
                 # Append the original extension back after renaming
                 full_new_name = new_name + extension
                 self.sample_manager.rename_sample(sample_name, full_new_name)  # Rename the sample in the manager
+                self.thumbnails.forget(sample_name)
                 item.setText(0, full_new_name)  # Update the name in the UI
 
         elif column == 1:  # Editing the tag
@@ -554,12 +679,16 @@ class SampleChopperApp(QMainWindow):
 
         # Clear the sample tree UI
         self.sample_tree.clear()
+        self.thumbnail_timer.stop()
+        self.thumbnails.forget()
+        self.preview_chain.clear()
 
         # Clear the sample manager's list and temp folder
         self.sample_manager.clear_list()
 
         # Reset any UI elements or references
         self.markers = []  # Reset markers
+        self.region_ends = {}
         self.current_xlim = None  # Reset zoom level
 
 
@@ -572,15 +701,21 @@ class SampleChopperApp(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, "Open Audio File", "", "Audio Files (*.wav *.mp3 *.aiff)")
         
         if file_path:
+            self.init_waveform_canvas()
+
             # Initialize the chopper with the selected audio file
-            self.chopper = SampleChopper(file_path)
-            self.audio_data = self.chopper.audio_data
+            try:
+                chopper = SampleChopper(file_path)
+            except MemoryBudgetError as e:
+                self.show_error_message(f"Not enough memory to load {os.path.basename(file_path)}: {e}")
+                return
+            self.chopper = chopper
             self.sample_rate = self.chopper.sample_rate
+            self.session_source = None
 
             # Clear and plot the waveform
             self.ax.clear()
-            time_axis = np.linspace(0, self.chopper.full_duration, num=len(self.audio_data))
-            self.ax.plot(time_axis, self.audio_data, color='b')
+            self.draw_view((0, self.chopper.full_duration))
 
             # Set scrollbar range and reset its value to 0
             self.scrollbar.setRange(0, 100)
@@ -597,6 +732,110 @@ class SampleChopperApp(QMainWindow):
             self.layout.addWidget(success_msg)  # Add the success message to the layout
             QTimer.singleShot(3000, lambda: self.layout.removeWidget(success_msg))  # Remove after 3 seconds
 
+    def session_settings(self):
+        """Collects the slider, toggle and text settings stored in a session."""
+        return {
+            "min_duration": self.min_duration_slider.value(),
+            "max_duration": self.max_duration_slider.value(),
+            "threshold": self.threshold_slider.value(),
+            "onset_method": self.onset_method_combo.currentText(),
+            "crop_silences": self.crop_silences_checkbox.isChecked(),
+            "silence_threshold": self.silence_threshold_slider.value(),
+            "fade_in": self.fade_in_slider.value(),
+            "fade_out": self.fade_out_slider.value(),
+            "sample_rate": self.sample_rate_input.text(),
+            "resample_quality": self.resample_quality_combo.currentText(),
+            "normalize": self.normalize_checkbox.isChecked(),
+            "normalize_mode": self.normalize_mode_combo.currentText(),
+            "target_db": self.target_db_slider.value(),
+            "folders_by_tags": self.different_folders_by_tags_checkbox.isChecked(),
+            "hardlink_unchanged": self.hardlink_unchanged_checkbox.isChecked(),
+            "pack_name": self.pack_name_entry.text(),
+            "signature": self.signature_entry.text(),
+        }
+
+    def apply_session_settings(self, settings):
+        """Restores session settings, the widgets' change handlers update the processors."""
+        sliders = {"min_duration": self.min_duration_slider, "max_duration": self.max_duration_slider,
+                   "threshold": self.threshold_slider, "silence_threshold": self.silence_threshold_slider,
+                   "fade_in": self.fade_in_slider, "fade_out": self.fade_out_slider,
+                   "target_db": self.target_db_slider}
+        checkboxes = {"crop_silences": self.crop_silences_checkbox, "normalize": self.normalize_checkbox,
+                      "folders_by_tags": self.different_folders_by_tags_checkbox,
+                      "hardlink_unchanged": self.hardlink_unchanged_checkbox}
+        for key, slider in sliders.items():
+            if key in settings:
+                slider.setValue(settings[key])
+        for key, checkbox in checkboxes.items():
+            if key in settings:
+                checkbox.setChecked(settings[key])
+        if "onset_method" in settings:
+            self.onset_method_combo.setCurrentText(settings["onset_method"])
+        if "resample_quality" in settings:
+            self.resample_quality_combo.setCurrentText(settings["resample_quality"])
+        if "normalize_mode" in settings:
+            self.normalize_mode_combo.setCurrentText(settings["normalize_mode"])
+        if "sample_rate" in settings:
+            self.sample_rate_input.setText(settings["sample_rate"])
+            self.update_sample_rate()
+        self.pack_name_entry.setText(settings.get("pack_name", ""))
+        self.signature_entry.setText(settings.get("signature", ""))
+
+    def save_session(self):
+        """Saves markers, cached analysis, the sample list and settings to a session folder."""
+        session_dir, _ = QFileDialog.getSaveFileName(self, "Save Session", f"untitled{SESSION_EXTENSION}",
+                                                     f"Sessions (*{SESSION_EXTENSION})")
+        if not session_dir:
+            return
+        if not session_dir.endswith(SESSION_EXTENSION):
+            session_dir += SESSION_EXTENSION
+
+        chopper = getattr(self, 'chopper', None)
+        try:
+            self.session_source = save_session(session_dir, chopper, self.markers, self.region_ends,
+                                               self.sample_manager, self.session_settings(), self.session_source)
+        except (OSError, ValueError) as e:
+            self.show_error_message(f"Could not save the session: {e}")
+            return
+        self.show_success_message("Session saved.")
+
+    def open_session(self):
+        """Reopens a session: waveform from the stored peaks, markers, sample list and settings, no decoding."""
+        session_dir = QFileDialog.getExistingDirectory(self, "Open Session")
+        if not session_dir:
+            return
+        try:
+            session = load_session(session_dir)
+        except (OSError, ValueError, KeyError) as e:
+            self.show_error_message(f"Could not open session: {e}")
+            return
+
+        self.clear_list()
+        for sample_name, tag in restore_samples(session, self.sample_manager):
+            self.sample_tree.addTopLevelItem(QTreeWidgetItem([sample_name, tag]))
+        self.schedule_thumbnails()
+        self.apply_session_settings(session["settings"])
+
+        chopper = restore_chopper(session)
+        if chopper is None:
+            if session["source"]:
+                self.show_error_message(f"Source {session['source']['path']} is missing or changed, markers not restored.")
+            return
+
+        self.init_waveform_canvas()
+        self.chopper = chopper
+        self.sample_rate = chopper.sample_rate
+        self.session_source = session["source"]
+        self.markers = session["markers"]
+        self.region_ends = session["region_ends"]
+        self.current_xlim = None
+        self.update_waveform()
+        self.ax.set_xlim(0, chopper.full_duration)
+        self.canvas.draw()
+        self.current_xlim = self.ax.get_xlim()
+        self.update_marker_count()
+        self.show_success_message("Session opened.")
+
     def update_min_duration(self):
         """Update the minimum duration based on slider value."""
         self.min_duration = self.min_duration_slider.value() / 10.0
@@ -614,7 +853,7 @@ class SampleChopperApp(QMainWindow):
 
     def detect_onsets(self):
         """Detect onsets and add markers based on updated slider values."""
-        if not hasattr(self, 'chopper') or self.audio_data is None:
+        if not hasattr(self, 'chopper') or not self.chopper.full_duration:
             self.show_error_message("No audio loaded for chopping.")
             return
 
@@ -624,6 +863,7 @@ class SampleChopperApp(QMainWindow):
         threshold = self.threshold_slider.value() / 100.0
 
         # Call the chopper's detect_onsets method with the updated values
+        self.chopper.onset_method = ONSET_METHODS[self.onset_method_combo.currentText()]
         onsets = self.chopper.detect_onsets(min_duration, max_duration, threshold)
         
         if not onsets:
@@ -632,6 +872,7 @@ class SampleChopperApp(QMainWindow):
 
         # Update the markers and the waveform
         self.markers = onsets
+        self.region_ends = {}
         self.update_waveform()
         self.update_marker_count()
 
@@ -643,10 +884,30 @@ class SampleChopperApp(QMainWindow):
             self.playhead_line = self.ax.axvline(x=self.playhead_time, color='blue', linestyle='-', linewidth=2)
             self.canvas.draw()
 
+    def split_on_silence(self):
+        """Place markers at every audible region of the loaded audio, split where it falls below the silence threshold."""
+        if not hasattr(self, 'chopper') or not self.chopper.full_duration:
+            self.show_error_message("No audio loaded for chopping.")
+            return
+
+        # Regions shorter than the minimum duration slider are dropped
+        min_length = self.min_duration_slider.value() / 10.0
+        markers, ends = self.chopper.segment_on_silence(self.silence_threshold_slider.value(), min_length=min_length)
+
+        if not markers:
+            self.show_error_message("No audible regions found.")
+            return
+
+        self.markers = markers
+        self.region_ends = dict(zip(markers, ends))
+        self.update_waveform()
+        self.update_marker_count()
+        self.show_success_message(f"Found {len(markers)} audible regions.")
+
     def chop_audio(self):
-        """Chop the audio based on the markers and save to the temp folder using pydub."""
+        """Chop the audio based on the markers into the sample list, kept in memory until export."""
         # Check if audio is loaded
-        if not hasattr(self, 'chopper') or self.audio_data is None:
+        if not hasattr(self, 'chopper') or not self.chopper.full_duration:
             error_msg = QLabel("No audio loaded for chopping.")
             error_msg.setStyleSheet("color: red; font-weight: bold;")
             self.layout.addWidget(error_msg)
@@ -664,12 +925,19 @@ class SampleChopperApp(QMainWindow):
         # Sort the markers to ensure correct order of chopping
         self.markers.sort()
 
-        # Use the chopper's chop_samples method to save the chunks to the temp folder
-        chopped_files = self.chopper.chop_samples(self.markers, self.temp_folder)
+        # Markers from split on silence end at their region, manual markers run to the next marker
+        ends = [self.region_ends.get(marker) for marker in self.markers]
+
+        # Chop by reference into the source, nothing is copied or written until the samples are exported.
+        # Sources libsndfile can't read are cut into buffers instead.
+        if self.chopper.seekable:
+            sample_items = self.sample_manager.add_virtual_chops(self.chopper.file_path,
+                                                                 self.chopper.chop_frames(self.markers, ends))
+        else:
+            sample_items = self.sample_manager.add_sample_buffers(self.chopper.chop_buffers(self.markers, ends))
 
         # Load the chopped samples into the list for renaming and tagging
-        chopped_samples = [os.path.basename(f) for f in chopped_files]
-        self.load_chopped_samples_to_list(chopped_samples)
+        self.load_chopped_samples_to_list(sample_items)
 
         # Show success message after chopping is done
         success_msg = QLabel("Audio successfully chopped and loaded into the list.")
@@ -689,16 +957,52 @@ class SampleChopperApp(QMainWindow):
         # Redraw the canvas
         self.canvas.draw()
 
-    def load_chopped_samples_to_list(self, chopped_samples):
-        """Loads chopped samples into the sample list without copying."""
-        # Add the chopped samples to the sample_tree in the UI
-        for sample_name in chopped_samples:
-            item = QTreeWidgetItem([sample_name, ""])  # Adding an empty tag for now
+    def load_chopped_samples_to_list(self, sample_items):
+        """Adds the chopped samples, already in the sample manager, to the sample tree."""
+        for sample_name, tag in sample_items:
+            item = QTreeWidgetItem([sample_name, tag])
             self.sample_tree.addTopLevelItem(item)
-
-        # Add the file paths directly to the sample manager (no need to copy)
-        chopped_sample_paths = [os.path.join(self.temp_folder, sample) for sample in chopped_samples]
-        self.sample_manager.add_sample_paths(chopped_sample_paths)
+        self.schedule_thumbnails()
+
+    def visible_sample_items(self):
+        """Tree items in the visible part of the sample list, top to bottom."""
+        height = self.sample_tree.viewport().height()
+        items = []
+        item = self.sample_tree.itemAt(0, 0)
+        while item is not None and self.sample_tree.visualItemRect(item).top() < height:
+            items.append(item)
+            item = self.sample_tree.itemBelow(item)
+        return items
+
+    def schedule_thumbnails(self, *_):
+        """Requests the thumbnails of the rows now in view, called on scroll and when rows are added."""
+        self.poll_thumbnails()
+        self.thumbnail_timer.start()
+
+    def poll_thumbnails(self):
+        """Shows the visible thumbnails that are ready, requests the missing ones and drops the rest.
+
+        Only reads what the workers already made, so scrolling never waits for a thumbnail.
+        """
+        waiting = []
+        for item in self.visible_sample_items():
+            if item.data(2, Qt.UserRole):
+                continue  # Already shown, or the sample couldn't be read
+            sample_name = item.text(0)
+            if self.sample_manager.sample_handle(sample_name) is None:
+                continue
+            if not self.thumbnails.request(sample_name,
+                                           lambda name=sample_name: self.sample_manager.get_content_hash(name),
+                                           lambda name=sample_name: self.sample_manager.read_sample(name)):
+                waiting.append(sample_name)
+                continue
+            summary = self.thumbnails.get(sample_name)
+            if summary is not None:
+                item.setIcon(2, QIcon(thumbnail_pixmap(summary, THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT)))
+            item.setData(2, Qt.UserRole, True)
+        self.thumbnails.prune(waiting)
+        if not waiting:
+            self.thumbnail_timer.stop()
 
     def on_click(self, event):
         """Handles marker placement, removal, and playback on command-click."""
@@ -751,7 +1055,7 @@ class SampleChopperApp(QMainWindow):
 
     def play_from_click(self, time_position):
         """Plays the audio starting from the clicked position for 5 seconds."""
-        if not hasattr(self, 'chopper') or self.audio_data.size == 0:
+        if not hasattr(self, 'chopper') or not self.chopper.full_duration:
             self.show_error_message("No audio loaded for chopping")
             return
 
@@ -762,14 +1066,11 @@ class SampleChopperApp(QMainWindow):
         play_duration = min(5, self.chopper.full_duration - time_position)
         end_sample = start_sample + int(play_duration * self.sample_rate)
         
-        # Slice the audio data for the specified duration
-        sliced_audio = self.audio_data[start_sample:end_sample]
+        # Slice the audio data for the specified duration, a restored session decodes here on first play
+        sliced_audio = self.chopper.audio_data[start_sample:end_sample]
         
-        # Play the sliced audio
-        temp_audio_path = os.path.join(self.temp_folder, 'temp_playback.wav')
-        sf.write(temp_audio_path, sliced_audio, self.sample_rate)
-        wave_obj = sa.WaveObject.from_wave_file(temp_audio_path)
-        play_obj = wave_obj.play()
+        # Play the sliced audio straight from memory
+        play_obj = play(sliced_audio, self.sample_rate)
 
         # Set playhead properties
         self.playhead_time = time_position
@@ -838,6 +1139,50 @@ class SampleChopperApp(QMainWindow):
         """Update the label that shows the number of markers placed."""
         self.marker_count_label.setText(f"Markers Placed: {len(self.markers)}")
 
+    def waveform_points(self, max_points=400000):
+        """Returns (times, values) to plot, the min/max peak envelope for long or not yet decoded sources."""
+        if not self.chopper.decoded or self.chopper.full_duration * self.sample_rate > max_points:
+            # Each bucket contributes its minimum and maximum, so peaks stay visible
+            return self.chopper.peaks.envelope(max_points=max_points)
+        audio = self.chopper.audio_data
+        return np.arange(len(audio), dtype=np.float32) / np.float32(self.sample_rate), audio
+
+    def draw_view(self, xlim):
+        """Draws the waveform, or in spectrogram mode the STFT tiles of the visible range."""
+        if self.view_mode_combo.currentText() == "Spectrogram":
+            self.draw_spectrogram(xlim)
+        elif hasattr(self.ax, 'plot_peaks'):
+            # The QPainter widget reduces the peaks per pixel column itself on every repaint
+            self.ax.plot_peaks(self.chopper.peaks, self.chopper.audio_data if self.chopper.decoded else None)
+        else:
+            self.ax.plot(*self.waveform_points(), color='b')
+
+    def draw_spectrogram(self, xlim):
+        """Shows the cached tiles of xlim and schedules the missing ones, which appear as they finish."""
+        spectrogram = self.chopper.spectrogram
+        self.spectrogram_pending = spectrogram.request_view(*xlim)
+        if self.spectrogram_pending:
+            self.spectrogram_timer.start()
+        db, extent = spectrogram.view(*xlim)
+        top = float(db.max())
+        self.ax.imshow(db, origin='lower', aspect='auto', extent=extent, cmap='magma', vmin=top - 80, vmax=top)
+
+    def poll_spectrogram_tiles(self):
+        """Redraws once more tiles are ready, and stops polling when none are left."""
+        pending = self.chopper.spectrogram.cache.pending()
+        if pending != self.spectrogram_pending:
+            self.spectrogram_pending = pending
+            self.update_waveform()
+        if not pending:
+            self.spectrogram_timer.stop()
+
+    def refresh_view(self):
+        """Redraws after a zoom or scroll; the spectrogram needs the tiles of the new range."""
+        if self.view_mode_combo.currentText() == "Spectrogram":
+            self.update_waveform()
+        else:
+            self.canvas.draw()
+
     def update_waveform(self):
         """Update the waveform while preserving the current zoom and pan states."""
         if self.current_xlim:
@@ -848,8 +1193,7 @@ class SampleChopperApp(QMainWindow):
         self.ax.clear()
 
         # Redraw the waveform
-        time_axis = np.linspace(0, self.chopper.full_duration, num=len(self.audio_data))
-        self.ax.plot(time_axis, self.audio_data, color='b')
+        self.draw_view(cur_xlim or (0, self.chopper.full_duration))
 
         # Redraw the markers
         for marker in self.markers:
@@ -864,7 +1208,7 @@ class SampleChopperApp(QMainWindow):
 
     def zoom_in(self):
         """Zoom in on the waveform."""
-        if not hasattr(self, 'chopper') or self.audio_data.size == 0:
+        if not hasattr(self, 'chopper') or not self.chopper.full_duration:
             self.show_error_message("No audio loaded for chopping")
             return
         
@@ -873,7 +1217,7 @@ class SampleChopperApp(QMainWindow):
 
     def zoom_out(self):
         """Zoom out of the waveform."""
-        if not hasattr(self, 'chopper') or self.audio_data.size == 0:
+        if not hasattr(self, 'chopper') or not self.chopper.full_duration:
             self.show_error_message("No audio loaded for chopping")
             return
         
@@ -882,13 +1226,13 @@ class SampleChopperApp(QMainWindow):
 
     def reset_view(self):
         """Reset the zoom level and pan to show the entire waveform."""
-        if not hasattr(self, 'chopper') or self.audio_data.size == 0:
+        if not hasattr(self, 'chopper') or not self.chopper.full_duration:
             self.show_error_message("No audio loaded for chopping")
             return
 
         self.zoom_level = 1.0
         self.ax.set_xlim(0, self.chopper.full_duration)
-        self.canvas.draw()
+        self.refresh_view()
 
     def update_view_limits(self):
         visible_duration = self.chopper.full_duration * self.zoom_level
@@ -899,7 +1243,7 @@ class SampleChopperApp(QMainWindow):
         new_xlim[1] = min(new_xlim[1], self.chopper.full_duration)
 
         self.ax.set_xlim(new_xlim)
-        self.canvas.draw()
+        self.refresh_view()
 
     def scroll_waveform(self, value):
         """Scroll the waveform left and right based on scrollbar movement."""
@@ -912,7 +1256,7 @@ class SampleChopperApp(QMainWindow):
         start_time = scroll_ratio * (self.chopper.full_duration - visible_duration)
 
         self.ax.set_xlim(start_time, start_time + visible_duration)
-        self.canvas.draw()
+        self.refresh_view()
 
     def show_error_message(self, message):
         """Displays an error message in the app."""
@@ -929,69 +1273,110 @@ class SampleChopperApp(QMainWindow):
         QTimer.singleShot(3000, lambda: self.layout.removeWidget(success_msg))  # Remove the message after 3 seconds
 
     def cleanup_temp_folder(self):
-        """Delete the temporary folder and its contents."""
+        """Delete the temporary folder and its contents, and the sample store's spill files."""
         if os.path.exists(self.temp_folder):
             shutil.rmtree(self.temp_folder)
+        self.sample_manager.store.clear()
 
 
 
 #SILENCE
     def process_sample_with_silence_module(self, file_path, output_path):
-        """Processes the sample using the silence and utility modules if enabled."""
-        # Create a temporary file path
-        temp_output_path = os.path.join(self.temp_folder, 'temp_processed.wav')
+        """Processes the sample using the silence and utility modules if enabled, in memory."""
+        audio, sample_rate, subtype = read_file(file_path)
 
         # If silence processing is enabled
         if self.crop_silences_enabled:
-            # Process with SilenceProcessor
-            self.silence_processor.process_sample(file_path, temp_output_path)
-        else:
-            # Copy the original file to temp path
-            shutil.copy(file_path, temp_output_path)
-
-        # Process with UtilityProcessor
-        self.utility_processor.process_sample(temp_output_path, output_path)
+            audio = self.silence_processor.process_buffer(audio, sample_rate)
 
-        # Remove the temporary file
-        if os.path.exists(temp_output_path):
-            os.remove(temp_output_path)
+        # Normalize and resample with UtilityProcessor
+        if self.utility_processor.normalize_enabled:
+            audio, _ = self.utility_processor.normalize_buffer(audio, sample_rate)
+        audio = self.utility_processor.resample_buffer(audio, sample_rate)
+        encode(output_path, audio, self.utility_processor.target_sample_rate, subtype=output_subtype(output_path, subtype))
 
     def toggle_crop_silences(self, state):
         """Enables or disables the silence module."""
         self.crop_silences_enabled = state == Qt.Checked
+        self.preview_processing()
 
     def update_silence_threshold(self, value):
         """Updates the silence threshold in the silence processor."""
         self.silence_threshold_label.setText(f"Silence Threshold (dB): {value}")
         self.silence_processor.silence_threshold = value
+        self.preview_processing()
 
     def update_fade_in(self, value):
         """Updates the fade-in duration in the silence processor."""
         fade_in_seconds = value / 10.0  # Convert slider value to seconds
         self.fade_in_label.setText(f"Fade In (s): {fade_in_seconds:.1f}")
         self.silence_processor.fade_in_duration = fade_in_seconds
+        self.preview_processing()
 
     def update_fade_out(self, value):
         """Updates the fade-out duration in the silence processor."""
         fade_out_seconds = value / 10.0  # Convert slider value to seconds
         self.fade_out_label.setText(f"Fade Out (s): {fade_out_seconds:.1f}")
         self.silence_processor.fade_out_duration = fade_out_seconds
+        self.preview_processing()
 
+    def preview_processing(self, *_):
+        """Plays the selected sample through the crop, fade and normalize settings, rendered in memory.
+
+        The preview chain caches every stage, so a slider move only redoes the stages after it.
+        """
+        if not self.live_preview_checkbox.isChecked():
+            return
+        selected_item = self.sample_tree.currentItem()
+        if selected_item is None:
+            return
+        try:
+            audio, sample_rate = self.preview_chain.render(self.sample_manager, selected_item.text(0),
+                                                           crop=self.crop_silences_enabled)
+        except (KeyError, RuntimeError) as e:
+            self.show_error_message(f"Can't preview {selected_item.text(0)}: {e}")
+            return
+        self.stop_current_sample(self.current_play_obj)
+        self.current_play_obj = play(audio, sample_rate)
 
 
 #UTILITY
     def toggle_normalize_samples(self, state):
         """Enables or disables normalization in the utility processor."""
         self.utility_processor.normalize_enabled = state == Qt.Checked
+        self.preview_processing()
 
     def update_target_db(self, value):
         """Updates the target dB level for normalization."""
-        self.target_db_label.setText(f"Target dB for Normalization: {value}")
+        unit = "LUFS" if self.utility_processor.normalize_mode == "lufs" else "dB"
+        self.target_db_label.setText(f"Target {unit} for Normalization: {value}")
         self.utility_processor.target_db = value
+        self.utility_processor.target_lufs = value
+        self.preview_processing()
+
+    def update_normalize_mode(self, mode):
+        """Switches normalization between RMS level and integrated loudness."""
+        self.utility_processor.normalize_mode = "lufs" if mode == "LUFS" else "rms"
+        self.update_target_db(self.target_db_slider.value())
+
+    def analyze_loudness(self):
+        """Measures LUFS and true peak for every sample in the list and saves a QC report."""
+        if not self.sample_manager.get_sample_names():
+            self.show_error_message("No samples in list.")
+            return
+
+        report_path, _ = QFileDialog.getSaveFileName(self, "Save Loudness Report", "loudness_report.csv", "CSV Files (*.csv)")
+
+        analyzer = LoudnessAnalyzer()
+        results = analyzer.analyze_pack(self.sample_manager)
+        if report_path:
+            analyzer.write_report(results, report_path)
+        self.show_success_message("Loudness analysis complete.")
 
     def toggle_normalize_samples(self, state):
         """Enables or disables normalization in the utility processor."""
         self.utility_processor.normalize_enabled = state == Qt.Checked
+        self.preview_processing()
 
     def update_sample_rate(self):
         """Updates the target sample rate in the utility processor."""
@@ -1004,6 +1389,10 @@ class SampleChopperApp(QMainWindow):
         except ValueError:
             self.show_error_message("Invalid sample rate input.")
 
+    def update_resample_quality(self, quality):
+        """Updates the resampling quality preset in the utility processor."""
+        self.utility_processor.resample_quality = quality
+
 
 
 #SIGNATURE
@@ -1015,6 +1404,7 @@ class SampleChopperApp(QMainWindow):
         else:
             print("Sign Pack disabled")
 
+    @traced("export.pack")
     def save_samples_with_signature(self):
         """Save samples, applying various processing based on the toggles."""
         save_dir = QFileDialog.getExistingDirectory(self, "Select Directory to Save Samples")
@@ -1057,64 +1447,41 @@ class SampleChopperApp(QMainWindow):
             if signature:
                 signature_position = self.get_prefix_or_suffix_choice("signature to sample:")  # Ask once
 
-        # Set the default final_save_dir
-        final_save_dir = save_dir  # This ensures that the variable is always assigned
+        # Work out every final name up front, so two samples can never overwrite each other
+        tag_folders = {}
+        if self.different_folders_by_tags_checkbox.isChecked():
+            tag_folders = {name: self.sample_manager.tags.get(name, "") for name in sample_names}
+        planner = RenamePlanner(
+            pack_name=self.pack_name_entry.text() if self.name_individual_samples_checkbox.isChecked() else "",
+            pack_name_position=pack_name_position,
+            signature=signature or "",
+            signature_position=signature_position,
+        )
+        export_names = planner.plan(sample_names, folders=tag_folders)
+
+        if self.use_job_service_checkbox.isChecked():
+            self.submit_export_job(save_dir, sample_names, export_names, tag_folders)
+            return
 
-        # Process individual samples
+        # Every sample must still be available before anything is processed
         for sample_name in sample_names:
-            # Use the renamed sample if it has been renamed
-            final_sample_name = self.sample_manager.sample_new_names.get(sample_name, sample_name)
-            sample_path = os.path.join(self.temp_folder, final_sample_name)
-
-            if not os.path.exists(sample_path):
-                self.show_error_message(f"Sample {final_sample_name} not found in temp folder.")
-                return
-
-            # Apply pack name as prefix/suffix if enabled
-            if self.name_individual_samples_checkbox.isChecked():
-                final_sample_name = self.apply_name(final_sample_name, self.pack_name_entry.text().replace(" ", "_"), pack_name_position)
-
-            # Apply signature to samples as prefix/suffix if enabled
-            if self.sign_samples_checkbox.isChecked() and signature:
-                final_sample_name = self.signature_processor.add_signature(final_sample_name, signature, signature_position)
-
-            # Process silence cropping if enabled
-            if self.crop_silences_checkbox.isChecked():
-                sample_path = self.silence_processor.process_sample(sample_path, self.temp_folder)
-
-                if not sample_path:  # Ensure sample_path is valid after processing
-                    self.show_error_message(f"Error processing {final_sample_name}: Invalid file after silence cropping.")
-                    return
-
-            # Normalize samples if enabled
-            if self.normalize_checkbox.isChecked():
-                if os.path.exists(sample_path):  # Ensure sample_path is valid before normalization
-                    self.utility_processor.normalize_sample(sample_path, self.target_db_slider.value())
-                else:
-                    self.show_error_message(f"Error normalizing {final_sample_name}: Invalid file after silence cropping.")
-                    return
-
-            # Resample to the defined sample rate
-            if os.path.exists(sample_path):  # Ensure sample_path is valid before resampling
-                self.utility_processor.resample_sample(sample_path, int(self.sample_rate_input.text()))
-            else:
-                self.show_error_message(f"Error resampling {final_sample_name}: Invalid file.")
+            if self.sample_manager.sample_handle(sample_name) is None:
+                self.show_error_message(f"Sample {sample_name} not found.")
                 return
 
-            # Handle tag-based folder creation
-            if self.different_folders_by_tags_checkbox.isChecked():
-                tag = self.sample_manager.tags.get(sample_name, "")
-                if tag:
-                    final_save_dir = os.path.join(save_dir, tag)
-                    os.makedirs(final_save_dir, exist_ok=True)
-
-            # Save the final processed sample
-            final_sample_path = os.path.join(final_save_dir, final_sample_name)
-            if sample_path:  # Ensure sample_path is valid before copying
-                shutil.copyfile(sample_path, final_sample_path)
-                print(f"Saved {final_sample_name} to {final_sample_path}")
-            else:
-                self.show_error_message(f"Failed to save {final_sample_name}: Invalid file path.")
+        # Crop, normalize and resample in worker processes, writing to the export folders as samples finish
+        self.utility_processor.target_db = self.target_db_slider.value()
+        self.utility_processor.target_lufs = self.target_db_slider.value()
+        self.utility_processor.target_sample_rate = int(self.sample_rate_input.text())
+        exported, errors = export_samples(self.sample_manager, self.silence_processor, self.utility_processor,
+                                          save_dir, export_names, tag_folders,
+                                          crop=self.crop_silences_checkbox.isChecked(),
+                                          allow_hardlinks=self.hardlink_unchanged_checkbox.isChecked())
+        for item, stage, message in errors:
+            self.show_error_message(f"Error processing {export_names[item['name']]} ({stage}): {message}")
+        if errors:
+            return
+        print(f"Saved {len(exported)} samples to {save_dir}")
 
         # Display success message in the app
         success_msg = QLabel("Samples saved successfully!")
@@ -1124,6 +1491,65 @@ class SampleChopperApp(QMainWindow):
         # Remove the success message after 3 seconds using proper widget handling
         QTimer.singleShot(3000, lambda: success_msg.deleteLater())
 
+    def submit_export_job(self, save_dir, sample_names, export_names, tag_folders):
+        """Hands the export to the job service: one job per tag folder, processing the samples under their planned names."""
+        client = JobClient()
+        if not client.available():
+            self.show_error_message(f"No job service at {client.url}. Start it with Service_Sample_Editor_appv2.py serve.")
+            return
+
+        # Stage the samples under their final names in a folder of the service, which removes it after the job.
+        # The service works on files and may outlive the temp folder
+        groups = {}
+        for sample_name in sample_names:
+            groups.setdefault(tag_folders.get(sample_name, ""), []).append(sample_name)
+
+        job_ids = []
+        for tag, group in groups.items():
+            try:
+                staging_dir = client.create_staging()
+            except (OSError, RuntimeError) as e:
+                self.show_error_message(f"Job submission failed: {e}")
+                return
+            sources = []
+            for sample_name in group:
+                staged_path = os.path.join(staging_dir, export_names[sample_name])
+                self.sample_manager.write_sample(sample_name, staged_path)
+                sources.append(staged_path)
+
+            spec = {
+                "sources": sources,
+                "output_dir": os.path.join(save_dir, tag),
+                "chop": {"enabled": False},
+                "crop": {
+                    "enabled": self.crop_silences_checkbox.isChecked(),
+                    "silence_threshold": self.silence_processor.silence_threshold,
+                    "fade_in": self.silence_processor.fade_in_duration,
+                    "fade_out": self.silence_processor.fade_out_duration,
+                    "trim_mode": self.silence_processor.trim_mode,
+                    "silence_reference": self.silence_processor.silence_reference,
+                },
+                "normalize": {
+                    "enabled": self.normalize_checkbox.isChecked(),
+                    "mode": self.utility_processor.normalize_mode,
+                    "target_db": self.target_db_slider.value(),
+                    "target_lufs": self.target_db_slider.value(),
+                    "true_peak_ceiling": self.utility_processor.true_peak_ceiling,
+                },
+                "resample": {
+                    "sample_rate": int(self.sample_rate_input.text()),
+                    "quality": self.utility_processor.resample_quality,
+                },
+            }
+            try:
+                job_ids.append(client.submit(spec, name=os.path.basename(save_dir), staged=staging_dir))
+            except (OSError, RuntimeError) as e:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                self.show_error_message(f"Job submission failed: {e}")
+                return
+
+        self.show_success_message(f"Queued export job(s) {', '.join(job_ids)}. Follow them with Service_Sample_Editor_appv2.py watch <id>.")
+
     def get_prefix_or_suffix_choice(self, name_type):
         """Ask the user if they want to apply the name/signature as a prefix or suffix."""
         choice, ok = QInputDialog.getItem(self, f"Choose {name_type} Position", f"Apply {name_type} as:", ["Prefix", "Suffix"], 0, False)
@@ -1131,13 +1557,6 @@ class SampleChopperApp(QMainWindow):
             return choice.lower()
         return "prefix"  # Default to prefix if canceled
 
-    def apply_name(self, sample_name, name_to_apply, position):
-        """Apply a given name (pack name or signature) to the sample name as a prefix or suffix."""
-        base_name, ext = os.path.splitext(sample_name)
-        if position == "prefix":
-            return f"{name_to_apply}_{base_name}{ext}"
-        return f"{base_name}_{name_to_apply}{ext}"
-
 
 
 if __name__ == "__main__":
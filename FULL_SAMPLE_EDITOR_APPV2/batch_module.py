@@ -0,0 +1,400 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chopper_module import SampleChopper
+from list_module import SampleListManager
+from utility_module import UtilityProcessor
+from silence_module import SilenceProcessor
+from rename_module import RenamePlanner
+from loudness_module import LoudnessAnalyzer
+import trace_module
+from trace_module import span
+
+# Stages reported in the summary, in pipeline order
+STAGES = ["decode", "onsets", "chop", "crop", "loudness", "normalize", "resample", "sign", "export"]
+
+DEFAULT_JOB = {
+    "sources": [],
+    "output_dir": "batch_output",
+    "work_dir": "batch_temp",
+    "workers": os.cpu_count() or 1,
+    "trace": None,  # Path of a Chrome trace JSON with the spans of every worker, None to not trace
+    "chop": {
+        "enabled": True,
+        "mode": "onsets",  # onsets or silence
+        "min_duration": 0.3,
+        "max_duration": 0.5,
+        "threshold": 0.1,
+        "onset_method": "librosa",  # librosa, flux or flux_whitened, see SampleChopper.onset_strength
+        "markers": None,  # Explicit marker times in seconds, skips onset detection
+        "silence_threshold": -40.0,  # Split-on-silence settings
+        "min_silence": 0.1,
+        "min_length": 0.05,
+        "padding": 0.01,
+    },
+    "crop": {
+        "enabled": False,
+        "silence_threshold": -40.0,
+        "fade_in": 0.0,
+        "fade_out": 0.0,
+        "trim_mode": "edge",  # edge or split
+        "silence_reference": "max",  # max (relative to the loudest frame) or absolute (dBFS)
+    },
+    "normalize": {
+        "enabled": False,
+        "mode": "rms",  # rms (target_db) or lufs (target_lufs)
+        "target_db": -3,
+        "target_lufs": -14.0,
+        "true_peak_ceiling": None,  # dBTP, limits the gain so normalized samples can't clip
+    },
+    "resample": {
+        "sample_rate": 44100,
+        "quality": "hq",  # fast, hq or vhq
+    },
+    "naming": {
+        "create_pack_folder": False,
+        "pack_name": "",
+        "name_individual_samples": False,
+        "pack_name_position": "prefix",
+        "signature": "",
+        "sign_pack": False,
+        "sign_samples": False,
+        "signature_position": "prefix",
+        "template": "{name}",  # RenamePlanner template, e.g. "{pack}_{n:03d}"
+    },
+}
+
+
+def load_job_spec(spec_path):
+    """Loads a JSON or YAML job spec and fills in defaults for any missing settings."""
+    with open(spec_path, 'r') as f:
+        if spec_path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("PyYAML is required to read YAML job specs, use a .json spec instead.")
+            spec = yaml.safe_load(f) or {}
+        else:
+            spec = json.load(f)
+
+    # Relative paths in the spec are relative to the spec file, not the working directory
+    return resolve_job(spec, os.path.dirname(os.path.abspath(spec_path)))
+
+
+def resolve_job(spec, base_dir):
+    """Fills in defaults for any missing settings of a job spec dict and resolves its paths against base_dir."""
+    job = {}
+    for key, default in DEFAULT_JOB.items():
+        value = spec.get(key, default)
+        if isinstance(default, dict):
+            # Merge nested sections so a spec only needs the keys it changes
+            merged = dict(default)
+            merged.update(value or {})
+            value = merged
+        job[key] = value
+
+    job["output_dir"] = os.path.join(base_dir, job["output_dir"])
+    job["work_dir"] = os.path.join(base_dir, job["work_dir"])
+    if job["trace"]:
+        job["trace"] = os.path.join(base_dir, job["trace"])
+    job["sources"] = expand_sources(job["sources"], base_dir)
+    return job
+
+
+def expand_sources(sources, base_dir):
+    """Expands glob patterns and directories in the source list into sorted audio file paths."""
+    if isinstance(sources, str):
+        sources = [sources]
+
+    file_paths = []
+    for source in sources:
+        pattern = os.path.join(base_dir, source)
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*")
+        for path in sorted(glob.glob(pattern)):
+            if os.path.isfile(path) and path not in file_paths:
+                file_paths.append(path)
+    return file_paths
+
+
+def prepare_output_dir(job):
+    """Creates the export folder once, applying the pack folder name and signature like the app does."""
+    save_dir = job["output_dir"]
+    naming = job["naming"]
+
+    if naming["create_pack_folder"]:
+        pack_name = naming["pack_name"].replace(" ", "_")
+        if not pack_name:
+            raise ValueError("create_pack_folder is set but no pack_name was provided.")
+        save_dir = os.path.join(save_dir, pack_name)
+
+        signature = naming["signature"].replace(" ", "_")
+        if naming["sign_pack"] and signature:
+            as_prefix = naming["signature_position"] == "prefix"
+            folder_name = os.path.basename(save_dir)
+            folder_name = f"{signature}_{folder_name}" if as_prefix else f"{folder_name}_{signature}"
+            save_dir = os.path.join(os.path.dirname(save_dir), folder_name)
+
+    os.makedirs(save_dir, exist_ok=True)
+    return save_dir
+
+
+def make_planner(naming):
+    """Builds the RenamePlanner for the pack name and signature settings."""
+    return RenamePlanner(
+        template=naming["template"],
+        pack_name=naming["pack_name"] if naming["name_individual_samples"] else "",
+        pack_name_position=naming["pack_name_position"],
+        signature=naming["signature"] if naming["sign_samples"] else "",
+        signature_position=naming["signature_position"],
+    )
+
+
+class StageTimer:
+    def __init__(self):
+        """Accumulates wall time per pipeline stage."""
+        self.timings = {stage: 0.0 for stage in STAGES}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Times the enclosed block and adds it to the given stage."""
+        start = time.perf_counter()
+        try:
+            with span(f"batch.{name}"):
+                yield
+        finally:
+            self.timings[name] += time.perf_counter() - start
+
+
+def process_source(source_path, job, index):
+    """Runs chop, crop, normalize and resample for one source file, leaving the results in the work folder.
+
+    Naming and export happen afterwards in run_job, once every sample of the pack is known.
+    """
+    timer = StageTimer()
+    result = {
+        "source": source_path,
+        "status": "ok",
+        "samples": 0,
+        "processed": [],  # (sample name, processed file) pairs, in list order
+        "outputs": [],
+        "timings": timer.timings,
+        "error": None,
+    }
+
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    temp_folder = os.path.join(job["work_dir"], f"{index}_{stem}")
+
+    # Workers trace into their own tracer and hand the events back with the result
+    if job["trace"]:
+        trace_module.enable()
+
+    # Processor modules report progress with print, keep stdout free for the summary
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            sample_manager = SampleListManager(temp_folder)
+            silence_processor = SilenceProcessor(
+                silence_threshold=job["crop"]["silence_threshold"],
+                fade_in_duration=job["crop"]["fade_in"],
+                fade_out_duration=job["crop"]["fade_out"],
+            )
+            silence_processor.trim_mode = job["crop"]["trim_mode"]
+            silence_processor.silence_reference = job["crop"]["silence_reference"]
+            utility_processor = UtilityProcessor()
+            utility_processor.target_sample_rate = int(job["resample"]["sample_rate"])
+            utility_processor.resample_quality = job["resample"]["quality"]
+            utility_processor.normalize_enabled = job["normalize"]["enabled"]
+            utility_processor.target_db = job["normalize"]["target_db"]
+            utility_processor.true_peak_ceiling = job["normalize"]["true_peak_ceiling"]
+            utility_processor.normalize_mode = job["normalize"]["mode"]
+            utility_processor.target_lufs = job["normalize"]["target_lufs"]
+
+            chop = job["chop"]
+            if chop["enabled"]:
+                with timer.stage("decode"):
+                    chopper = SampleChopper(source_path, chop["min_duration"], chop["max_duration"], chop["threshold"])
+                    chopper.onset_method = chop["onset_method"]
+
+                ends = None
+                if chop["markers"] is not None:
+                    markers = sorted(float(marker) for marker in chop["markers"])
+                elif chop["mode"] == "silence":
+                    with timer.stage("onsets"):
+                        markers, ends = chopper.segment_on_silence(chop["silence_threshold"], chop["min_silence"],
+                                                                   chop["min_length"], chop["padding"])
+                else:
+                    with timer.stage("onsets"):
+                        markers = chopper.detect_onsets(chop["min_duration"], chop["max_duration"], chop["threshold"])
+                if not markers:
+                    markers, ends = [0.0], None  # Nothing detected, export the whole source as one sample
+
+                with timer.stage("chop"):
+                    chopped_files = chopper.chop_samples(markers, temp_folder, ends)
+                    sample_manager.add_sample_paths(chopped_files)
+
+                    # Prefix chops with the source name so sources don't collide in the export folder
+                    chop_names = [os.path.basename(chopped_file) for chopped_file in chopped_files]
+                    sample_manager.rename_samples({chop_name: f"{stem}_{chop_name}" for chop_name in chop_names})
+            else:
+                with timer.stage("decode"):
+                    sample_manager.load_samples([source_path])
+
+            sample_paths = {}
+            for sample_name in sample_manager.get_sample_names():
+                sample_path = sample_manager.file_paths[sample_name]
+
+                if job["crop"]["enabled"]:
+                    with timer.stage("crop"):
+                        sample_path = silence_processor.process_sample(sample_path, temp_folder)
+                    if not sample_path:
+                        raise RuntimeError(f"Silence cropping failed for {sample_name}")
+
+                sample_paths[sample_name] = sample_path
+
+            # Measure the loudness of every chop of this source in one batched pass
+            measurements = {}
+            if utility_processor.normalize_enabled and utility_processor.normalize_mode == "lufs":
+                with timer.stage("loudness"):
+                    measurements = LoudnessAnalyzer(workers=1).analyze_files(list(sample_paths.values()))
+
+            for sample_name, sample_path in sample_paths.items():
+                if utility_processor.normalize_enabled:
+                    with timer.stage("normalize"):
+                        if utility_processor.normalize_mode == "lufs":
+                            utility_processor.normalize_sample_lufs(sample_path, utility_processor.target_lufs,
+                                                                    measurements.get(sample_path))
+                        else:
+                            utility_processor.normalize_sample(sample_path, utility_processor.target_db)
+
+                with timer.stage("resample"):
+                    utility_processor.resample_sample(sample_path, utility_processor.target_sample_rate)
+
+                result["processed"].append((sample_name, sample_path))
+
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = f"{type(e).__name__}: {e}"
+
+    tracer = trace_module.disable()
+    result["trace_events"] = tracer.events if tracer else []
+    return result
+
+
+def export_results(results, job, save_dir):
+    """Names every processed sample of the pack in one plan, so no two can collide, and copies them out."""
+    processed = [(result, name, path) for result in results for name, path in result["processed"]]
+
+    # Chop names are only unique per source, so plan on per-sample keys
+    keys = [f"{i}/{name}" for i, (_, name, _) in enumerate(processed)]
+    start = time.perf_counter()
+    plan = make_planner(job["naming"]).plan(keys, names={key: name for key, (_, name, _) in zip(keys, processed)})
+    sign_time = (time.perf_counter() - start) / max(len(processed), 1)
+
+    for key, (result, _, path) in zip(keys, processed):
+        result["timings"]["sign"] += sign_time
+        export_start = time.perf_counter()
+        export_path = os.path.join(save_dir, plan[key])
+        with span("batch.export") as stage:
+            shutil.copyfile(path, export_path)
+            stage.wrote_file(export_path)
+        result["timings"]["export"] += time.perf_counter() - export_start
+        result["outputs"].append(export_path)
+
+    for result in results:
+        result["samples"] = len(result["outputs"])
+        del result["processed"]
+
+
+def run_job(job, progress=None):
+    """Processes every source in the job across a process pool and returns the run summary.
+
+    progress, if given, is called with a dict after every finished source and once the export is done.
+    """
+    start = time.perf_counter()
+    save_dir = prepare_output_dir(job)
+    # Every run works in its own folder under work_dir and removes only that, work_dir itself may be shared
+    os.makedirs(job["work_dir"], exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix="batch_", dir=job["work_dir"])
+    job = dict(job, work_dir=run_dir)
+
+    tracer = trace_module.enable() if job["trace"] else None
+
+    results = []
+    workers = max(1, int(job["workers"]))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_source, source, job, i) for i, source in enumerate(job["sources"])]
+        for future in as_completed(futures):
+            results.append(future.result())
+            if progress:
+                progress({"stage": "process", "done": len(results), "total": len(futures),
+                          "source": results[-1]["source"], "status": results[-1]["status"]})
+
+    # Keep the report in source order regardless of completion order
+    order = {source: i for i, source in enumerate(job["sources"])}
+    results.sort(key=lambda r: order[r["source"]])
+    for result in results:
+        events = result.pop("trace_events")
+        if tracer:
+            tracer.merge(events)
+
+    export_results(results, job, save_dir)
+    if progress:
+        progress({"stage": "export", "done": len(results), "total": len(results),
+                  "samples": sum(len(r["outputs"]) for r in results)})
+
+    totals = {stage: 0.0 for stage in STAGES}
+    for result in results:
+        for stage, seconds in result["timings"].items():
+            totals[stage] += seconds
+
+    shutil.rmtree(run_dir, ignore_errors=True)
+
+    if tracer:
+        trace_module.disable()
+        with contextlib.redirect_stdout(sys.stderr):
+            tracer.export_chrome_trace(job["trace"])
+            print(tracer.format_summary())
+
+    return {
+        "output_dir": save_dir,
+        "sources": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "ok"),
+        "failed": sum(1 for r in results if r["status"] != "ok"),
+        "samples": sum(r["samples"] for r in results),
+        "workers": workers,
+        "wall_time": time.perf_counter() - start,
+        "stage_totals": totals,
+        "trace": job["trace"],
+        "results": results,
+    }
+
+
+def main(argv=None):
+    """Command line entry point for headless batch processing."""
+    parser = argparse.ArgumentParser(description="Run the chop and export pipeline headless from a job spec.")
+    parser.add_argument("spec", help="Path to a JSON or YAML job spec")
+    parser.add_argument("--workers", type=int, help="Override the number of parallel workers")
+    parser.add_argument("--output", help="Write the JSON summary to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    job = load_job_spec(args.spec)
+    if args.workers:
+        job["workers"] = args.workers
+
+    summary = run_job(job)
+    report = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+
+    return 0 if summary["failed"] == 0 else 1
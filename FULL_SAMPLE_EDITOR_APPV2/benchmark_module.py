@@ -0,0 +1,457 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+from chopper_module import SampleChopper
+from spectrogram_module import get_stft_cache
+from list_module import SampleListManager
+from utility_module import UtilityProcessor
+from silence_module import SilenceProcessor
+from decoder_module import Decoder, FFmpegPool
+
+SAMPLE_RATE = 44100
+
+# Fixture sizes as a multiple of the small size, the scaling curve is fitted over these
+SIZES = {"small": 1, "medium": 4, "large": 16}
+
+# Small size of each fixture: seconds of drum loop, seconds of field recording, number of one-shots
+DRUM_LOOP_SECONDS = 8
+FIELD_RECORDING_SECONDS = 60
+ONE_SHOT_COUNT = 100
+
+# Seeked reads per run of the region decode benchmark, and the length of each in seconds
+REGION_READS = 200
+REGION_SECONDS = 0.25
+
+# A result this much slower (or this much more memory) than the baseline counts as a regression
+TOLERANCE = 0.25
+
+
+def synth_hit(kind, rng, sample_rate=SAMPLE_RATE):
+    """Returns one synthetic drum hit: a pitched-down sine kick, a noisy snare or a short hat."""
+    if kind == "kick":
+        t = np.arange(int(0.35 * sample_rate)) / sample_rate
+        phase = 2 * np.pi * (45 * t + 60 * (1 - np.exp(-t * 30)) / 30)
+        return (np.sin(phase) * np.exp(-t * 9)).astype(np.float32)
+    if kind == "snare":
+        t = np.arange(int(0.25 * sample_rate)) / sample_rate
+        body = 0.4 * np.sin(2 * np.pi * 190 * t)
+        return ((body + 0.6 * rng.standard_normal(len(t))) * np.exp(-t * 18)).astype(np.float32) * 0.7
+    t = np.arange(int(0.06 * sample_rate)) / sample_rate
+    return (rng.standard_normal(len(t)) * np.exp(-t * 80)).astype(np.float32) * 0.3
+
+
+def make_drum_loop(path, seconds, bpm=120, seed=0, sample_rate=SAMPLE_RATE):
+    """Writes a 16th-note drum pattern of the given length, the onset detection workload."""
+    rng = np.random.default_rng(seed)
+    audio = np.zeros(int(seconds * sample_rate) + sample_rate, dtype=np.float32)
+    step = 60 / bpm / 4
+    hits = {"kick": synth_hit("kick", rng), "snare": synth_hit("snare", rng), "hat": synth_hit("hat", rng)}
+    for i in range(int(seconds / step)):
+        position = int(i * step * sample_rate)
+        kind = "kick" if i % 8 == 0 else "snare" if i % 8 == 4 else "hat" if i % 2 == 0 else None
+        if kind:
+            hit = hits[kind] * rng.uniform(0.7, 1.0)
+            audio[position:position + len(hit)] += hit
+    sf.write(path, audio[:int(seconds * sample_rate)], sample_rate, subtype='PCM_16')
+    return path
+
+
+def make_field_recording(path, seconds, seed=1, sample_rate=SAMPLE_RATE):
+    """Writes a long, quiet noise bed with sparse louder events and silent edges, the long-file workload."""
+    rng = np.random.default_rng(seed)
+    frames = int(seconds * sample_rate)
+    # Brown-ish background from integrated white noise, kept at around -50 dBFS
+    background = np.cumsum(rng.standard_normal(frames)).astype(np.float32)
+    background -= np.convolve(background, np.ones(4096, dtype=np.float32) / 4096, mode='same')
+    background *= 0.003 / max(float(np.std(background)), 1e-9)
+    for _ in range(int(seconds / 5)):
+        position = int(rng.uniform(1, seconds - 1) * sample_rate)
+        event = synth_hit(rng.choice(["kick", "snare", "hat"]), rng) * rng.uniform(0.2, 0.6)
+        background[position:position + len(event)] += event[:frames - position]
+    edge = int(0.5 * sample_rate)
+    background[:edge] = 0
+    background[-edge:] = 0
+    sf.write(path, background, sample_rate, subtype='PCM_16')
+    return path
+
+
+def make_one_shots(folder, count, seed=2, sample_rate=SAMPLE_RATE):
+    """Writes count short hits with silence around them, the pack workload of the list manager."""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    kinds = ["kick", "snare", "hat"]
+    for i in range(count):
+        hit = synth_hit(kinds[i % 3], rng) * rng.uniform(0.1, 0.9)
+        lead = np.zeros(int(rng.uniform(0.05, 0.3) * sample_rate), dtype=np.float32)
+        tail = np.zeros(int(rng.uniform(0.1, 0.5) * sample_rate), dtype=np.float32)
+        path = os.path.join(folder, f"{kinds[i % 3]}_{i:05d}.wav")
+        sf.write(path, np.concatenate([lead, hit, tail]), sample_rate, subtype='PCM_16')
+        paths.append(path)
+    return paths
+
+
+class FixtureSet:
+    def __init__(self, root, scale):
+        """Generates the fixtures for one size under root, once, the first time each is asked for."""
+        self.root = root
+        self.scale = scale
+        self._cache = {}
+
+    def get(self, kind):
+        if kind not in self._cache:
+            if kind == "drum_loop":
+                self._cache[kind] = make_drum_loop(os.path.join(self.root, "drum_loop.wav"),
+                                                   DRUM_LOOP_SECONDS * self.scale)
+            elif kind == "field_recording":
+                self._cache[kind] = make_field_recording(os.path.join(self.root, "field_recording.wav"),
+                                                         FIELD_RECORDING_SECONDS * self.scale)
+            elif kind == "field_recording_mp3":
+                # The same recording compressed, encoded by libsndfile so no ffmpeg is needed to make it
+                audio, sample_rate = sf.read(self.get("field_recording"), dtype='float32')
+                path = os.path.join(self.root, "field_recording.mp3")
+                sf.write(path, audio, sample_rate, format='MP3', subtype='MPEG_LAYER_III')
+                self._cache[kind] = path
+            elif kind == "one_shots":
+                self._cache[kind] = make_one_shots(os.path.join(self.root, "one_shots"), ONE_SHOT_COUNT * self.scale)
+            else:
+                raise ValueError(f"Unknown fixture '{kind}'")
+        return self._cache[kind]
+
+
+def audio_seconds(paths):
+    """Total duration of the files in seconds."""
+    if isinstance(paths, str):
+        paths = [paths]
+    return sum(sf.info(path).duration for path in paths)
+
+
+def fresh_dir(path):
+    """Empties (or creates) a scratch folder."""
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+# Each benchmark has a setup(fixtures, work_dir) that returns a state and units of work outside the timed
+# region, and a run(state) that is timed. Units are seconds of audio or a count of files.
+
+def setup_detect_onsets(fixtures, work_dir):
+    path = fixtures.get("drum_loop")
+    return SampleChopper(path), audio_seconds(path)
+
+
+def run_detect_onsets(chopper):
+    # Time the STFT and onset strength too, not just peak picking on the cached envelope
+    chopper.onset_envelope = None
+    get_stft_cache().clear()
+    chopper.detect_onsets(0.3, 0.5, 0.1)
+
+
+def setup_detect_onsets_flux(fixtures, work_dir):
+    chopper, units = setup_detect_onsets(fixtures, work_dir)
+    chopper.onset_method = "flux"
+    return chopper, units
+
+
+def setup_chop_samples(fixtures, work_dir):
+    path = fixtures.get("drum_loop")
+    chopper = SampleChopper(path)
+    markers = chopper.detect_onsets(0.3, 0.5, 0.1) or [0.0]
+    return (chopper, markers, fresh_dir(os.path.join(work_dir, "chops"))), audio_seconds(path)
+
+
+def run_chop_samples(state):
+    chopper, markers, folder = state
+    chopper.chop_samples(markers, folder)
+
+
+def run_chop_buffers(state):
+    chopper, markers, _ = state
+    chopper.chop_buffers(markers)
+
+
+def setup_silence_process(fixtures, work_dir):
+    paths = fixtures.get("one_shots")
+    processor = SilenceProcessor(silence_threshold=-40.0, fade_in_duration=0.005, fade_out_duration=0.02)
+    return (processor, paths, fresh_dir(os.path.join(work_dir, "processed"))), len(paths)
+
+
+def run_silence_process(state):
+    processor, paths, folder = state
+    for path in paths:
+        processor.process_sample(path, folder)
+
+
+def setup_normalize(fixtures, work_dir):
+    paths = fixtures.get("one_shots")
+    folder = fresh_dir(os.path.join(work_dir, "normalized"))
+    outputs = [os.path.join(folder, os.path.basename(path)) for path in paths]
+    return (UtilityProcessor(), list(zip(paths, outputs))), len(paths)
+
+
+def run_normalize(state):
+    processor, pairs = state
+    for path, output_path in pairs:
+        processor.normalize_sample(path, -3, output_path=output_path)
+
+
+def setup_resample(fixtures, work_dir):
+    path = fixtures.get("field_recording")
+    output_path = os.path.join(fresh_dir(os.path.join(work_dir, "resampled")), "field_recording.wav")
+    return (UtilityProcessor(), path, output_path), audio_seconds(path)
+
+
+def run_resample(state):
+    processor, path, output_path = state
+    processor.resample_sample(path, 48000, output_path=output_path)
+
+
+def setup_list_load(fixtures, work_dir):
+    paths = fixtures.get("one_shots")
+    return (SampleListManager(fresh_dir(os.path.join(work_dir, "list"))), paths), len(paths)
+
+
+def run_list_load(state):
+    manager, paths = state
+    manager.load_samples(paths)
+
+
+def setup_list_rename(fixtures, work_dir):
+    paths = fixtures.get("one_shots")
+    manager = SampleListManager(fresh_dir(os.path.join(work_dir, "list")))
+    manager.load_samples(paths)
+    plan = {name: f"renamed_{name}" for name in manager.get_sample_names()}
+    return (manager, plan), len(paths)
+
+
+def run_list_rename(state):
+    manager, plan = state
+    manager.rename_samples(plan)
+
+
+def setup_list_tag(fixtures, work_dir):
+    paths = fixtures.get("one_shots")
+    manager = SampleListManager(fresh_dir(os.path.join(work_dir, "list")))
+    manager.load_samples(paths)
+    return manager, len(paths)
+
+
+def run_list_tag(manager):
+    for i, name in enumerate(manager.get_sample_names()):
+        manager.update_tag(name, f"tag{i % 8}")
+
+
+def setup_decode(fixtures, work_dir):
+    path = fixtures.get("field_recording")
+    return (Decoder(), path), audio_seconds(path)
+
+
+def setup_decode_mp3(fixtures, work_dir):
+    path = fixtures.get("field_recording_mp3")
+    return (Decoder(), path), audio_seconds(path)
+
+
+def run_decode(state):
+    decoder, path = state
+    decoder.decode(path)
+
+
+def run_decode_ffmpeg(state):
+    decoder, path = state
+    decoder.pool.decode(path)  # Forced through ffmpeg even though libsndfile could read it
+
+
+def setup_decode_regions(fixtures, work_dir):
+    path = fixtures.get("field_recording")
+    info = sf.info(path)
+    length = int(REGION_SECONDS * info.samplerate)
+    starts = np.linspace(0, info.frames - length, REGION_READS).astype(int)
+    return (Decoder(), path, starts, length), REGION_READS * REGION_SECONDS
+
+
+def run_decode_regions(state):
+    decoder, path, starts, length = state
+    for start in starts:
+        decoder.decode(path, start=start, stop=start + length)
+
+
+BENCHMARKS = {
+    "chopper.detect_onsets": (setup_detect_onsets, run_detect_onsets, "audio s"),
+    "chopper.detect_onsets_flux": (setup_detect_onsets_flux, run_detect_onsets, "audio s"),
+    "chopper.chop_samples": (setup_chop_samples, run_chop_samples, "audio s"),
+    "chopper.chop_buffers": (setup_chop_samples, run_chop_buffers, "audio s"),
+    "silence.process_sample": (setup_silence_process, run_silence_process, "files"),
+    "utility.normalize_sample": (setup_normalize, run_normalize, "files"),
+    "utility.resample_sample": (setup_resample, run_resample, "audio s"),
+    "list.load_samples": (setup_list_load, run_list_load, "files"),
+    "list.rename_samples": (setup_list_rename, run_list_rename, "files"),
+    "list.update_tag": (setup_list_tag, run_list_tag, "files"),
+    "decoder.native": (setup_decode, run_decode, "audio s"),
+    "decoder.native_region": (setup_decode_regions, run_decode_regions, "audio s"),
+}
+# Compressed decodes, where this libsndfile can write the MP3 fixture and ffmpeg is installed
+if "MP3" in sf.available_formats():
+    BENCHMARKS["decoder.native_mp3"] = (setup_decode_mp3, run_decode, "audio s")
+    if FFmpegPool().available:
+        BENCHMARKS["decoder.ffmpeg_mp3"] = (setup_decode_mp3, run_decode_ffmpeg, "audio s")
+
+
+def quiet():
+    """Redirects the modules' progress prints, which would otherwise dominate the timings of small files."""
+    return open(os.devnull, 'w')
+
+
+def run_benchmark(name, fixtures, work_dir, repeats=3):
+    """Times one benchmark (best of repeats) and measures its peak Python-heap memory in a separate run.
+
+    tracemalloc slows allocation-heavy code down, so the timed runs are done without it.
+    """
+    setup, run, unit = BENCHMARKS[name]
+    timings = []
+    stdout = sys.stdout
+    with quiet() as devnull:
+        try:
+            sys.stdout = devnull
+            for _ in range(repeats):
+                state, units = setup(fixtures, work_dir)
+                start = time.perf_counter()
+                run(state)
+                timings.append(time.perf_counter() - start)
+
+            state, units = setup(fixtures, work_dir)
+            tracemalloc.start()
+            run(state)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            sys.stdout = stdout
+
+    seconds = min(timings)
+    return {
+        "seconds": seconds,
+        "units": units,
+        "unit": unit,
+        "throughput": units / seconds if seconds > 0 else float("inf"),
+        "peak_mb": peak / 2 ** 20,
+    }
+
+
+def scaling_exponent(points):
+    """Slope of log(seconds) over log(units): about 1 is linear, 2 quadratic. None with fewer than two sizes."""
+    points = [(units, seconds) for units, seconds in points if units > 0 and seconds > 0]
+    if len(points) < 2:
+        return None
+    units, seconds = np.log(np.array(points)).T
+    return float(np.polyfit(units, seconds, 1)[0])
+
+
+def run_suite(sizes=("small", "medium"), names=None, repeats=3, work_dir=None):
+    """Runs the selected benchmarks at every size and returns {"results": {...}, "scaling": {...}}.
+
+    Results are keyed "benchmark/size". Fixtures are generated in a scratch folder removed afterwards.
+    """
+    names = names or list(BENCHMARKS)
+    root = work_dir or tempfile.mkdtemp(prefix="sample_editor_bench_")
+    results = {}
+    try:
+        for size in sizes:
+            fixtures = FixtureSet(fresh_dir(os.path.join(root, size, "fixtures")), SIZES[size])
+            scratch = fresh_dir(os.path.join(root, size, "scratch"))
+            for name in names:
+                results[f"{name}/{size}"] = run_benchmark(name, fixtures, scratch, repeats)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    scaling = {}
+    for name in names:
+        points = [(results[f"{name}/{size}"]["units"], results[f"{name}/{size}"]["seconds"]) for size in sizes]
+        scaling[name] = scaling_exponent(points)
+    return {"results": results, "scaling": scaling}
+
+
+def save_baseline(suite, path):
+    """Stores a suite result as the baseline to compare later runs against."""
+    with open(path, 'w') as f:
+        json.dump(suite, f, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_to_baseline(suite, baseline, tolerance=TOLERANCE):
+    """Returns a list of regressions, one dict per benchmark/size that got slower or bigger than tolerance allows.
+
+    Only entries present in both runs are compared.
+    """
+    regressions = []
+    for key, result in suite["results"].items():
+        reference = baseline["results"].get(key)
+        if reference is None:
+            continue
+        for metric in ("seconds", "peak_mb"):
+            if reference[metric] > 0 and result[metric] > reference[metric] * (1 + tolerance):
+                regressions.append({"benchmark": key, "metric": metric, "baseline": reference[metric],
+                                    "current": result[metric], "ratio": result[metric] / reference[metric]})
+    return regressions
+
+
+def format_report(suite, baseline=None):
+    """Formats the suite as a table, with the change against the baseline when one is given."""
+    lines = [f"{'benchmark':<36}{'units':>10}{'seconds':>10}{'throughput':>20}{'peak MB':>10}{'vs base':>10}"]
+    for key, result in suite["results"].items():
+        change = ""
+        if baseline and key in baseline["results"] and baseline["results"][key]["seconds"] > 0:
+            change = f"{result['seconds'] / baseline['results'][key]['seconds']:.2f}x"
+        throughput = f"{result['throughput']:.1f} {result['unit']}/s"
+        lines.append(f"{key:<36}{result['units']:>10.0f}{result['seconds']:>10.3f}{throughput:>20}"
+                     f"{result['peak_mb']:>10.1f}{change:>10}")
+
+    lines.append("")
+    lines.append("scaling exponent (1.0 = linear in input size)")
+    for name, exponent in suite["scaling"].items():
+        lines.append(f"  {name:<34}{'n/a' if exponent is None else f'{exponent:.2f}'}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """Runs the suite headless, prints the report and exits with 1 when a baseline comparison finds regressions."""
+    parser = argparse.ArgumentParser(description="Benchmark the chopper, silence, utility and list-manager hot paths.")
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(SIZES))
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="Benchmarks to run (default all)")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="Write this run as the new baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    suite = run_suite(args.sizes, args.only, args.repeats)
+    baseline = load_baseline(args.baseline) if args.baseline and os.path.exists(args.baseline) else None
+    print(format_report(suite, baseline))
+
+    if args.save_baseline:
+        save_baseline(suite, args.save_baseline)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if baseline:
+        regressions = compare_to_baseline(suite, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['benchmark']} {regression['metric']}: "
+                  f"{regression['baseline']:.3f} -> {regression['current']:.3f} ({regression['ratio']:.2f}x)")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
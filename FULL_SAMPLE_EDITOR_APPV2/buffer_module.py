@@ -0,0 +1,73 @@
+import functools
+import numpy as np
+import soundfile as sf
+
+# Sample buffer policy: audio is float32 from decode to encode. Conversions happen once, in decode() and
+# encode(), and fades and gain are applied in place. float64 is only used for accumulators (running
+# sums, energies), which are either scalars or bounded by a chunk size, never one value per sample.
+SAMPLE_DTYPE = np.float32
+
+
+def as_samples(audio):
+    """Returns audio as a float32 array, without copying when it already is one."""
+    return np.asarray(audio, dtype=SAMPLE_DTYPE)
+
+
+def decode(file_path, mono=False, start=0, stop=None):
+    """Decodes a file (or the frames [start, stop)) straight to float32.
+
+    mono=True averages the channels like librosa.load does and returns (frames,), otherwise the
+    result is (frames,) for mono files and (frames, channels) for the rest, like sf.read.
+    """
+    audio, sample_rate = sf.read(file_path, start=start, stop=stop, dtype=SAMPLE_DTYPE, always_2d=mono)
+    if mono:
+        audio = audio.mean(axis=1, dtype=SAMPLE_DTYPE) if audio.shape[1] > 1 else audio[:, 0]
+    return audio, sample_rate
+
+
+def encode(file_path, audio, sample_rate, subtype=None, format=None):
+    """Writes float32 audio, libsndfile converts to the file's sample format while writing."""
+    sf.write(file_path, as_samples(audio), int(sample_rate), subtype=subtype, format=format)
+
+
+@functools.lru_cache(maxsize=64)
+def fade_curve(length, rising=True):
+    """A linear float32 fade of length samples, shared between calls so it is built once per length."""
+    curve = np.linspace(0.0, 1.0, length, dtype=SAMPLE_DTYPE) if rising else \
+        np.linspace(1.0, 0.0, length, dtype=SAMPLE_DTYPE)
+    curve.flags.writeable = False
+    return curve
+
+
+def apply_fades(audio, fade_in_samples, fade_out_samples):
+    """Fades the start and end of a float32 (frames,) or (frames, channels) buffer in place and returns it."""
+    total_samples = len(audio)
+    if fade_in_samples > 0:
+        fade_in_samples = min(fade_in_samples, total_samples)
+        curve = fade_curve(fade_in_samples, True)
+        audio[:fade_in_samples] *= curve if audio.ndim == 1 else curve[:, None]
+    if 0 < fade_out_samples <= total_samples:
+        curve = fade_curve(fade_out_samples, False)
+        audio[-fade_out_samples:] *= curve if audio.ndim == 1 else curve[:, None]
+    return audio
+
+
+def apply_gain(audio, gain):
+    """Scales a float32 buffer in place and returns it."""
+    audio *= SAMPLE_DTYPE(gain)
+    return audio
+
+
+def writable(audio):
+    """Returns audio, or a copy of it when it is read-only (a shared store or cache buffer), ready for in-place edits."""
+    return audio if audio.flags.writeable else audio.copy()
+
+
+def play(audio, sample_rate):
+    """Plays a float32 buffer straight from memory as 16-bit PCM, returns the simpleaudio PlayObject."""
+    import simpleaudio as sa  # Imported here so headless runs don't need an audio device
+
+    pcm = np.clip(audio, -1.0, 1.0)
+    pcm *= 32767
+    channels = 1 if pcm.ndim == 1 else pcm.shape[1]
+    return sa.play_buffer(pcm.astype(np.int16), channels, 2, int(sample_rate))
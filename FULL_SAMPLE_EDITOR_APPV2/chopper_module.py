@@ -1,27 +1,115 @@
 import os
 import numpy as np
-import librosa
 import soundfile as sf  # Use soundfile for writing audio
-from pydub import AudioSegment
+from silence_module import frame_energy_all, HOP_LENGTH, AMIN_POWER
+from trace_module import span, traced
+from memory_module import get_budget, get_decoded_cache
+from peaks_module import PeakPyramid
+from buffer_module import encode
+from store_module import output_subtype
+from decoder_module import get_decoder
 
 class SampleChopper:
-    def __init__(self, file_path, min_duration=0.3, max_duration=0.5, threshold=0.1):
+    def __init__(self, file_path, min_duration=0.3, max_duration=0.5, threshold=0.1, lazy=False):
+        """lazy=True reads only the header here and decodes on first use of audio_data (e.g. a restored session)."""
         self.file_path = file_path
-        self.audio_data, self.sample_rate = librosa.load(file_path, sr=None)
-        self.full_duration = AudioSegment.from_file(file_path).duration_seconds
+        self._audio_data = None
+        self.onset_envelope = None  # Raw onset strength, kept so changing the threshold doesn't recompute it
+        self.onset_method = "librosa"  # "librosa" mel onset strength, "flux" or "flux_whitened" for onset_module
+        self.onset_envelope_method = None  # Method onset_envelope was computed with
+        self._peaks = None
+        self._spectrogram = None
+        self.digest = None  # Content hash of the file when the caller knows it, keys the STFT tile cache
+        try:
+            info = sf.info(file_path) if lazy else None
+        except RuntimeError:
+            info = None  # Not a libsndfile format, the librosa fallback needs a full decode anyway
+        if info is not None:
+            self.sample_rate = info.samplerate
+            self.full_duration = info.frames / info.samplerate
+        else:
+            self.decode()
         self.min_duration = min_duration
         self.max_duration = max_duration
         self.threshold = threshold
         self.markers = []
         self.onsets = []
 
+    def decode(self):
+        """Decodes the whole file to mono float32."""
+        with span("chopper.decode") as stage:
+            # Mono float32 like librosa.load(sr=None), shared through the budgeted cache
+            try:
+                self._audio_data, self.sample_rate = get_decoded_cache().load(self.file_path, mono=True)
+            except RuntimeError:
+                # Formats libsndfile can't read go through the decoder's ffmpeg pool
+                self._audio_data, self.sample_rate = get_decoder().decode(self.file_path, mono=True)
+                get_budget().register(self._audio_data, "chopper", os.path.basename(self.file_path))
+            self.full_duration = len(self._audio_data) / self.sample_rate
+            stage.read_file(self.file_path)
+            stage.add(samples=len(self._audio_data))
+
+    @property
+    def audio_data(self):
+        if self._audio_data is None:
+            self.decode()
+        return self._audio_data
+
+    @property
+    def decoded(self):
+        return self._audio_data is not None
+
+    @property
+    def peaks(self):
+        """Min/max overview of the waveform, built on first use from the decoded audio or streamed from the file."""
+        if self._peaks is None:
+            with span("chopper.peaks"):
+                if self.decoded:
+                    self._peaks = PeakPyramid.from_audio(self._audio_data, self.sample_rate)
+                else:
+                    self._peaks = PeakPyramid.from_file(self.file_path)
+        return self._peaks
+
+    @peaks.setter
+    def peaks(self, peaks):
+        self._peaks = peaks
+
+    @property
+    def spectrogram(self):
+        """Tiled STFT of the source, shared by the spectrogram view and onset detection."""
+        if self._spectrogram is None:
+            from spectrogram_module import Spectrogram
+
+            # Tiles slice the decoded audio when there is one, otherwise they read their part of the file
+            self._spectrogram = Spectrogram(self.file_path, self._audio_data, self.sample_rate, digest=self.digest)
+        return self._spectrogram
+
+    def onset_strength(self):
+        """The onset strength envelope of the whole source with onset_method, computed once per method.
+
+        "librosa" reduces the cached STFT tiles to a mel spectrogram. "flux" streams the audio
+        through onset_module's spectral flux, several times faster with a fraction of the memory,
+        and "flux_whitened" adds adaptive whitening for hits in a noisy or reverberant bed.
+        """
+        if self.onset_envelope is None or self.onset_envelope_method != self.onset_method:
+            if self.onset_method in ("flux", "flux_whitened"):
+                from onset_module import SpectralFluxDetector
+
+                detector = SpectralFluxDetector(whitening=self.onset_method == "flux_whitened")
+                self.onset_envelope = detector.strength(self.spectrogram.read, self.spectrogram.num_samples,
+                                                        self.sample_rate)
+            else:
+                self.onset_envelope = self.spectrogram.onset_strength()
+            self.onset_envelope_method = self.onset_method
+        return self.onset_envelope
+
+    @traced("chopper.detect_onsets")
     def detect_onsets(self, min_duration, max_duration, threshold):
         """Detect onsets and return their shifted times based on provided parameters."""
-        if self.audio_data is None:
-            return []
+        import librosa
 
-        # Detect onset strengths and frames using librosa
-        onset_env = librosa.onset.onset_strength(y=self.audio_data, sr=self.sample_rate)
+        # Detect onset strengths and frames using librosa, the envelope is cached across threshold changes
+        onset_env = self.onset_strength()
         onset_env = np.where(onset_env > threshold * np.max(onset_env), onset_env, 0)
         onset_frames = librosa.onset.onset_detect(onset_envelope=onset_env, sr=self.sample_rate, units='frames')
 
@@ -42,27 +130,126 @@ class SampleChopper:
 
         return shifted_onsets
     
+    def detect_silence_regions(self, silence_threshold=-40.0, min_silence=0.1, min_length=0.05, padding=0.01, reference="max"):
+        """Return (start, end) times in seconds of every audible region, split where the audio falls below the threshold.
+
+        Gaps shorter than min_silence are bridged, regions shorter than min_length are dropped
+        and each region is widened by padding seconds on both sides without overlapping its neighbours.
+        """
+        audio = self.audio_data
+        num_samples = len(audio)
+
+        # One frame-energy pass over the whole source, same frames and threshold rule as the silence cropper
+        energy = frame_energy_all(lambda start, stop: audio[start:stop], num_samples)
+        ref_energy = energy.max() if reference == "max" else 1.0
+        limit = max(ref_energy, AMIN_POWER) * 10 ** (silence_threshold / 10)
+        audible = np.maximum(energy, AMIN_POWER) > limit
+
+        # Frame indices where audible runs start and stop
+        changes = np.flatnonzero(np.diff(np.concatenate(([False], audible, [False])).astype(np.int8)))
+        starts = changes[0::2] * HOP_LENGTH
+        ends = np.minimum(changes[1::2] * HOP_LENGTH, num_samples)
+
+        # Bridge short gaps, then drop regions that are too short to be a sample
+        regions = []
+        for start, end in zip(starts, ends):
+            if regions and start - regions[-1][1] < min_silence * self.sample_rate:
+                regions[-1][1] = end
+            else:
+                regions.append([start, end])
+        regions = [region for region in regions if region[1] - region[0] >= min_length * self.sample_rate]
+
+        padding_samples = int(padding * self.sample_rate)
+        padded = []
+        for start, end in regions:
+            start = max(0, start - padding_samples)
+            if padded:
+                start = max(start, padded[-1][1])
+            padded.append((start, min(num_samples, end + padding_samples)))
+
+        return [(float(start) / self.sample_rate, float(end) / self.sample_rate) for start, end in padded]
+
+    def segment_on_silence(self, silence_threshold=-40.0, min_silence=0.1, min_length=0.05, padding=0.01):
+        """Return markers and end times for every audible region, ready for chop_samples."""
+        regions = self.detect_silence_regions(silence_threshold, min_silence, min_length, padding)
+        markers = [start for start, _ in regions]
+        ends = [end for _, end in regions]
+        return markers, ends
+
     def save_chopped_sample(self, filepath, audio_data, sample_rate):
         """Save the chopped audio sample to a .wav file."""
         sf.write(filepath, audio_data, sample_rate)  # Use soundfile.write instead of librosa.output.write_wav
 
-    def chop_samples(self, markers, temp_folder):
-        """Chop the audio based on markers and save chunks to the temp folder."""
-        # Load the full audio file using pydub
-        audio_segment = AudioSegment.from_file(self.file_path)
-        chopped_files = []
-        
+    def chop_regions(self, markers, ends=None):
+        """(start, end) in seconds of every chop: from each marker to its end, or else to the next marker."""
+        regions = []
         for i in range(len(markers)):
-            start_time = int(markers[i] * 1000)  # Convert seconds to milliseconds
-            if i == len(markers) - 1:
-                end_time = int(self.full_duration * 1000)  # Last marker to the end of the file
+            if ends is not None and ends[i] is not None:
+                end = ends[i]  # Region end from split-on-silence
+            elif i == len(markers) - 1:
+                end = self.full_duration  # Last marker to the end of the file
             else:
-                end_time = int(markers[i + 1] * 1000)  # From marker i to marker i+1
+                end = markers[i + 1]  # From marker i to marker i+1
+            regions.append((markers[i], end))
+        return regions
+
+    @property
+    def seekable(self):
+        """True if libsndfile can read the source, so chops can be read or referenced by frame."""
+        try:
+            sf.info(self.file_path)
+            return True
+        except RuntimeError:
+            return False
+
+    def chop_frames(self, markers, ends=None):
+        """Chop by reference: (name, start frame, end frame) per chop, for SampleListManager.add_virtual_chops."""
+        return [(f"chop_{i + 1}.wav", int(start * self.sample_rate), int(end * self.sample_rate))
+                for i, (start, end) in enumerate(self.chop_regions(markers, ends))]
+
+    def chop_buffers(self, markers, ends=None):
+        """Chop the audio at the markers into in-memory buffers, without writing anything.
+
+        Returns (name, audio, sample_rate, subtype) per chop. Every region is read straight from the
+        file with all its channels; formats libsndfile can't read are cut from the decoded mono audio.
+        """
+        regions = self.chop_regions(markers, ends)
+        chops = []
+        with span("chopper.chop_buffers", chops=len(markers)) as stage:
+            try:
+                source = sf.SoundFile(self.file_path)
+            except RuntimeError:
+                source = None
+
+            for i, (start, end) in enumerate(regions):
+                if source is not None:
+                    first = int(start * source.samplerate)
+                    source.seek(first)
+                    audio = source.read(max(0, int(end * source.samplerate) - first), dtype='float32')
+                    chops.append((f"chop_{i + 1}.wav", audio, source.samplerate, source.subtype))
+                else:
+                    audio = self.audio_data[int(start * self.sample_rate):int(end * self.sample_rate)]
+                    chops.append((f"chop_{i + 1}.wav", audio, self.sample_rate, None))
+                stage.add(samples=audio.size)
+
+            if source is not None:
+                stage.read_file(self.file_path)
+                source.close()
+        return chops
+
+    def chop_samples(self, markers, temp_folder, ends=None):
+        """Chop the audio based on markers and save chunks to the temp folder.
+
+        ends optionally gives an end time per marker (None to run to the next marker).
+        """
+        with span("chopper.chop", chops=len(markers)) as stage:
+            chopped_files = []
 
-            # Slice the audio and save to the temp folder
-            chunk = audio_segment[start_time:end_time]
-            output_path = os.path.join(temp_folder, f"chop_{i + 1}.wav")
-            chunk.export(output_path, format="wav")  # You can detect the original format if needed
-            chopped_files.append(output_path)
+            # Every chop keeps the source's channels and, where WAV can hold it, its bit depth
+            for name, audio, sample_rate, subtype in self.chop_buffers(markers, ends):
+                output_path = os.path.join(temp_folder, name)
+                encode(output_path, audio, sample_rate, subtype=output_subtype(output_path, subtype))
+                chopped_files.append(output_path)
+                stage.wrote_file(output_path)
 
         return chopped_files
@@ -0,0 +1,123 @@
+import os
+import struct
+import shutil
+import threading
+import subprocess
+
+import numpy as np
+import soundfile as sf
+
+from buffer_module import SAMPLE_DTYPE, decode
+from trace_module import span
+
+# ffmpeg binary used for formats libsndfile can't read (AAC, M4A, Opus, ...)
+FFMPEG_ENV = "SAMPLE_EDITOR_FFMPEG"
+FFMPEG_PROCESSES = 2  # ffmpeg decodes allowed to run at once, each is its own process
+
+
+def is_native(file_path):
+    """True if libsndfile reads the file (WAV, AIFF, FLAC, OGG and, with libsndfile 1.1+, MP3)."""
+    try:
+        sf.info(file_path)
+        return True
+    except RuntimeError:
+        return False
+
+
+def parse_wav_stream(data):
+    """Splits the WAV ffmpeg writes to a pipe into (float32 samples as (frames, channels), sample_rate).
+
+    A piped WAV has no seekable header, so its size fields are placeholders. Only the fmt chunk
+    is read, and everything after the data chunk header is taken as sample data.
+    """
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        raise RuntimeError("ffmpeg didn't return a WAV stream")
+    position = 12
+    channels = sample_rate = None
+    while position + 8 <= len(data):
+        chunk_id, size = data[position:position + 4], struct.unpack("<I", data[position + 4:position + 8])[0]
+        position += 8
+        if chunk_id == b"fmt ":
+            channels, sample_rate = struct.unpack("<HI", data[position + 2:position + 8])
+        elif chunk_id == b"data":
+            if channels is None:
+                raise RuntimeError("WAV stream has no fmt chunk before its data")
+            frames = (len(data) - position) // (4 * channels)
+            audio = np.frombuffer(data, dtype="<f4", count=frames * channels, offset=position)
+            return audio.reshape(frames, channels), sample_rate
+        position += size + (size & 1)  # Chunks are padded to an even size
+    raise RuntimeError("WAV stream ended before its data chunk")
+
+
+class FFmpegPool:
+    def __init__(self, binary=None, processes=FFMPEG_PROCESSES):
+        """
+        Decodes formats libsndfile can't read with ffmpeg, at most processes at a time.
+
+        ffmpeg takes one input per run, so every file is its own process. Each one writes float32
+        WAV straight into a pipe at the source rate and channel count: there is no ffprobe call, no
+        temp file and no conversion through 16-bit, unlike pydub. Callers beyond the limit wait
+        for a slot instead of starting more processes than there are cores to run them.
+        """
+        self.binary = binary or os.environ.get(FFMPEG_ENV) or "ffmpeg"
+        self.processes = processes
+        self.started = 0  # ffmpeg processes run so far
+        self._slots = threading.BoundedSemaphore(processes)
+
+    @property
+    def available(self):
+        return shutil.which(self.binary) is not None
+
+    def decode(self, file_path):
+        """Returns (audio, sample_rate), audio as read-only float32 (frames, channels)."""
+        command = [self.binary, "-nostdin", "-v", "error", "-i", file_path, "-map", "0:a:0",
+                   "-c:a", "pcm_f32le", "-f", "wav", "-"]
+        with self._slots, span("decoder.ffmpeg") as stage:
+            try:
+                process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            except OSError as e:
+                raise RuntimeError(f"Can't decode {file_path}: ffmpeg isn't available ({e})") from e
+            self.started += 1
+            data, errors = process.communicate()
+            if process.returncode != 0:
+                raise RuntimeError(f"ffmpeg couldn't decode {file_path}: {errors.decode(errors='replace').strip()}")
+            audio, sample_rate = parse_wav_stream(data)
+            stage.read_file(file_path)
+            stage.add(samples=audio.size)
+        return audio, sample_rate
+
+
+class Decoder:
+    def __init__(self, pool=None):
+        """
+        One entry point for decoding any file to float32.
+
+        Files libsndfile reads are decoded natively, and a region only reads (and seeks to) its own
+        frames. Everything else goes through the ffmpeg pool, decoded whole and then sliced, since
+        compressed formats can't be seeked to an exact frame.
+        """
+        self.pool = pool or FFmpegPool()
+
+    def decode(self, file_path, mono=False, start=0, stop=None):
+        """Decodes a file (or the frames [start, stop)), shaped like buffer_module.decode."""
+        if is_native(file_path):
+            return decode(file_path, mono=mono, start=start, stop=stop)
+
+        audio, sample_rate = self.pool.decode(file_path)
+        audio = audio[start:stop]
+        if mono:
+            audio = audio.mean(axis=1, dtype=SAMPLE_DTYPE) if audio.shape[1] > 1 else audio[:, 0]
+        elif audio.shape[1] == 1:
+            audio = audio[:, 0]
+        return audio, sample_rate
+
+
+_decoder = None
+
+
+def get_decoder():
+    """The decoder shared by the whole process, so every caller shares one ffmpeg pool."""
+    global _decoder
+    if _decoder is None:
+        _decoder = Decoder()
+    return _decoder
@@ -0,0 +1,70 @@
+import os
+import shutil
+import soundfile as sf
+
+# Export actions, cheapest first
+HARDLINK = "hardlink"  # The export shares the source's data on disk
+COPY = "copy"  # Byte copy of the source, no decode or encode
+PROCESS = "process"  # Decode, run the enabled stages and encode
+
+
+class ExportPlanner:
+    def __init__(self, crop=False, normalize=False, target_sample_rate=None, allow_hardlinks=False):
+        """
+        Picks the cheapest correct way to export each sample from its header and the enabled stages.
+
+        A sample that has a backing file (see SampleStore.backing_file) and that no stage would
+        change is copied byte for byte, or hardlinked when allow_hardlinks is set, so renaming or
+        signing a pack costs only I/O. Everything else is processed.
+
+        :param target_sample_rate: Rate the export resamples to, None leaves every rate alone.
+        :param allow_hardlinks: Hardlinked exports share their data with the source, editing one
+            in place edits both. Falls back to a copy where linking isn't possible.
+        """
+        self.crop = crop
+        self.normalize = normalize
+        self.target_sample_rate = target_sample_rate
+        self.allow_hardlinks = allow_hardlinks
+
+    def action(self, file_path, dest):
+        """The action for one sample whose backing file is file_path (None if it has none), exported to dest."""
+        if file_path is None or self.crop or self.normalize:
+            return PROCESS
+        if os.path.splitext(file_path)[1].lower() != os.path.splitext(dest)[1].lower():
+            return PROCESS  # Another container or codec, it has to be re-encoded
+        if self.target_sample_rate:
+            try:
+                if sf.info(file_path).samplerate != int(self.target_sample_rate):
+                    return PROCESS
+            except RuntimeError:
+                return PROCESS  # No header libsndfile can read, so the rate is unknown
+        return HARDLINK if self.allow_hardlinks else COPY
+
+    def plan(self, sample_manager, destinations):
+        """Returns {sample name: (action, backing file)} for {sample name: destination path}."""
+        plan = {}
+        for sample_name, dest in destinations.items():
+            file_path = sample_manager.backing_file(sample_name)
+            plan[sample_name] = (self.action(file_path, dest), file_path)
+        return plan
+
+
+def link_or_copy(source, dest, hardlink=False):
+    """Hardlinks (if asked) or copies source to dest, returns the action actually taken."""
+    if os.path.lexists(dest):
+        os.remove(dest)  # Never write through an old link into someone else's file
+    if hardlink:
+        try:
+            os.link(source, dest)
+            return HARDLINK
+        except OSError:
+            pass  # Another filesystem, or one without links
+    shutil.copyfile(source, dest)
+    return COPY
+
+
+def summarize(actions):
+    """Formats how many samples took each action, e.g. "12 hardlinked, 3 processed"."""
+    words = {HARDLINK: "hardlinked", COPY: "copied", PROCESS: "processed"}
+    counts = [(sum(action == key for action in actions), words[key]) for key in (HARDLINK, COPY, PROCESS)]
+    return ", ".join(f"{count} {word}" for count, word in counts if count) or "nothing exported"
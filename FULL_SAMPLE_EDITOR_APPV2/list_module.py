@@ -1,44 +1,71 @@
 import os
+import json
 import shutil
-import simpleaudio as sa
+import hashlib
+from trace_module import span, traced
+from buffer_module import play
+from store_module import get_sample_store
+
+
+def content_hash(file_path, chunk_size=1 << 20):
+    """Returns a hex digest of the file contents, used to key cached analysis results."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class SampleListManager:
-    def __init__(self, temp_folder):
-        """Initialize the Sample List Manager."""
+    def __init__(self, temp_folder, store=None):
+        """Initialize the Sample List Manager. Samples live in the sample store or as files in temp_folder."""
         self.temp_folder = temp_folder
         os.makedirs(self.temp_folder, exist_ok=True)
+        self.store = store or get_sample_store()
 
         # Dictionary to store new names of samples and their paths
-        self.samples = []
+        self.samples = []  # File path of every sample, or its store handle if it only exists in memory
         self.file_reference = {}  # Original sample names mapped to file paths
         self.sample_new_names = {}  # Store the new names of the samples
         self.tags = {}  # Store tags for each sample
         self.file_paths = {}  # Store the file paths for each sample
+        self.handles = {}  # Sample store handle of each sample, in-memory samples have no file path
         self.tag_file_path = os.path.join(self.temp_folder, "sample_tags.txt")
 
+        # Analysis results (loudness, ...) keyed by content hash, so renamed or re-imported copies reuse them
+        self.analysis = {}
+        self.analysis_file_path = os.path.join(self.temp_folder, "sample_analysis.json")
+        self._hash_memo = {}  # file path -> (size, mtime, hash)
+
+        # Journal of an in-progress bulk rename, left behind only if the app died halfway through one
+        self.rename_journal_path = os.path.join(self.temp_folder, "rename_journal.json")
+        self.recover_rename_journal()
+
     def load_samples(self, file_paths):
         """Loads samples, copies them to the temp folder, and returns a list of (sample_name, tag)."""
         sample_items = []
         
-        for file in file_paths:
-            file_name = os.path.basename(file)
-            new_file_path = os.path.join(self.temp_folder, file_name)
+        with span("list.load_samples", files=len(file_paths)) as stage:
+            for file in file_paths:
+                file_name = os.path.basename(file)
+                new_file_path = os.path.join(self.temp_folder, file_name)
 
-            try:
-                shutil.copy(file, new_file_path)
-            except FileNotFoundError as e:
-                print(f"Error copying {file}: {e}")
-                continue
+                try:
+                    shutil.copy(file, new_file_path)
+                    stage.wrote_file(new_file_path)
+                except FileNotFoundError as e:
+                    print(f"Error copying {file}: {e}")
+                    continue
 
-            # Add to the sample list
-            self.samples.append(new_file_path)
-            self.file_reference[file_name] = new_file_path
-            self.sample_new_names[file_name] = file_name
-            self.file_paths[file_name] = new_file_path  # Store the file path
+                # Add to the sample list
+                self.samples.append(new_file_path)
+                self.file_reference[file_name] = new_file_path
+                self.sample_new_names[file_name] = file_name
+                self.file_paths[file_name] = new_file_path  # Store the file path
 
-            # Each sample has a default empty tag initially
-            self.tags[file_name] = ""
-            sample_items.append((file_name, ""))
+                # Each sample has a default empty tag initially
+                self.tags[file_name] = ""
+                sample_items.append((file_name, ""))
 
         # Update the tag file
         self.update_tag_file()
@@ -61,19 +88,112 @@ class SampleListManager:
         # Update the tag file (even if tags are empty, this ensures consistency)
         self.update_tag_file()
 
+    def add_sample_buffers(self, buffers, source_paths=None):
+        """Adds in-memory samples (fresh chops, imports) without writing them anywhere.
+
+        :param buffers: (sample name, audio, sample rate, subtype) per sample, subtype is used on export.
+        :param source_paths: {sample name: file it was decoded from}, exported by copying while unchanged.
+        Returns (sample name, tag) pairs like load_samples.
+        """
+        source_paths = source_paths or {}
+        sample_items = [self.add_handle(sample_name, self.store.put(audio, sample_rate, subtype, label=sample_name,
+                                                                    source_path=source_paths.get(sample_name)))
+                        for sample_name, audio, sample_rate, subtype in buffers]
+        self.update_tag_file()
+        return sample_items
+
+    def add_virtual_chops(self, source_path, chops):
+        """Adds chops as references into their source, without decoding or writing anything.
+
+        :param chops: (sample name, start frame, end frame) per chop, e.g. from SampleChopper.chop_frames.
+        They play as views of the decoded source and become real buffers only when written or edited.
+        Returns (sample name, tag) pairs like load_samples.
+        """
+        handles = self.store.put_slices(source_path, [(start, end, name) for name, start, end in chops])
+        sample_items = [self.add_handle(name, handle) for (name, _, _), handle in zip(chops, handles)]
+        self.update_tag_file()
+        return sample_items
+
+    def add_sample_files(self, files):
+        """Adds samples backed by files outside the temp folder (e.g. a session's), read only when used.
+
+        :param files: (sample name, file path) per sample. The files are never renamed or deleted.
+        Returns (sample name, tag) pairs like load_samples.
+        """
+        sample_items = [self.add_handle(sample_name, self.store.put_file(file_path, label=sample_name))
+                        for sample_name, file_path in files]
+        self.update_tag_file()
+        return sample_items
+
+    def add_handle(self, sample_name, handle):
+        """Puts a store handle in the list under sample_name, replacing a sample of the same name."""
+        if sample_name in self.handles:
+            self.store.discard(self.handles[sample_name])  # The same name again, e.g. chopping twice
+        previous = self.file_reference.get(sample_name)
+        if previous is not None and previous in self.samples:
+            self.samples[self.samples.index(previous)] = handle
+        else:
+            self.samples.append(handle)
+        self.file_paths.pop(sample_name, None)
+        self.handles[sample_name] = handle
+        self.file_reference[sample_name] = handle
+        self.sample_new_names[sample_name] = sample_name
+        self.tags.setdefault(sample_name, "")
+        return sample_name, self.tags[sample_name]
+
+    def in_memory(self, sample_name):
+        """True if the sample only exists in the sample store, not as a file in the temp folder."""
+        return sample_name in self.handles and sample_name not in self.file_paths
+
+    def sample_handle(self, sample_name):
+        """The store handle of a sample, file samples get one on first use. None if the sample is gone."""
+        handle = self.handles.get(sample_name)
+        if handle is None:
+            file_path = self.file_paths.get(sample_name)
+            if file_path and os.path.exists(file_path):
+                handle = self.handles[sample_name] = self.store.put_file(file_path, label=sample_name)
+        return handle
+
+    def read_sample(self, sample_name):
+        """Returns (audio, sample_rate) of a sample as a read-only float32 buffer."""
+        handle = self.sample_handle(sample_name)
+        if handle is None:
+            raise KeyError(f"Sample {sample_name} not found")
+        return self.store.get(handle)
+
+    def backing_file(self, sample_name):
+        """A file holding exactly this sample (its own file or the unchanged file it was imported from), or None."""
+        handle = self.sample_handle(sample_name)
+        return self.store.backing_file(handle) if handle is not None else None
+
+    def write_sample(self, sample_name, file_path):
+        """Writes a sample to file_path, the only point where an in-memory sample touches the disk."""
+        handle = self.sample_handle(sample_name)
+        if handle is None:
+            raise KeyError(f"Sample {sample_name} not found")
+        return self.store.write(handle, file_path)
+
     def rename_sample(self, original_name, new_name):
-        """Renames the sample in the temp folder and updates internal references."""
+        """Renames the sample (and its file in the temp folder, if it has one) and updates internal references."""
         original_file = os.path.join(self.temp_folder, original_name)
         new_file_path = os.path.join(self.temp_folder, new_name)
+        in_memory = self.in_memory(original_name)
 
-        if os.path.exists(original_file):
-            # Rename the file in the temp folder
-            os.rename(original_file, new_file_path)
+        if in_memory or os.path.exists(original_file):
+            if not in_memory:
+                # Rename the file in the temp folder
+                os.rename(original_file, new_file_path)
+                self.samples = [new_file_path if path == original_file else path for path in self.samples]
+                self.file_paths[new_name] = new_file_path  # Update the path to reflect the new name in the temp folder
+                if original_name in self.handles:
+                    self.store.relocate(self.handles[original_name], new_file_path)
+            if original_name in self.handles:
+                self.handles[new_name] = self.handles.pop(original_name)
 
             # Update all references to the new name
             self.file_reference[new_name] = self.file_reference.pop(original_name)
+            self.tags[new_name] = self.tags.pop(original_name, "")
             self.sample_new_names[new_name] = new_name
-            self.file_paths[new_name] = new_file_path  # Update the path to reflect the new name in the temp folder
 
             # Remove the old reference from file_paths and sample_new_names
             self.file_paths.pop(original_name, None)
@@ -84,11 +204,111 @@ class SampleListManager:
         else:
             print(f"Error: {original_name} not found in temp folder.")
 
+    @traced("list.rename_samples")
+    def rename_samples(self, plan):
+        """
+        Renames many samples as one transaction and writes the tag file once.
+
+        :param plan: {current name: new name}, e.g. from RenamePlanner.plan. New names must be unique.
+        Files are first moved to temporary names and then to their targets, so swaps and cycles
+        work. The steps are journaled; on any error every file is moved back and the internal
+        references are left untouched. In-memory samples only change their name.
+        """
+        plan = {old: new for old, new in plan.items()
+                if old != new and (old in self.file_paths or old in self.handles)}
+        if not plan:
+            return {}
+
+        # Name collisions with samples that aren't being renamed, or other files, would be overwritten
+        staying = {name.casefold() for name in self.sample_new_names if name not in plan}
+        clashes = [new for new in plan.values() if new.casefold() in staying]
+        if clashes:
+            raise ValueError(f"Rename targets already used by other samples: {clashes[:10]}")
+
+        file_plan = {old: new for old, new in plan.items() if old in self.file_paths}
+        steps = []
+        sources = {os.path.normcase(self.file_paths[old]) for old in file_plan}
+        for i, (old, new) in enumerate(file_plan.items()):
+            source = self.file_paths[old]
+            folder = os.path.dirname(source)
+            target = os.path.join(folder, new)
+            if os.path.exists(target) and os.path.normcase(target) not in sources:
+                raise ValueError(f"Rename target {target} already exists")
+            steps.append([source, os.path.join(folder, f".renaming_{i}"), target])
+
+        if steps:
+            self.write_rename_journal(1, steps)
+
+        moved = []  # (from, to) of every completed move, undone in reverse on failure
+        try:
+            for source, temp, _ in steps:
+                os.rename(source, temp)
+                moved.append((source, temp))
+            if steps:
+                self.write_rename_journal(2, steps)
+            for _, temp, target in steps:
+                os.rename(temp, target)
+                moved.append((temp, target))
+        except OSError as e:
+            for origin, current in reversed(moved):
+                os.rename(current, origin)
+            os.remove(self.rename_journal_path)
+            print(f"Error renaming samples, all renames rolled back: {e}")
+            raise
+
+        # Files are in place, now update every reference in one go, keeping the list order
+        targets = {old: target for old, (_, _, target) in zip(file_plan, steps)}
+        for old, target in targets.items():
+            if old in self.handles:
+                self.store.relocate(self.handles[old], target)
+        self.file_reference = {plan.get(name, name): ref for name, ref in self.file_reference.items()}
+        self.tags = {plan.get(name, name): tag for name, tag in self.tags.items()}
+        self.sample_new_names = {plan.get(name, name): plan.get(name, name) for name in self.sample_new_names}
+        self.file_paths = {plan.get(name, name): targets.get(name, path) for name, path in self.file_paths.items()}
+        self.handles = {plan.get(name, name): handle for name, handle in self.handles.items()}
+        # In-memory samples are in the list by handle, which a rename doesn't change
+        new_paths = {source: target for source, _, target in steps}
+        self.samples = [new_paths.get(sample, sample) for sample in self.samples]
+
+        self.update_tag_file()
+        if steps:
+            os.remove(self.rename_journal_path)
+        return plan
+
+    def write_rename_journal(self, phase, steps):
+        """Records which phase of a bulk rename is running and its (source, temp, target) steps."""
+        with open(self.rename_journal_path, 'w') as f:
+            json.dump({"phase": phase, "steps": steps}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def recover_rename_journal(self):
+        """Moves files back to their original names if a bulk rename was interrupted."""
+        if not os.path.exists(self.rename_journal_path):
+            return
+
+        with open(self.rename_journal_path, 'r') as f:
+            journal = json.load(f)
+        steps = journal["steps"]
+
+        # In phase 2 a step without its temp file already reached its target, take it back to temp first
+        if journal["phase"] == 2:
+            for _, temp, target in steps:
+                if not os.path.exists(temp) and os.path.exists(target):
+                    os.rename(target, temp)
+        for source, temp, _ in steps:
+            if os.path.exists(temp):
+                os.rename(temp, source)
+
+        os.remove(self.rename_journal_path)
+        print(f"Rolled back an interrupted rename of {len(steps)} samples")
+
     def update_tag(self, sample_name, new_tag):
         """Updates the tag for a given sample."""
         self.tags[sample_name] = new_tag  # Update the tag for the sample
         self.update_tag_file()
 
+    @traced("list.update_tag_file")
     def update_tag_file(self):
         """Updates the tag file with the latest sample and tag information."""
         with open(self.tag_file_path, 'w') as f:
@@ -96,21 +316,61 @@ class SampleListManager:
                 tag = self.tags.get(sample_name, "")  # Get tag or empty if not set
                 f.write(f"{sample_name},{tag}\n")  # Write sample name and tag
 
-    def play_sample(self, sample_name):
-        """Plays the sample given its name."""
-        # Look for the sample name in file_paths (which should have the temp folder path)
+    def get_content_hash(self, sample_name):
+        """Returns the content hash of a sample, rehashing only if the file changed since last time."""
+        if self.in_memory(sample_name):
+            return self.store.digest(self.handles[sample_name])
+
         full_path = self.file_paths.get(sample_name)
-        if full_path and os.path.exists(full_path):
-            wave_obj = sa.WaveObject.from_wave_file(full_path)
-            play_obj = wave_obj.play()
-            return play_obj
-        return None
+        if not full_path or not os.path.exists(full_path):
+            return None
+
+        stat = os.stat(full_path)
+        memo = self._hash_memo.get(full_path)
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+
+        digest = content_hash(full_path)
+        self._hash_memo[full_path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def get_analysis(self, sample_name, kind):
+        """Returns the cached analysis result of the given kind for a sample, or None."""
+        digest = self.get_content_hash(sample_name)
+        if digest is None:
+            return None
+        return self.analysis.get(digest, {}).get(kind)
+
+    def store_analysis(self, sample_name, kind, result, flush=True):
+        """Caches an analysis result for the current contents of a sample."""
+        digest = self.get_content_hash(sample_name)
+        if digest is None:
+            return
+        self.analysis.setdefault(digest, {})[kind] = result
+        if flush:
+            self.update_analysis_file()
+
+    def update_analysis_file(self):
+        """Writes the analysis cache next to the tag file."""
+        with open(self.analysis_file_path, 'w') as f:
+            json.dump(self.analysis, f)
+
+    def play_sample(self, sample_name):
+        """Plays the sample given its name, from memory."""
+        handle = self.sample_handle(sample_name)
+        if handle is None:
+            return None
+        audio, sample_rate = self.store.get(handle)
+        return play(audio, sample_rate)
                 
     def clear_list(self):
         """Clears the list of samples and deletes all temporary files."""
         self.samples.clear()
         self.file_reference.clear()
         self.sample_new_names.clear()
+        for handle in self.handles.values():
+            self.store.discard(handle)
+        self.handles.clear()
 
         # Remove files in temp folder
         if os.path.exists(self.temp_folder):
@@ -138,16 +398,18 @@ class SampleListManager:
                 elif pack_name_position == "suffix":
                     final_name = f"{new_name}_{pack_name}"
 
-            original_file = self.file_paths[original_name]
             new_file_path = os.path.join(save_dir, final_name)
 
             try:
-                shutil.copy(original_file, new_file_path)
+                self.write_sample(original_name, new_file_path)
                 print(f"Saved {final_name} to {new_file_path}")
             except Exception as e:
                 print(f"Error saving {final_name}: {e}")
                 
     def cleanup_temp_folder(self):
-        """Deletes the temporary folder on exit."""
+        """Deletes the temporary folder and the in-memory samples on exit."""
+        for handle in self.handles.values():
+            self.store.discard(handle)
+        self.handles.clear()
         if os.path.exists(self.temp_folder):
             shutil.rmtree(self.temp_folder)
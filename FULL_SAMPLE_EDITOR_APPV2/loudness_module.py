@@ -0,0 +1,206 @@
+import os
+import csv
+import numpy as np
+import soundfile as sf
+from concurrent.futures import ThreadPoolExecutor
+from resample_module import oversampling_filter
+
+# ITU-R BS.1770 gating parameters
+BLOCK_DURATION = 0.4  # 400 ms gating blocks
+BLOCK_STEP = 0.1  # 75% overlap between blocks
+ABSOLUTE_GATE = -70.0  # LUFS
+RELATIVE_GATE = -10.0  # LU below the absolute-gated loudness
+
+# Channel weights for L, R, C, Ls, Rs (surround channels count 1.41x)
+CHANNEL_WEIGHTS = [1.0, 1.0, 1.0, 1.41, 1.41]
+
+# Upper bound on padded frames per batch, keeps a batch of long files from using too much memory
+BATCH_FRAMES = 2 ** 22
+
+
+def k_weighting_sos(sample_rate):
+    """Returns the BS.1770 K-weighting filter (shelf + high-pass) as second-order sections for any sample rate."""
+    # Stage 1: high shelf modelling the acoustic effect of the head
+    f0 = 1681.974450955533
+    gain_db = 3.999843853973347
+    q = 0.7071752369554196
+    k = np.tan(np.pi * f0 / sample_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = [
+        (vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+        1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0,
+    ]
+
+    # Stage 2: RLB high-pass
+    f0 = 38.13547087602444
+    q = 0.5003270373238773
+    k = np.tan(np.pi * f0 / sample_rate)
+    a0 = 1 + k / q + k * k
+    high_pass = [1.0, -2.0, 1.0, 1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0]
+
+    return np.array([shelf, high_pass])
+
+
+class LoudnessAnalyzer:
+    def __init__(self, workers=None, batch_frames=BATCH_FRAMES):
+        """Initializes the analyzer with the size of its worker pool."""
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_frames = batch_frames
+
+    def analyze_batch(self, clips, sample_rate):
+        """Measures integrated loudness and true peak for clips of equal rate and channel count in one pass.
+
+        Each clip is a (frames, channels) float32 array. Returns a list of dicts with
+        'lufs' and 'true_peak_db' (None when the clip is silent) and 'duration'.
+        """
+        from scipy import signal  # Deferred so importing the analyzer stays cheap at startup
+
+        channels = clips[0].shape[1]
+        lengths = np.array([len(clip) for clip in clips])
+        block = int(round(BLOCK_DURATION * sample_rate))
+        step = int(round(BLOCK_STEP * sample_rate))
+
+        # Stack into (clips, channels, frames), zero padded to the longest clip
+        max_frames = max(int(lengths.max()), block)
+        stacked = np.zeros((len(clips), channels, max_frames), dtype=np.float32)
+        for i, clip in enumerate(clips):
+            stacked[i, :, :len(clip)] = clip.T
+
+        # True peak from 4x oversampling, before the K-weighting filter
+        upsampled = signal.resample_poly(stacked, 4, 1, axis=-1, window=oversampling_filter(4))
+        # Largest magnitude from the max and min, np.abs would make another copy of the oversampled batch
+        true_peaks = np.maximum(upsampled.max(axis=(1, 2)), -upsampled.min(axis=(1, 2)))
+        del upsampled
+
+        # float32 coefficients keep the filtered copy float32 instead of promoting it to float64
+        filtered = signal.sosfilt(k_weighting_sos(sample_rate).astype(np.float32), stacked, axis=-1)
+        del stacked
+        np.square(filtered, out=filtered)
+
+        num_blocks = (max_frames - block) // step + 1
+        starts = np.arange(num_blocks) * step
+        if block == 4 * step:
+            # Sum squares per 100 ms step in float64, each 400 ms block is then four neighbouring steps
+            num_steps = num_blocks + 3
+            steps = filtered[..., :num_steps * step].reshape(len(clips), channels, num_steps, step)
+            step_sums = steps.sum(axis=-1, dtype=np.float64)
+            energies = (step_sums[..., :-3] + step_sums[..., 1:-2] + step_sums[..., 2:-1] + step_sums[..., 3:]) / block
+        else:
+            # Rates where the block isn't four whole steps: block sums from a float64 running sum
+            cumulative = np.zeros((len(clips), channels, max_frames + 1))
+            np.cumsum(filtered, axis=-1, dtype=np.float64, out=cumulative[..., 1:])
+            energies = (cumulative[..., starts + block] - cumulative[..., starts]) / block  # (clips, channels, blocks)
+        del filtered
+
+        # Blocks are valid if they end inside the clip; clips shorter than one block are measured as one block
+        valid = (starts[None, :] + block) <= np.maximum(lengths, block)[:, None]
+        short = lengths < block
+        energies[short, :, 0] *= block / np.maximum(lengths[short], 1)[:, None]
+
+        weights = np.array((CHANNEL_WEIGHTS + [1.0] * channels)[:channels])
+        weighted = np.einsum('c,ncb->nb', weights, energies)
+        with np.errstate(divide='ignore'):
+            block_loudness = -0.691 + 10 * np.log10(weighted)
+
+        # Absolute then relative gate, both as masks over the (clips, blocks) grid
+        gate = valid & (block_loudness > ABSOLUTE_GATE)
+        relative = self._gated_loudness(weighted, gate) + RELATIVE_GATE
+        gate &= block_loudness > relative[:, None]
+        integrated = self._gated_loudness(weighted, gate)
+
+        results = []
+        for i in range(len(clips)):
+            results.append({
+                "lufs": float(integrated[i]) if np.isfinite(integrated[i]) else None,
+                "true_peak_db": float(20 * np.log10(true_peaks[i])) if true_peaks[i] > 0 else None,
+                "duration": float(lengths[i] / sample_rate),
+            })
+        return results
+
+    @staticmethod
+    def _gated_loudness(weighted, gate):
+        """Loudness of the mean weighted energy over the gated blocks of every clip."""
+        counts = gate.sum(axis=1)
+        mean_energy = np.where(gate, weighted, 0.0).sum(axis=1) / np.maximum(counts, 1)
+        with np.errstate(divide='ignore'):
+            loudness = -0.691 + 10 * np.log10(mean_energy)
+        return np.where(counts > 0, loudness, -np.inf)
+
+    def make_batches(self, entries):
+        """Groups (sample rate, channels, frames, key) entries into (sample rate, [key, ...]) batches.
+
+        Clips of a batch share a sample rate and channel count. Sorting by length inside a group
+        keeps padding waste low when the group is split into batches.
+        """
+        groups = {}
+        for sample_rate, channels, frames, key in entries:
+            groups.setdefault((sample_rate, channels), []).append((frames, key))
+
+        batches = []
+        for (sample_rate, _), group in groups.items():
+            group.sort(key=lambda entry: entry[0])
+            batch, batch_frames = [], 0
+            for frames, key in group:
+                if batch and (len(batch) + 1) * max(frames, batch_frames) > self.batch_frames:
+                    batches.append((sample_rate, batch))
+                    batch, batch_frames = [], 0
+                batch.append(key)
+                batch_frames = max(batch_frames, frames)
+            if batch:
+                batches.append((sample_rate, batch))
+        return batches
+
+    def run_batches(self, batches, read):
+        """Measures every batch on the worker pool, read(key) returns the (frames, channels) clip."""
+        def run(batch):
+            sample_rate, keys = batch
+            return dict(zip(keys, self.analyze_batch([read(key) for key in keys], sample_rate)))
+
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for batch_results in executor.map(run, batches):
+                results.update(batch_results)
+        return results
+
+    def analyze_files(self, file_paths):
+        """Measures many files, batching those that share a sample rate and channel count."""
+        entries = []
+        for file_path in file_paths:
+            info = sf.info(file_path)
+            entries.append((info.samplerate, info.channels, info.frames, file_path))
+        return self.run_batches(self.make_batches(entries),
+                                lambda path: sf.read(path, dtype='float32', always_2d=True)[0])
+
+    def analyze_buffers(self, buffers):
+        """Measures in-memory clips given as {key: (audio, sample_rate)}, batched like analyze_files."""
+        clips = {key: (audio.reshape(len(audio), -1), sample_rate) for key, (audio, sample_rate) in buffers.items()}
+        entries = [(sample_rate, clip.shape[1], len(clip), key) for key, (clip, sample_rate) in clips.items()]
+        return self.run_batches(self.make_batches(entries), lambda key: clips[key][0])
+
+    def analyze_pack(self, sample_manager):
+        """Measures every sample in a SampleListManager, reusing results cached by content hash."""
+        missing = {}
+        for sample_name in sample_manager.get_sample_names():
+            if sample_manager.get_analysis(sample_name, "loudness") is None:
+                missing[sample_name] = sample_manager.read_sample(sample_name)
+
+        if missing:
+            for sample_name, result in self.analyze_buffers(missing).items():
+                sample_manager.store_analysis(sample_name, "loudness", result, flush=False)
+            sample_manager.update_analysis_file()
+
+        return {name: sample_manager.get_analysis(name, "loudness") for name in sample_manager.get_sample_names()}
+
+    def write_report(self, results, report_path):
+        """Writes a QC report with one row per sample, loudest first."""
+        rows = sorted(results.items(), key=lambda item: -(item[1]["lufs"] if item[1]["lufs"] is not None else -np.inf))
+        with open(report_path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["sample", "integrated_lufs", "true_peak_dbtp", "duration_s"])
+            for name, result in rows:
+                lufs = f"{result['lufs']:.2f}" if result["lufs"] is not None else "silent"
+                true_peak = f"{result['true_peak_db']:.2f}" if result["true_peak_db"] is not None else "silent"
+                writer.writerow([name, lufs, true_peak, f"{result['duration']:.3f}"])
+        print(f"Loudness report written to {report_path}")
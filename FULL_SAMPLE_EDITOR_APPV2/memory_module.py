@@ -0,0 +1,207 @@
+import os
+import time
+import weakref
+import threading
+import contextlib
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+from buffer_module import decode
+
+# Budget in MB for decoded audio, defaults to half of the physical memory
+MEMORY_BUDGET_ENV = "SAMPLE_EDITOR_MEMORY_MB"
+
+
+class MemoryBudgetError(MemoryError):
+    """Raised when a buffer doesn't fit in the budget even after evicting everything evictable."""
+
+
+def physical_memory():
+    """Total physical memory in bytes, or None where the platform doesn't report it."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_limit():
+    """Budget from SAMPLE_EDITOR_MEMORY_MB, else half of physical memory, else 2 GB."""
+    if os.environ.get(MEMORY_BUDGET_ENV):
+        return int(float(os.environ[MEMORY_BUDGET_ENV]) * 2 ** 20)
+    total = physical_memory()
+    return total // 2 if total else 2 * 2 ** 30
+
+
+def decoded_size(file_path, mono=False, dtype=np.float32):
+    """Bytes a file takes once decoded, from its header only."""
+    info = sf.info(file_path)
+    channels = 1 if mono else info.channels
+    return info.frames * channels * np.dtype(dtype).itemsize
+
+
+class BufferEntry:
+    def __init__(self, entry_id, nbytes, owner, label, on_evict):
+        self.id = entry_id
+        self.nbytes = nbytes
+        self.owner = owner
+        self.label = label
+        self.on_evict = on_evict  # Called to drop the buffer, None if the owner can't give it up
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+
+class MemoryBudget:
+    def __init__(self, limit=None):
+        """Keeps track of every registered decoded buffer and keeps their total under limit bytes."""
+        self.limit = limit if limit is not None else default_limit()
+        self.entries = {}
+        self.used = 0
+        self.peak = 0
+        self._next_id = 0
+        self._lock = threading.RLock()
+
+    def register(self, array, owner, label="", on_evict=None):
+        """Registers a buffer, making room first. It is released when the array is garbage collected.
+
+        on_evict, if given, makes the buffer evictable: the budget calls it to ask the owner to drop it.
+        Returns the entry, pass it to touch() on use so eviction is least recently used first.
+        """
+        nbytes = int(array.nbytes)
+        with self._lock:
+            self.ensure(nbytes)
+            entry = BufferEntry(self._next_id, nbytes, owner, label, on_evict)
+            self._next_id += 1
+            self._add(entry)
+        weakref.finalize(array, self.release, entry)
+        return entry
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes, owner, label=""):
+        """Holds nbytes of the budget for a transient buffer for the duration of the block."""
+        with self._lock:
+            self.ensure(nbytes)
+            entry = BufferEntry(self._next_id, int(nbytes), owner, label, None)
+            self._next_id += 1
+            self._add(entry)
+        try:
+            yield entry
+        finally:
+            self.release(entry)
+
+    def ensure(self, nbytes):
+        """Evicts least recently used evictable buffers until nbytes fit, or raises MemoryBudgetError."""
+        with self._lock:
+            if self.used + nbytes <= self.limit:
+                return
+            evictable = sorted((e for e in self.entries.values() if e.on_evict), key=lambda e: e.last_used)
+            for entry in evictable:
+                if self.used + nbytes <= self.limit:
+                    break
+                # The bytes come back once the array is actually freed, an owner elsewhere may still hold it
+                on_evict, entry.on_evict = entry.on_evict, None
+                on_evict()
+            if self.used + nbytes > self.limit:
+                raise MemoryBudgetError(
+                    f"{nbytes / 2 ** 20:.1f} MB needed but only {(self.limit - self.used) / 2 ** 20:.1f} MB of the "
+                    f"{self.limit / 2 ** 20:.0f} MB budget is free; close the loaded audio or raise "
+                    f"{MEMORY_BUDGET_ENV}")
+
+    def touch(self, entry):
+        entry.last_used = time.monotonic()
+
+    def release(self, entry):
+        """Returns a buffer's bytes to the budget, safe to call more than once."""
+        with self._lock:
+            if self.entries.pop(entry.id, None) is not None:
+                self.used -= entry.nbytes
+
+    def _add(self, entry):
+        self.entries[entry.id] = entry
+        self.used += entry.nbytes
+        self.peak = max(self.peak, self.used)
+
+    def usage_by_owner(self):
+        """Returns {owner: (buffers, bytes)} of what is registered right now."""
+        usage = {}
+        with self._lock:
+            for entry in self.entries.values():
+                count, nbytes = usage.get(entry.owner, (0, 0))
+                usage[entry.owner] = (count + 1, nbytes + entry.nbytes)
+        return usage
+
+    def format_report(self):
+        """Formats current and peak usage and the breakdown per owner."""
+        lines = [f"decoded audio: {self.used / 2 ** 20:.1f} MB used, {self.peak / 2 ** 20:.1f} MB peak, "
+                 f"{self.limit / 2 ** 20:.0f} MB budget"]
+        for owner, (count, nbytes) in sorted(self.usage_by_owner().items(), key=lambda item: -item[1][1]):
+            lines.append(f"  {owner:<28}{count:>6} buffers {nbytes / 2 ** 20:>10.1f} MB")
+        return "\n".join(lines)
+
+
+_budget = None
+
+
+def get_budget():
+    """The budget shared by the whole process, created on first use."""
+    global _budget
+    if _budget is None:
+        _budget = MemoryBudget()
+    return _budget
+
+
+class DecodedAudioCache:
+    def __init__(self, budget=None):
+        """LRU cache of decoded files whose entries the budget evicts when room is needed."""
+        self.budget = budget or get_budget()
+        self._entries = OrderedDict()  # (path, mono) -> (audio, sample_rate, stamp, budget entry)
+        self._lock = threading.Lock()
+
+    def load(self, file_path, mono=False):
+        """Returns (audio, sample_rate) as float32, decoding only if the file isn't cached or changed on disk.
+
+        Mono averages the channels like librosa.load does. Raises MemoryBudgetError before decoding
+        when the file can't fit in the budget.
+        """
+        key = (os.path.abspath(file_path), mono)
+        stat = os.stat(file_path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[2] == stamp:
+                self._entries.move_to_end(key)
+                self.budget.touch(cached[3])
+                return cached[0], cached[1]
+            self._entries.pop(key, None)
+
+        # Make room before decoding, so an oversized file fails here instead of swapping.
+        # The interleaved decode is held while it is mixed down to mono.
+        with self.budget.reserve(decoded_size(file_path), "decode", os.path.basename(file_path)):
+            audio, sample_rate = decode(file_path, mono)
+        audio.flags.writeable = False  # Shared between callers, nobody may modify it in place
+
+        entry = self.budget.register(audio, "decoded_cache", os.path.basename(file_path),
+                                     on_evict=lambda: self.evict(key))
+        with self._lock:
+            self._entries[key] = (audio, sample_rate, stamp, entry)
+        return audio, sample_rate
+
+    def evict(self, key):
+        """Drops an entry, arrays still referenced elsewhere stay alive but leave the cache."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_decoded_cache = None
+
+
+def get_decoded_cache():
+    """The decoded-audio cache shared by the whole process."""
+    global _decoded_cache
+    if _decoded_cache is None:
+        _decoded_cache = DecodedAudioCache()
+    return _decoded_cache
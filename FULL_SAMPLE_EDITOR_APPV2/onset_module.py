@@ -0,0 +1,123 @@
+import functools
+import numpy as np
+
+from spectrogram_module import N_FFT, HOP_LENGTH, stft_window, num_frames
+from trace_module import span
+
+BLOCK_FRAMES = 256  # STFT frames transformed per block, the working buffers are sized for this
+BANDS_PER_OCTAVE = 24  # Resolution of the log-spaced bands the flux is taken over
+MIN_FREQUENCY = 27.5  # Lowest band edge in Hz, the bins below it form one band
+LOG_GAMMA = 10.0  # Log compression log(1 + gamma * |X|), higher compresses more
+WHITEN_DECAY = 5.0  # Seconds for a band's peak memory to fall by 60 dB in adaptive whitening
+WHITEN_FLOOR = 1e-3  # Magnitude below which bands aren't whitened, so silence isn't boosted to full scale
+
+
+@functools.lru_cache(maxsize=8)
+def band_edges(n_fft, sample_rate, bands_per_octave=BANDS_PER_OCTAVE):
+    """First rfft bin of every log-spaced band, for np.add.reduceat. Narrow low bands collapse into single bins."""
+    bins = n_fft // 2 + 1
+    octaves = np.log2(sample_rate / 2 / MIN_FREQUENCY)
+    frequencies = MIN_FREQUENCY * 2 ** (np.arange(int(octaves * bands_per_octave) + 1) / bands_per_octave)
+    edges = np.unique(np.round(frequencies * n_fft / sample_rate).astype(np.int64).clip(1, bins - 1))
+    edges = np.concatenate(([0], edges))
+    edges.flags.writeable = False
+    return edges
+
+
+class SpectralFluxDetector:
+    def __init__(self, n_fft=N_FFT, hop_length=HOP_LENGTH, log_compression=True, whitening=False,
+                 block_frames=BLOCK_FRAMES):
+        """
+        Lean onset strength: half-wave rectified spectral flux of a float32 magnitude STFT, summed
+        into log-spaced bands.
+
+        Frames are centred like librosa.stft and the envelope is aligned like
+        librosa.onset.onset_strength, so the same peak picking finds onsets in the same places.
+        The audio is transformed block_frames at a time into buffers allocated once, with the
+        cached window and scipy.fft's float32 rfft, whose plan is built once per size and then
+        reused for every block. Compression, whitening and the flux work on the few bands rather
+        than every bin; no mel filterbank or full-length STFT is ever built.
+
+        :param log_compression: Compresses magnitudes with log(1 + LOG_GAMMA * |X|) before the flux.
+        :param whitening: Adaptive whitening (Stowell & Plumbley), divides every band by a decaying
+            peak of its own recent magnitude, so quiet hits after loud ones still stand out.
+        """
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.log_compression = log_compression
+        self.whitening = whitening
+        self.block_frames = block_frames
+
+    def strength(self, read, num_samples, sample_rate):
+        """
+        Onset strength envelope, one float32 value per STFT frame.
+
+        read(start, stop) returns the mono float32 samples [start, stop), like the spectrogram's reader.
+        """
+        from scipy import fft
+
+        n_fft, hop, block = self.n_fft, self.hop_length, self.block_frames
+        total = num_frames(num_samples, hop)
+        window = stft_window(n_fft)
+        edges = band_edges(n_fft, int(sample_rate))
+        bands = len(edges)
+        decay = np.float32(10 ** (-3 / (WHITEN_DECAY * sample_rate / hop)))
+
+        # Working buffers for one block, reused for every block
+        samples = np.zeros((block - 1) * hop + n_fft, dtype=np.float32)
+        frames = np.empty((block, n_fft), dtype=np.float32)
+        spectrum = np.empty((block, n_fft // 2 + 1), dtype=np.float32)
+        magnitude = np.zeros((block + 1, bands), dtype=np.float32)  # Row 0 is the last frame of the previous block
+        difference = np.empty((block, bands), dtype=np.float32)
+        peak = np.zeros(bands, dtype=np.float32)
+        decay_up = decay ** -np.arange(block, dtype=np.float32)  # Undoes the decay within a block
+        decay_down = decay ** np.arange(block, dtype=np.float32)
+
+        flux = np.zeros(total, dtype=np.float32)
+        with span("onset.spectral_flux", frames=total) as stage:
+            for first in range(0, total, block):
+                count = min(block, total - first)
+                start = first * hop - n_fft // 2
+                stop = start + (count - 1) * hop + n_fft
+                samples.fill(0)
+                read_start, read_stop = max(start, 0), min(stop, num_samples)
+                if read_stop > read_start:
+                    samples[read_start - start:read_stop - start] = read(read_start, read_stop)
+
+                np.multiply(np.lib.stride_tricks.sliding_window_view(samples, n_fft)[::hop][:count], window,
+                            out=frames[:count])
+                np.abs(fft.rfft(frames[:count], axis=1, overwrite_x=True), out=spectrum[:count])
+                current = magnitude[1:count + 1]
+                np.add.reduceat(spectrum[:count], edges, axis=1, out=current)
+
+                if self.whitening:
+                    # peak[t] = max(|X[t]|, decay * peak[t - 1]), unrolled over the block as a running
+                    # maximum of |X| scaled up by the decay, then scaled back down
+                    scaled = np.multiply(current, decay_up[:count, None], out=difference[:count])
+                    np.maximum(scaled[0], decay * peak, out=scaled[0])
+                    np.maximum.accumulate(scaled, axis=0, out=scaled)
+                    scaled *= decay_down[:count, None]
+                    peak[:] = scaled[count - 1]
+                    current /= np.maximum(scaled, WHITEN_FLOOR, out=scaled)
+                if self.log_compression:
+                    current *= LOG_GAMMA
+                    np.log1p(current, out=current)
+
+                # Rectified rise of every band over the frame before it, averaged over the bands
+                rise = np.subtract(current, magnitude[:count], out=difference[:count])
+                np.maximum(rise, 0, out=rise)
+                flux[first:first + count] = rise.mean(axis=1)
+                if first == 0:
+                    flux[0] = 0  # The first frame has nothing before it
+                magnitude[0] = magnitude[count]
+            stage.add(samples=num_samples)
+
+        # Delay by the lag and half a window like librosa.onset.onset_strength(center=True)
+        pad = 1 + n_fft // (2 * hop)
+        envelope = np.zeros(total, dtype=np.float32)
+        envelope[pad:] = flux[1:total - pad + 1]
+        return envelope
+
+    def strength_of(self, audio, sample_rate):
+        """Onset strength envelope of a decoded mono float32 buffer."""
+        return self.strength(lambda start, stop: audio[start:stop], len(audio), sample_rate)
@@ -0,0 +1,159 @@
+import numpy as np
+import soundfile as sf
+
+PEAK_BLOCK = 256  # Samples per bucket in the finest level
+PEAK_FACTOR = 4  # Each level has a quarter of the buckets of the one below
+MIN_BUCKETS = 1024  # Coarsest level kept, enough for a full-width overview
+READ_BLOCKS = 4096  # Finest-level buckets decoded per read when building from a file
+
+
+def reduce_level(mins, maxs, factor=PEAK_FACTOR):
+    """Merges every factor neighbouring buckets into one, the last bucket may cover fewer."""
+    pad = -len(mins) % factor
+    if pad:
+        mins = np.concatenate((mins, np.full(pad, np.inf, dtype=np.float32)))
+        maxs = np.concatenate((maxs, np.full(pad, -np.inf, dtype=np.float32)))
+    return mins.reshape(-1, factor).min(axis=1), maxs.reshape(-1, factor).max(axis=1)
+
+
+def block_peaks(audio, block=PEAK_BLOCK):
+    """Min and max of every block samples of a mono float32 buffer."""
+    full = len(audio) // block
+    mins = np.empty(full + (len(audio) % block > 0), dtype=np.float32)
+    maxs = np.empty_like(mins)
+    if full:
+        blocks = audio[:full * block].reshape(full, block)
+        blocks.min(axis=1, out=mins[:full])
+        blocks.max(axis=1, out=maxs[:full])
+    if len(mins) > full:
+        mins[-1] = audio[full * block:].min()
+        maxs[-1] = audio[full * block:].max()
+    return mins, maxs
+
+
+class PeakPyramid:
+    def __init__(self, levels, sample_rate, num_samples, block=PEAK_BLOCK, factor=PEAK_FACTOR):
+        """
+        Min/max waveform overview at several zoom levels, small enough to keep for hour-long sources.
+
+        :param levels: [(mins, maxs), ...] float32, level i has one bucket per block * factor**i samples.
+        """
+        self.levels = levels
+        self.sample_rate = sample_rate
+        self.num_samples = num_samples
+        self.block = block
+        self.factor = factor
+
+    @classmethod
+    def from_level(cls, mins, maxs, sample_rate, num_samples):
+        """Builds the coarser levels on top of the finest one."""
+        levels = [(mins, maxs)]
+        while len(levels[-1][0]) > MIN_BUCKETS:
+            levels.append(reduce_level(*levels[-1]))
+        return cls(levels, sample_rate, num_samples)
+
+    @classmethod
+    def from_audio(cls, audio, sample_rate):
+        """Builds the pyramid of a decoded mono buffer."""
+        return cls.from_level(*block_peaks(audio), sample_rate, len(audio))
+
+    @classmethod
+    def from_file(cls, file_path):
+        """Builds the pyramid while streaming the file, never holding more than one read block decoded."""
+        info = sf.info(file_path)
+        mins, maxs = [], []
+        for block in sf.blocks(file_path, blocksize=PEAK_BLOCK * READ_BLOCKS, dtype='float32', always_2d=True):
+            block_mins, block_maxs = block_peaks(block.mean(axis=1, dtype=np.float32) if block.shape[1] > 1
+                                                 else block[:, 0])
+            mins.append(block_mins)
+            maxs.append(block_maxs)
+        empty = np.zeros(0, dtype=np.float32)
+        return cls.from_level(np.concatenate(mins) if mins else empty, np.concatenate(maxs) if maxs else empty,
+                              info.samplerate, info.frames)
+
+    @property
+    def duration(self):
+        return self.num_samples / self.sample_rate
+
+    def envelope(self, start_time=0.0, end_time=None, max_points=4000):
+        """
+        Returns (times, values) for plotting [start_time, end_time], each bucket as its min and max.
+
+        Picks the finest level that stays within max_points values, so zooming in shows more detail
+        without ever touching the audio.
+        """
+        end_time = self.duration if end_time is None else end_time
+        for level, (mins, maxs) in enumerate(self.levels):
+            bucket = self.block * self.factor ** level
+            first = max(0, int(start_time * self.sample_rate) // bucket)
+            last = min(len(mins), -(-int(end_time * self.sample_rate) // bucket))
+            if (last - first) * 2 <= max_points or level == len(self.levels) - 1:
+                break
+
+        count = max(0, last - first)
+        values = np.empty(count * 2, dtype=np.float32)
+        values[0::2] = mins[first:last]
+        values[1::2] = maxs[first:last]
+        times = np.repeat((np.arange(first, first + count, dtype=np.float64) * bucket / self.sample_rate)
+                          .astype(np.float32), 2)
+        times[1::2] += np.float32(bucket / 2 / self.sample_rate)
+        return times, values
+
+    def columns(self, start_time, end_time, count, audio=None):
+        """
+        Returns (mins, maxs) for count pixel columns spanning [start_time, end_time], NaN where a
+        column lies outside the audio.
+
+        Uses the coarsest level whose buckets are no wider than a column, so the work depends on the
+        view width, not on the zoom. Zoomed in further than the finest level, decoded audio (if given)
+        is reduced per column directly, otherwise each column shows its bucket.
+        """
+        samples_per_column = (end_time - start_time) * self.sample_rate / count
+        level = 0
+        while level + 1 < len(self.levels) and self.block * self.factor ** (level + 1) <= samples_per_column:
+            level += 1
+        bucket = self.block * self.factor ** level
+        if audio is not None and samples_per_column < self.block:
+            source_mins = source_maxs = audio
+            bucket = 1
+        else:
+            source_mins, source_maxs = self.levels[level]
+
+        # Bucket index where every column starts, columns narrower than a bucket repeat it
+        edges = np.linspace(start_time * self.sample_rate / bucket, end_time * self.sample_rate / bucket, count + 1)
+        starts = np.floor(edges[:-1]).astype(np.int64)
+        inside = (starts >= 0) & (starts < len(source_mins))
+        mins = np.full(count, np.nan, dtype=np.float32)
+        maxs = np.full(count, np.nan, dtype=np.float32)
+        if not inside.any():
+            return mins, maxs
+        first, last = np.flatnonzero(inside)[[0, -1]]
+
+        # reduceat reduces from each index up to the next one, so close the last column at its own end
+        unique_starts, positions = np.unique(starts[first:last + 1], return_inverse=True)
+        end = min(max(int(np.ceil(edges[last + 1])), unique_starts[-1] + 1), len(source_mins))
+        indices = np.append(unique_starts, end) if end < len(source_mins) else unique_starts
+        mins[first:last + 1] = np.minimum.reduceat(source_mins, indices)[:len(unique_starts)][positions]
+        maxs[first:last + 1] = np.maximum.reduceat(source_maxs, indices)[:len(unique_starts)][positions]
+        return mins, maxs
+
+    def to_arrays(self, prefix="peaks"):
+        """Flattens the pyramid into named arrays for np.savez."""
+        arrays = {f"{prefix}_info": np.array([self.sample_rate, self.num_samples, self.block, self.factor],
+                                             dtype=np.int64)}
+        for level, (mins, maxs) in enumerate(self.levels):
+            arrays[f"{prefix}_{level}_min"] = mins
+            arrays[f"{prefix}_{level}_max"] = maxs
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix="peaks"):
+        """Rebuilds a pyramid saved with to_arrays, or returns None if there is none."""
+        if f"{prefix}_info" not in arrays:
+            return None
+        sample_rate, num_samples, block, factor = (int(value) for value in arrays[f"{prefix}_info"])
+        levels = []
+        while f"{prefix}_{len(levels)}_min" in arrays:
+            level = len(levels)
+            levels.append((arrays[f"{prefix}_{level}_min"], arrays[f"{prefix}_{level}_max"]))
+        return cls(levels, sample_rate, num_samples, block, factor)
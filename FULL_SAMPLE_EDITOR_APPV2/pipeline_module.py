@@ -0,0 +1,303 @@
+import os
+import time
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from trace_module import span
+from buffer_module import encode
+from store_module import read_file, output_subtype
+from export_plan_module import ExportPlanner, PROCESS, HARDLINK, link_or_copy, summarize
+
+QUEUE_SIZE = 8  # Items waiting between two stages before the upstream stage has to wait
+IO_WORKERS = 4  # Default concurrency of a disk-bound stage
+
+
+class Stage:
+    def __init__(self, name, func, kind="cpu", concurrency=None):
+        """
+        One step of a pipeline, func(item) -> item run on the pool matching its kind.
+
+        :param kind: "cpu" stages run in spawned worker processes, so func and the items must be picklable
+            (a module-level function, optionally bound with functools.partial). "io" stages run in threads.
+        :param concurrency: Items processed at the same time, defaults to the CPU count or IO_WORKERS.
+        """
+        if kind not in ("cpu", "io"):
+            raise ValueError(f"Unknown stage kind: {kind}")
+        self.name = name
+        self.func = func
+        self.kind = kind
+        self.concurrency = concurrency or ((os.cpu_count() or 1) if kind == "cpu" else IO_WORKERS)
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=QUEUE_SIZE):
+        """
+        Runs items through stages connected by bounded queues.
+
+        Each stage pulls from its own queue and blocks on the next one when it is full, so a slow
+        stage (a busy disk, say) throttles the stages before it instead of letting decoded audio pile
+        up in memory. CPU stages share a process pool and IO stages a thread pool, sized to the sum
+        of their stages' concurrency (the process pool capped at the CPU count). Worker processes
+        are spawned, a forked child would inherit the app's Qt state, audio threads and held locks.
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = {}
+
+    def run(self, items, progress=None):
+        """Runs the pipeline to completion, see run_async."""
+        return asyncio.run(self.run_async(items, progress))
+
+    async def run_async(self, items, progress=None):
+        """
+        Feeds items (dicts) through every stage.
+
+        :param progress: Called as progress(stage name, item) after each finished stage of an item.
+        :return: (results, errors). Results are the finished items in input order, errors are
+            (item, stage name, message) for items that failed, which skip the remaining stages.
+        """
+        loop = asyncio.get_running_loop()
+        cpu_workers = min(sum(stage.concurrency for stage in self.stages if stage.kind == "cpu"), os.cpu_count() or 1)
+        io_workers = sum(stage.concurrency for stage in self.stages if stage.kind == "io")
+        spawn = multiprocessing.get_context("spawn")
+        executors = {
+            "cpu": ProcessPoolExecutor(max_workers=cpu_workers, mp_context=spawn) if cpu_workers else None,
+            "io": ThreadPoolExecutor(max_workers=io_workers) if io_workers else None,
+        }
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results, errors = [], []
+        self.stats = {stage.name: {"items": 0, "busy": 0.0, "blocked": 0.0, "max_queue": 0} for stage in self.stages}
+        done = object()  # End-of-stream marker, one per worker of the receiving stage
+
+        async def feed():
+            for index, item in enumerate(items):
+                await queues[0].put((index, item))
+            for _ in range(self.stages[0].concurrency):
+                await queues[0].put(done)
+
+        async def worker(position, stage):
+            stats = self.stats[stage.name]
+            queue = queues[position]
+            next_queue = queues[position + 1] if position + 1 < len(queues) else None
+            while True:
+                stats["max_queue"] = max(stats["max_queue"], queue.qsize())
+                entry = await queue.get()
+                if entry is done:
+                    return
+                index, item = entry
+                start = time.perf_counter()
+                try:
+                    item = await loop.run_in_executor(executors[stage.kind], stage.func, item)
+                except Exception as e:
+                    errors.append((item, stage.name, f"{type(e).__name__}: {e}"))
+                    continue
+                finally:
+                    stats["busy"] += time.perf_counter() - start
+                stats["items"] += 1
+                if progress:
+                    progress(stage.name, item)
+
+                if next_queue is None:
+                    results.append((index, item))
+                else:
+                    # Time spent here is backpressure, the next stage can't keep up
+                    start = time.perf_counter()
+                    await next_queue.put((index, item))
+                    stats["blocked"] += time.perf_counter() - start
+
+        async def run_stage(position, stage):
+            await asyncio.gather(*(worker(position, stage) for _ in range(stage.concurrency)))
+            if position + 1 < len(self.stages):
+                for _ in range(self.stages[position + 1].concurrency):
+                    await queues[position + 1].put(done)
+
+        try:
+            with span("pipeline.run", items=len(items), stages=len(self.stages)):
+                await asyncio.gather(feed(), *(run_stage(i, stage) for i, stage in enumerate(self.stages)))
+        finally:
+            for executor in executors.values():
+                if executor:
+                    executor.shutdown()
+
+        results.sort(key=lambda entry: entry[0])
+        return [item for _, item in results], errors
+
+    def format_stats(self):
+        """Formats the per-stage counters of the last run, blocked is time spent waiting on a full queue."""
+        lines = [f"{'stage':<16}{'items':>7}{'busy s':>10}{'blocked s':>11}{'max queue':>11}"]
+        for name, stats in self.stats.items():
+            lines.append(f"{name:<16}{stats['items']:>7}{stats['busy']:>10.3f}{stats['blocked']:>11.3f}"
+                         f"{stats['max_queue']:>11}")
+        return "\n".join(lines)
+
+
+# Stage functions. Items are dicts, each stage returns the item it was given. Export items carry the
+# sample's store "handle" and, once read, its "audio" (float32), "sample_rate" and "subtype".
+
+def read_item(store, item):
+    """Fetches the sample's audio from the store, from memory unless it was spilled."""
+    audio, item["sample_rate"] = store.get(item["handle"])
+    item["audio"] = audio
+    item["subtype"] = store.info(item["handle"]).subtype
+    item["changed"] = False
+    return item
+
+
+def crop_item(silence_processor, item):
+    """Crops silence and applies the fades."""
+    item["audio"] = silence_processor.process_buffer(item["audio"], item["sample_rate"])
+    item["changed"] = True
+    item["measurement"] = None  # The audio changed, a loudness measurement of the original doesn't apply
+    return item
+
+
+def normalize_item(utility_processor, item):
+    """Normalizes by RMS or loudness, reusing item["measurement"] when there is one."""
+    item["audio"], gain = utility_processor.normalize_buffer(item["audio"], item["sample_rate"], item.get("measurement"))
+    item["changed"] |= gain is not None
+    return item
+
+
+def resample_item(utility_processor, item):
+    """Resamples to the processor's target rate."""
+    if item["sample_rate"] != int(utility_processor.target_sample_rate):
+        item["audio"] = utility_processor.resample_buffer(item["audio"], item["sample_rate"])
+        item["sample_rate"] = int(utility_processor.target_sample_rate)
+        item["changed"] = True
+    return item
+
+
+def write_item(store, item):
+    """Writes the sample to item["dest"], straight from the store when no stage changed it."""
+    os.makedirs(os.path.dirname(item["dest"]), exist_ok=True)
+    if item["changed"]:
+        if os.path.lexists(item["dest"]):
+            os.remove(item["dest"])  # It may be a hardlink from an earlier export, never write through it
+        encode(item["dest"], item["audio"], item["sample_rate"], subtype=output_subtype(item["dest"], item["subtype"]))
+    else:
+        store.write(item["handle"], item["dest"])
+    item["path"] = item["dest"]
+    item["audio"] = None  # Written, don't keep every exported buffer alive in the results
+    return item
+
+
+def link_item(item):
+    """Exports an unchanged sample by hardlinking or copying its backing file item["path"] to item["dest"]."""
+    os.makedirs(os.path.dirname(item["dest"]), exist_ok=True)
+    item["action"] = link_or_copy(item["path"], item["dest"], item["action"] == HARDLINK)
+    item["path"] = item["dest"]
+    return item
+
+
+def decode_item(item):
+    """Decodes the file at item["path"] with all its channels into item["audio"]."""
+    item["audio"], item["sample_rate"], item["subtype"] = read_file(item["path"])
+    return item
+
+
+def measure_item(item):
+    """Measures the loudness and true peak of the decoded item["audio"] into item["measurement"]."""
+    from loudness_module import LoudnessAnalyzer
+    buffers = {item["path"]: (item["audio"], item["sample_rate"])}
+    item["measurement"] = LoudnessAnalyzer(workers=1).analyze_buffers(buffers)[item["path"]]
+    return item
+
+
+def store_item(store, item):
+    """Moves the decoded audio into the store, which may spill it, and keeps only its handle."""
+    item["handle"] = store.put(item["audio"], item["sample_rate"], item["subtype"], label=item["name"],
+                               source_path=item["path"])
+    item["audio"] = None
+    return item
+
+
+def export_samples(sample_manager, silence_processor, utility_processor, save_dir, export_names,
+                   tag_folders=None, crop=False, allow_hardlinks=False, cpu_workers=None, io_workers=IO_WORKERS,
+                   progress=None):
+    """
+    Exports every sample of the list: crop, normalize and resample in worker processes, then write out.
+
+    An ExportPlanner first picks each sample's cheapest correct action. Samples nothing would
+    change are copied (or hardlinked, with allow_hardlinks) from their backing file without
+    being decoded. The rest come from the sample store and are processed in memory, the exported
+    files are the only writes. The list's samples are left untouched. Normalization reuses the
+    cached loudness analysis unless cropping changes the audio first.
+
+    :param export_names: {sample name: final file name}, from RenamePlanner.plan.
+    :param tag_folders: {sample name: tag}, samples with a tag go to a subfolder of that name.
+    :return: (exported paths, errors), see Pipeline.run_async for the errors.
+    """
+    tag_folders = tag_folders or {}
+    destinations = {name: os.path.join(save_dir, tag_folders.get(name, ""), export_names[name])
+                    for name in sample_manager.get_sample_names()}
+    planner = ExportPlanner(crop, utility_processor.normalize_enabled, utility_processor.target_sample_rate,
+                            allow_hardlinks)
+    plan = planner.plan(sample_manager, destinations)
+
+    items, unchanged = [], []
+    for sample_name, dest in destinations.items():
+        action, backing_file = plan[sample_name]
+        if action != PROCESS:
+            unchanged.append({"name": sample_name, "path": backing_file, "dest": dest, "action": action})
+            continue
+        measurement = None
+        if utility_processor.normalize_enabled and utility_processor.normalize_mode == "lufs":
+            measurement = sample_manager.get_analysis(sample_name, "loudness")
+        items.append({
+            "name": sample_name,
+            "handle": sample_manager.sample_handle(sample_name),
+            "dest": dest,
+            "measurement": measurement,
+            "action": PROCESS,
+        })
+
+    # Unchanged samples only need I/O, no decode and no worker processes
+    linked, errors = [], []
+    if unchanged:
+        linked, errors = Pipeline([Stage("link", link_item, "io", io_workers)]).run(unchanged, progress)
+    if not items:
+        print(f"Export: {summarize([item['action'] for item in linked])}")
+        return [item["path"] for item in linked], errors
+
+    stages = [Stage("read", functools.partial(read_item, sample_manager.store), "io", io_workers)]
+    if crop:
+        stages.append(Stage("crop", functools.partial(crop_item, silence_processor), "cpu", cpu_workers))
+    if utility_processor.normalize_enabled:
+        stages.append(Stage("normalize", functools.partial(normalize_item, utility_processor), "cpu", cpu_workers))
+    stages.append(Stage("resample", functools.partial(resample_item, utility_processor), "cpu", cpu_workers))
+    stages.append(Stage("write", functools.partial(write_item, sample_manager.store), "io", io_workers))
+
+    pipeline = Pipeline(stages)
+    results, process_errors = pipeline.run(items, progress)
+    print(pipeline.format_stats())
+    print(f"Export: {summarize([item['action'] for item in linked + results])}")
+    return [item["path"] for item in linked + results], errors + process_errors
+
+
+def import_samples(sample_manager, file_paths, analyze=True, cpu_workers=None, io_workers=IO_WORKERS, progress=None):
+    """
+    Decodes files into the sample store and, with analyze, measures their loudness on the way.
+
+    Each file is decoded once and measured from its buffer. The last stage hands every buffer to
+    the store as soon as it is ready, so the pipeline never holds more than its queues. The list
+    itself is only updated here in the calling thread once the pipeline is done, in file order like
+    load_samples. Returns (sample items, errors), the items as (sample name, tag) like load_samples.
+    """
+    items = [{"name": os.path.basename(path), "path": path} for path in file_paths]
+    stages = [Stage("decode", decode_item, "io", io_workers)]
+    if analyze:
+        stages.append(Stage("measure", measure_item, "cpu", cpu_workers))
+    stages.append(Stage("store", functools.partial(store_item, sample_manager.store), "io", io_workers))
+
+    results, errors = Pipeline(stages).run(items, progress)
+
+    sample_items = [sample_manager.add_handle(item["name"], item["handle"]) for item in results]
+    sample_manager.update_tag_file()
+    for item in results:
+        if item.get("measurement") is not None:
+            sample_manager.store_analysis(item["name"], "loudness", item["measurement"], flush=False)
+    if analyze:
+        sample_manager.update_analysis_file()
+    return sample_items, errors
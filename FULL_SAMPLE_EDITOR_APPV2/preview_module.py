@@ -0,0 +1,99 @@
+import numpy as np
+
+from buffer_module import SAMPLE_DTYPE
+from loudness_module import LoudnessAnalyzer
+from silence_module import frame_energy_all, audible_edges
+from trace_module import span
+
+
+class PreviewChain:
+    def __init__(self, silence_processor, utility_processor):
+        """
+        The export chain (crop, fades, normalize) run in memory on one sample, for auditioning.
+
+        Every stage keeps its last result with the settings it was made with, and a render only
+        redoes the stages whose settings or input changed: moving the fade reuses the cropped
+        buffer, and moving the target level reuses the measured levels and only applies the new
+        gain. The silence threshold is applied to a frame energy measured once per sample. The
+        result matches what export writes, at the sample's own rate since resampling doesn't
+        change what is heard. Nothing is written to disk.
+        """
+        self.silence_processor = silence_processor
+        self.utility_processor = utility_processor
+        self.recomputed = []  # Stages the last render had to compute, for checking what was reused
+        self._stages = {}  # stage name -> (settings key, result)
+
+    def render(self, sample_manager, sample_name, crop=True):
+        """Returns (audio, sample_rate) of the sample as export would process it, with crop and fades if crop is set."""
+        self.recomputed = []
+        silence, utility = self.silence_processor, self.utility_processor
+        with span("preview.render"):
+            audio, sample_rate = sample_manager.read_sample(sample_name)
+            # Keyed by what the store holds, virtual chops are a new view of their source on every read
+            handle = sample_manager.sample_handle(sample_name)
+            source = key = (handle, sample_manager.store.version(handle))
+
+            if crop:
+                key = (key, silence.trim_mode, silence.silence_threshold, silence.silence_reference)
+                audio = self._stage("crop", key, lambda: self.crop(audio, sample_rate, source))
+                key = (key, silence.fade_in_duration, silence.fade_out_duration)
+                audio = self._stage("fade", key, lambda: self.fade(audio, sample_rate))
+
+            if utility.normalize_enabled:
+                key = (key, utility.normalize_mode, utility.true_peak_ceiling)
+                levels = self._stage("levels", key, lambda: self.levels(audio, sample_rate))
+                key = (key, utility.target_lufs if utility.normalize_mode == "lufs" else utility.target_db)
+                audio = self._stage("gain", key, lambda: self.gain(audio, levels))
+        return audio, sample_rate
+
+    def crop(self, audio, sample_rate, source, buffer_duration=0.5):
+        """The audible part of audio with buffer_duration either side, a view like SilenceProcessor.crop_silence.
+
+        source identifies the sample, its frame energy is cached under it.
+        """
+        silence = self.silence_processor
+        if silence.trim_mode != "edge":
+            return silence.crop_silence(audio, sample_rate, buffer_duration)
+
+        # The frame energy doesn't depend on the threshold, so it is measured once per sample
+        energy = self._stage("energy", source, lambda: frame_energy_all(lambda start, stop: audio[start:stop], len(audio)))
+        edges = audible_edges(energy, len(audio), silence.silence_threshold, silence.silence_reference)
+        if edges is None:
+            return audio
+        buffer_samples = int(buffer_duration * sample_rate)
+        return audio[max(0, edges[0] - buffer_samples):min(len(audio), edges[1] + buffer_samples)]
+
+    def fade(self, audio, sample_rate):
+        """A faded copy of the cropped buffer, which stays untouched for the next fade setting."""
+        return self.silence_processor.apply_fade(audio.copy(), sample_rate)
+
+    def levels(self, audio, sample_rate):
+        """The RMS levels or loudness measurement normalize_buffer would base its gain on."""
+        utility = self.utility_processor
+        if utility.normalize_mode == "lufs":
+            return LoudnessAnalyzer(workers=1).analyze_batch([audio.reshape(len(audio), -1)], sample_rate)[0]
+        return utility.buffer_levels(audio, true_peak=utility.true_peak_ceiling is not None)
+
+    def gain(self, audio, levels):
+        """audio scaled to the target level, a new buffer so the faded one can be scaled again."""
+        utility = self.utility_processor
+        if utility.normalize_mode == "lufs":
+            gain = utility.lufs_gain(levels, utility.target_lufs)
+        else:
+            gain = utility.rms_gain(levels, utility.target_db)
+        if gain is None:
+            return audio  # Silent or below the loudness gate, left as it is like normalize_buffer does
+        return np.multiply(audio, SAMPLE_DTYPE(gain), dtype=SAMPLE_DTYPE)
+
+    def clear(self):
+        """Drops every cached stage, e.g. when the list is cleared."""
+        self._stages = {}
+
+    def _stage(self, name, key, func):
+        cached = self._stages.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        result = func()
+        self._stages[name] = (key, result)
+        self.recomputed.append(name)
+        return result
@@ -0,0 +1,96 @@
+import os
+from signature_module import SignatureProcessor
+
+
+class RenameCollisionError(ValueError):
+    """Raised when two samples map to the same final name and collisions are not resolved automatically."""
+
+    def __init__(self, collisions):
+        self.collisions = collisions
+        details = ", ".join(f"{name} <- {sources}" for name, sources in collisions.items())
+        super().__init__(f"{len(collisions)} name collisions: {details}")
+
+
+class RenamePlanner:
+    def __init__(self, template="{name}", pack_name="", pack_name_position=None, signature="",
+                 signature_position=None, start_number=1, on_collision="number"):
+        """
+        Computes every final sample name of a pack up front.
+
+        :param template: Pattern for the base name, with {name} (original name without extension),
+                         {n} (running number), {tag}, {pack} and {signature}, e.g. "{pack}_{tag}_{n:03d}".
+        :param pack_name: Pack name added as prefix or suffix when pack_name_position is set.
+        :param signature: Signature added as prefix or suffix when signature_position is set.
+        :param start_number: First value of {n}.
+        :param on_collision: "number" appends _2, _3, ... to later duplicates, "error" raises RenameCollisionError.
+        """
+        self.template = template
+        self.pack_name = pack_name.replace(" ", "_")
+        self.pack_name_position = pack_name_position
+        self.signature = signature.replace(" ", "_")
+        self.signature_position = signature_position
+        self.start_number = start_number
+        self.on_collision = on_collision
+        self.signature_processor = SignatureProcessor()
+
+    def target_name(self, sample_name, number, tag=""):
+        """Builds the final name of one sample."""
+        base_name, ext = os.path.splitext(sample_name)
+        name = self.template.format(name=base_name, n=number, tag=tag, pack=self.pack_name,
+                                    signature=self.signature) + ext
+
+        if self.pack_name and self.pack_name_position:
+            name = self.signature_processor.add_signature(name, self.pack_name, self.pack_name_position)
+        if self.signature and self.signature_position:
+            name = self.signature_processor.add_signature(name, self.signature, self.signature_position)
+        return name
+
+    @staticmethod
+    def collision_key(name, folder=""):
+        """Index key for a name, case-insensitive because macOS and Windows file systems are."""
+        return folder, name.casefold()
+
+    def find_collisions(self, plan, folders=None):
+        """Returns {final name: [sample names]} for every final name used more than once, in one pass."""
+        folders = folders or {}
+        index = {}
+        for sample_name, target in plan.items():
+            index.setdefault(self.collision_key(target, folders.get(sample_name, "")), []).append(sample_name)
+        return {plan[sources[0]]: sources for sources in index.values() if len(sources) > 1}
+
+    def plan(self, sample_names, tags=None, folders=None, names=None):
+        """
+        Returns {sample name: final name} for every sample, with collisions resolved or reported.
+
+        :param tags: Optional {sample name: tag}, used by {tag} in the template.
+        :param folders: Optional {sample name: output folder}, names only collide inside the same folder.
+        :param names: Optional {key: file name} when sample_names are keys rather than file names,
+                      e.g. to plan samples from several sources that reuse the same chop names.
+        """
+        tags = tags or {}
+        names = names or {}
+        plan = {}
+        for number, sample_name in enumerate(sample_names, start=self.start_number):
+            plan[sample_name] = self.target_name(names.get(sample_name, sample_name), number, tags.get(sample_name, ""))
+
+        collisions = self.find_collisions(plan, folders)
+        if not collisions:
+            return plan
+        if self.on_collision == "error":
+            raise RenameCollisionError(collisions)
+
+        # Keep the first sample on each name, number the rest while checking the index for taken names
+        folders = folders or {}
+        taken = {self.collision_key(target, folders.get(name, "")) for name, target in plan.items()}
+        for sources in collisions.values():
+            suffix = 2
+            for sample_name in sources[1:]:
+                folder = folders.get(sample_name, "")
+                base_name, ext = os.path.splitext(plan[sample_name])
+                while self.collision_key(f"{base_name}_{suffix}{ext}", folder) in taken:
+                    suffix += 1
+                plan[sample_name] = f"{base_name}_{suffix}{ext}"
+                taken.add(self.collision_key(plan[sample_name], folder))
+            print(f"Renamed {len(sources) - 1} duplicates of {plan[sources[0]]}")
+
+        return plan
@@ -0,0 +1,159 @@
+import time
+import functools
+import shutil
+from fractions import Fraction
+import numpy as np
+import soundfile as sf
+from memory_module import get_budget
+
+# Kaiser-windowed polyphase FIR settings for each quality preset.
+# half_length is the number of filter zero crossings on each side, rolloff the passband edge relative to Nyquist.
+QUALITY_PRESETS = {
+    "fast": {"half_length": 8, "beta": 5.0, "rolloff": 0.90},
+    "hq": {"half_length": 32, "beta": 8.6, "rolloff": 0.945},
+    "vhq": {"half_length": 64, "beta": 12.0, "rolloff": 0.97},
+}
+
+# Ratios that show up in almost every pack, their filters are designed ahead of time
+COMMON_RATES = [44100, 48000, 88200, 96000]
+
+
+@functools.lru_cache(maxsize=8)
+def oversampling_filter(factor):
+    """float32 version of the filter resample_poly designs by default for factor x upsampling.
+
+    Passing it explicitly keeps true-peak oversampling in float32 on every scipy version.
+    """
+    from scipy import signal
+
+    taps = signal.firwin(2 * 10 * factor + 1, 1.0 / factor, window=("kaiser", 5.0)).astype(np.float32)
+    taps.flags.writeable = False
+    return taps
+
+
+class Resampler:
+    # Designed filters shared by every Resampler, keyed by (up, down, quality)
+    _filter_cache = {}
+
+    def __init__(self, quality="hq"):
+        """Initializes the resampler with one of the QUALITY_PRESETS."""
+        if quality not in QUALITY_PRESETS:
+            raise ValueError(f"Unknown resample quality '{quality}', expected one of {list(QUALITY_PRESETS)}")
+        self.quality = quality
+
+    @staticmethod
+    def rational_ratio(orig_sample_rate, target_sample_rate):
+        """Returns the reduced (up, down) factors that take orig_sample_rate to target_sample_rate."""
+        ratio = Fraction(int(target_sample_rate), int(orig_sample_rate))
+        return ratio.numerator, ratio.denominator
+
+    def get_filter(self, up, down):
+        """Returns the polyphase low-pass filter for the ratio, designing it only the first time."""
+        key = (up, down, self.quality)
+        taps = self._filter_cache.get(key)
+        if taps is None:
+            from scipy import signal  # scipy.signal takes about a second to import, only pay it when resampling
+
+            preset = QUALITY_PRESETS[self.quality]
+            max_rate = max(up, down)
+            num_taps = 2 * preset["half_length"] * max_rate + 1
+            taps = signal.firwin(num_taps, preset["rolloff"] / max_rate, window=("kaiser", preset["beta"]))
+            taps = taps.astype(np.float32)  # Keeps the filtering in float32
+            self._filter_cache[key] = taps
+        return taps
+
+    def warm_common_filters(self):
+        """Designs the filters for every pair of COMMON_RATES up front."""
+        for orig_sample_rate in COMMON_RATES:
+            for target_sample_rate in COMMON_RATES:
+                if orig_sample_rate != target_sample_rate:
+                    self.get_filter(*self.rational_ratio(orig_sample_rate, target_sample_rate))
+
+    def resample(self, audio, orig_sample_rate, target_sample_rate):
+        """Resamples a (frames,) or (frames, channels) array, returning the input untouched if the rates match."""
+        if int(orig_sample_rate) == int(target_sample_rate):
+            return audio
+
+        from scipy import signal
+
+        up, down = self.rational_ratio(orig_sample_rate, target_sample_rate)
+        audio = np.asarray(audio, dtype=np.float32)
+        return signal.resample_poly(audio, up, down, axis=0, window=self.get_filter(up, down))
+
+    def resample_file(self, file_path, target_sample_rate, output_path=None):
+        """Resamples a file in place (or into output_path) and returns True if any resampling was done."""
+        output_path = output_path or file_path
+        info = sf.info(file_path)
+
+        if info.samplerate == int(target_sample_rate):
+            # Already at the target rate, nothing to decode or re-encode
+            if output_path != file_path:
+                shutil.copyfile(file_path, output_path)
+            return False
+
+        # Input and output are both held in float32 while resampling
+        input_bytes = info.frames * info.channels * 4
+        with get_budget().reserve(input_bytes + input_bytes * int(target_sample_rate) // info.samplerate,
+                                  "resample", file_path):
+            audio, sample_rate = sf.read(file_path, dtype='float32')
+            resampled_audio = self.resample(audio, sample_rate, target_sample_rate)
+            sf.write(output_path, resampled_audio, int(target_sample_rate), subtype=info.subtype)
+        return True
+
+    def resample_files(self, file_paths, target_sample_rate):
+        """Resamples many files in place, grouped by source rate so each filter is fetched once per group."""
+        groups = {}
+        for file_path in file_paths:
+            groups.setdefault(sf.info(file_path).samplerate, []).append(file_path)
+
+        stats = {"skipped": 0, "resampled": 0, "groups": {rate: len(paths) for rate, paths in groups.items()}}
+        for sample_rate, paths in groups.items():
+            if sample_rate == int(target_sample_rate):
+                stats["skipped"] += len(paths)
+                continue
+
+            self.get_filter(*self.rational_ratio(sample_rate, target_sample_rate))
+            for file_path in paths:
+                self.resample_file(file_path, target_sample_rate)
+                stats["resampled"] += 1
+
+        return stats
+
+
+def measure_presets(orig_sample_rate=44100, target_sample_rate=48000, duration=10.0):
+    """Measures speed and accuracy of every preset on a multi-tone signal with a known resampled result."""
+    # Tones spread up to 85% of Nyquist, where the shorter filters of the faster presets already roll off
+    nyquist = min(orig_sample_rate, target_sample_rate) / 2
+    frequencies = np.array([0.01, 0.1, 0.3, 0.6, 0.85]) * nyquist
+
+    def tones(sample_rate):
+        t = np.arange(int(duration * sample_rate)) / sample_rate
+        return (np.sin(2 * np.pi * frequencies[:, None] * t).sum(axis=0) / len(frequencies)).astype(np.float32)
+
+    source = tones(orig_sample_rate)
+    expected = tones(target_sample_rate)
+
+    # Ignore the filter ramp at both ends, where no resampler can match an infinite signal
+    edge = int(0.1 * target_sample_rate)
+
+    results = {}
+    for quality in QUALITY_PRESETS:
+        resampler = Resampler(quality)
+        resampler.get_filter(*resampler.rational_ratio(orig_sample_rate, target_sample_rate))
+
+        start = time.perf_counter()
+        output = resampler.resample(source, orig_sample_rate, target_sample_rate)
+        elapsed = time.perf_counter() - start
+
+        length = min(len(output), len(expected))
+        error = output[edge:length - edge] - expected[edge:length - edge]
+        reference = expected[edge:length - edge]
+        snr_db = 10 * np.log10(np.sum(reference ** 2) / max(np.sum(error ** 2), 1e-20))
+
+        results[quality] = {
+            "seconds": elapsed,
+            "realtime_factor": duration / elapsed if elapsed > 0 else float("inf"),
+            "snr_db": float(snr_db),
+        }
+
+    return results
@@ -0,0 +1,457 @@
+import os
+import sys
+import json
+import time
+import heapq
+import shutil
+import argparse
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from batch_module import resolve_job, run_job, load_job_spec
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_STATE_DIR = os.path.join(os.path.expanduser("~"), ".sample_editor_service")
+
+# Overrides the service address for the app and the client, e.g. http://127.0.0.1:8765
+SERVICE_URL_ENV = "SAMPLE_EDITOR_SERVICE"
+
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobService:
+    def __init__(self, state_dir=DEFAULT_STATE_DIR, workers=1, runner=run_job):
+        """
+        Queue of chop/export jobs run by a bounded pool of worker threads, with state kept on disk.
+
+        Jobs are batch job specs (see batch_module.DEFAULT_JOB). Higher priority runs first, equal
+        priorities run in submission order. Every state change is written to state_dir/jobs.json, so
+        a restarted service keeps its history and puts jobs that were running back in the queue.
+        Everything the service deletes is its own: job work folders and staging folders it handed
+        out, all under state_dir. The service works in process too, the HTTP server below is a thin layer on top of it.
+
+        :param runner: Called as runner(job, progress=callback), batch_module.run_job by default.
+        """
+        self.state_dir = state_dir
+        self.state_path = os.path.join(state_dir, "jobs.json")
+        self.staging_root = os.path.join(state_dir, "staging")
+        self.workers = max(1, int(workers))
+        self.runner = runner
+        self.jobs = {}
+        self._queue = []  # (-priority, sequence, job id)
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        os.makedirs(state_dir, exist_ok=True)
+        self.load_state()
+
+    def load_state(self):
+        """Restores jobs from the state file, requeueing the ones a previous run didn't finish."""
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path) as f:
+            state = json.load(f)
+        for record in state.get("jobs", []):
+            self.jobs[record["id"]] = record
+            self._sequence = max(self._sequence, record["sequence"] + 1)
+            if record["status"] == "running":
+                record["status"] = "queued"
+                record["events"].append({"stage": "requeued", "time": time.time()})
+            if record["status"] == "queued":
+                heapq.heappush(self._queue, (-record["priority"], record["sequence"], record["id"]))
+
+    def save_state(self):
+        """Writes every job to the state file, replacing it atomically."""
+        temp_path = f"{self.state_path}.saving"
+        with open(temp_path, 'w') as f:
+            json.dump({"jobs": sorted(self.jobs.values(), key=lambda r: r["sequence"])}, f)
+        os.replace(temp_path, self.state_path)
+
+    def start(self):
+        """Starts the worker threads."""
+        self._stopping = False
+        for i in range(self.workers - len(self._threads)):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, wait=True):
+        """Stops taking jobs from the queue, running jobs finish first when wait is set."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+        self._threads = []
+
+    def create_staging(self):
+        """Creates an empty folder for a job's sources and returns its path, see submit's staged."""
+        os.makedirs(self.staging_root, exist_ok=True)
+        return tempfile.mkdtemp(prefix="staged_", dir=self.staging_root)
+
+    def submit(self, spec, priority=0, name="", base_dir=None, staged=None):
+        """
+        Queues a job and returns its id.
+
+        :param spec: Job spec dict, missing settings take the batch defaults.
+        :param base_dir: Folder relative paths in the spec are resolved against (the caller's working directory).
+        :param staged: A folder from create_staging holding the job's sources, removed once the job has finished.
+        """
+        job = resolve_job(spec, base_dir or os.getcwd())
+        if not job["sources"]:
+            raise ValueError("The job has no sources")
+        if staged is not None:
+            staged = os.path.realpath(staged)
+            if os.path.dirname(staged) != os.path.realpath(self.staging_root) or not os.path.isdir(staged):
+                raise ValueError(f"{staged} is not a staging folder of this service")
+
+        with self._condition:
+            job_id = f"{int(time.time())}-{self._sequence}"
+            # Each job gets its own work folder, the batch default would be shared between jobs
+            job["work_dir"] = os.path.join(self.state_dir, "work", job_id)
+            self.jobs[job_id] = {
+                "id": job_id,
+                "sequence": self._sequence,
+                "name": name or os.path.basename(job["sources"][0]),
+                "priority": int(priority),
+                "status": "queued",
+                "submitted": time.time(),
+                "started": None,
+                "finished": None,
+                "job": job,
+                "staged": staged,
+                "summary": None,
+                "error": None,
+                "events": [{"stage": "queued", "time": time.time()}],
+            }
+            heapq.heappush(self._queue, (-int(priority), self._sequence, job_id))
+            self._sequence += 1
+            self.save_state()
+            self._condition.notify_all()
+        return job_id
+
+    def cancel(self, job_id):
+        """Cancels a queued job. Returns False if it is already running or finished."""
+        with self._condition:
+            record = self.jobs[job_id]
+            if record["status"] != "queued":
+                return False
+            record["status"] = "cancelled"
+            record["finished"] = time.time()
+            record["events"].append({"stage": "finished", "status": "cancelled", "time": time.time()})
+            self.save_state()
+            self._condition.notify_all()
+        self._remove_job_files(record)
+        return True
+
+    def get(self, job_id):
+        """Returns a copy of a job record, raising KeyError for unknown ids."""
+        with self._condition:
+            return json.loads(json.dumps(self.jobs[job_id]))
+
+    def list_jobs(self):
+        """Returns a short status line per job, newest first."""
+        with self._condition:
+            records = sorted(self.jobs.values(), key=lambda r: -r["sequence"])
+            return [{key: record[key] for key in ("id", "name", "priority", "status", "submitted", "finished")}
+                    for record in records]
+
+    def wait_events(self, job_id, after=0, timeout=None):
+        """Returns the job's events from index after on, blocking until there is one or the job finished.
+
+        An empty list after timeout seconds means nothing new happened yet.
+        """
+        with self._condition:
+            record = self.jobs[job_id]
+            self._condition.wait_for(lambda: len(record["events"]) > after or record["status"] in FINISHED,
+                                     timeout)
+            return list(record["events"][after:])
+
+    def wait(self, job_id, timeout=None):
+        """Blocks until the job has finished and returns its record."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.jobs[job_id]["status"] in FINISHED, timeout)
+        return self.get(job_id)
+
+    def _add_event(self, job_id, event, persist=False):
+        with self._condition:
+            event["time"] = time.time()
+            self.jobs[job_id]["events"].append(event)
+            if persist:
+                self.save_state()
+            self._condition.notify_all()
+
+    def _next_job(self):
+        """Takes the highest priority queued job, or returns None when the service is stopping."""
+        with self._condition:
+            while True:
+                self._condition.wait_for(lambda: self._queue or self._stopping)
+                if self._stopping:
+                    return None
+                _, _, job_id = heapq.heappop(self._queue)
+                record = self.jobs[job_id]
+                if record["status"] != "queued":
+                    continue  # Cancelled while waiting
+                record["status"] = "running"
+                record["started"] = time.time()
+                record["events"].append({"stage": "started", "time": time.time()})
+                self.save_state()
+                self._condition.notify_all()
+                return job_id
+
+    def _work(self):
+        while True:
+            job_id = self._next_job()
+            if job_id is None:
+                return
+            record = self.jobs[job_id]
+            try:
+                summary = self.runner(dict(record["job"]), progress=lambda event: self._add_event(job_id, event))
+                status = "done" if summary.get("failed", 0) == 0 else "failed"
+                error = None if status == "done" else f"{summary['failed']} of {summary['sources']} sources failed"
+            except Exception as e:
+                summary, status, error = None, "failed", f"{type(e).__name__}: {e}"
+
+            self._remove_job_files(record)
+
+            with self._condition:
+                record["summary"] = summary
+                record["error"] = error
+                record["status"] = status
+                record["finished"] = time.time()
+            self._add_event(job_id, {"stage": "finished", "status": status, "error": error}, persist=True)
+
+
+    def _remove_job_files(self, record):
+        """Removes the job's work and staging folders, never anything outside state_dir."""
+        state_dir = os.path.realpath(self.state_dir)
+        for path in (record["job"]["work_dir"], record.get("staged")):
+            if not path:
+                continue
+            path = os.path.realpath(path)
+            if path == state_dir or os.path.commonpath([path, state_dir]) != state_dir:
+                print(f"Not removing {path}, it is outside the service folder {state_dir}")
+                continue
+            try:
+                shutil.rmtree(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # A folder left behind must not keep the job from finishing
+                print(f"Error removing {path}: {e}")
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API of the service:
+
+    POST /staging              new folder to write a job's sources to -> {"path"}
+    POST /jobs                 {"job": spec, "priority": 0, "name": "", "base_dir": "", "staged": path} -> {"id"}
+    GET  /jobs                 job list
+    GET  /jobs/<id>            full job record
+    GET  /jobs/<id>/events     progress events as JSON lines, streamed until the job finishes (?after=N)
+    POST /jobs/<id>/cancel     cancel a queued job
+    """
+    protocol_version = "HTTP/1.0"  # The event stream ends by closing the connection
+
+    def log_message(self, format, *args):
+        pass  # Keep the daemon's output to its own messages
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def parse_path(self):
+        path, _, query = self.path.partition("?")
+        params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+        return [part for part in path.split("/") if part], params
+
+    def do_GET(self):
+        service = self.server.service
+        parts, params = self.parse_path()
+        try:
+            if parts == ["jobs"]:
+                self.send_json(service.list_jobs())
+            elif len(parts) == 2 and parts[0] == "jobs":
+                self.send_json(service.get(parts[1]))
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+                self.stream_events(parts[1], int(params.get("after", 0)))
+            else:
+                self.send_json({"error": "not found"}, 404)
+        except KeyError:
+            self.send_json({"error": "unknown job"}, 404)
+
+    def do_POST(self):
+        service = self.server.service
+        parts, _ = self.parse_path()
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if parts == ["jobs"]:
+                job_id = service.submit(payload["job"], payload.get("priority", 0), payload.get("name", ""),
+                                        payload.get("base_dir"), payload.get("staged"))
+                self.send_json({"id": job_id}, 201)
+            elif parts == ["staging"]:
+                self.send_json({"path": service.create_staging()}, 201)
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+                self.send_json({"cancelled": service.cancel(parts[1])})
+            else:
+                self.send_json({"error": "not found"}, 404)
+        except KeyError:
+            self.send_json({"error": "unknown job"}, 404)
+        except (ValueError, TypeError) as e:
+            self.send_json({"error": str(e)}, 400)
+
+    def stream_events(self, job_id, after):
+        service = self.server.service
+        service.get(job_id)  # Unknown ids fail before the stream starts
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            while True:
+                events = service.wait_events(job_id, after, timeout=15)
+                for event in events:
+                    self.wfile.write((json.dumps(event) + "\n").encode())
+                self.wfile.flush()
+                after += len(events)
+                if any(event["stage"] == "finished" for event in events):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            return  # The client stopped listening
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, state_dir=DEFAULT_STATE_DIR, workers=1):
+    """Runs the service until interrupted. Binds to localhost only, there is no authentication."""
+    service = JobService(state_dir, workers)
+    service.start()
+    server = ThreadingHTTPServer((host, port), JobRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    print(f"Job service on http://{host}:{port} with {service.workers} workers, state in {state_dir}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop(wait=True)
+
+
+class JobClient:
+    def __init__(self, url=None, timeout=10):
+        """Talks to a running job service, at url or SAMPLE_EDITOR_SERVICE or the default local port."""
+        self.url = (url or os.environ.get(SERVICE_URL_ENV) or f"http://{DEFAULT_HOST}:{DEFAULT_PORT}").rstrip("/")
+        self.timeout = timeout
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.load(response)
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Job service error {e.code}: {json.load(e).get('error')}") from None
+
+    def available(self):
+        """True if a service answers at the url."""
+        try:
+            self.request("GET", "/jobs")
+            return True
+        except (OSError, RuntimeError):
+            return False
+
+    def create_staging(self):
+        """A folder of the service to write a job's sources to, the service removes it after the job."""
+        return self.request("POST", "/staging", {})["path"]
+
+    def submit(self, spec, priority=0, name="", base_dir=None, staged=None):
+        payload = {"job": spec, "priority": priority, "name": name,
+                   "base_dir": base_dir or os.getcwd(), "staged": staged}
+        return self.request("POST", "/jobs", payload)["id"]
+
+    def status(self, job_id):
+        return self.request("GET", f"/jobs/{job_id}")
+
+    def list_jobs(self):
+        return self.request("GET", "/jobs")
+
+    def cancel(self, job_id):
+        return self.request("POST", f"/jobs/{job_id}/cancel", {})["cancelled"]
+
+    def events(self, job_id, after=0):
+        """Yields the job's progress events as they happen, until it has finished."""
+        with urllib.request.urlopen(f"{self.url}/jobs/{job_id}/events?after={after}") as response:
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def main(argv=None):
+    """Command line entry point: serve, submit, status, watch and cancel."""
+    parser = argparse.ArgumentParser(description="Local job service for chop and export jobs.")
+    parser.add_argument("--url", help="Service address for the client commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="Run the service")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve_parser.add_argument("--state-dir", default=DEFAULT_STATE_DIR)
+    serve_parser.add_argument("--workers", type=int, default=1, help="Jobs run at the same time")
+
+    submit_parser = commands.add_parser("submit", help="Queue a JSON or YAML job spec")
+    submit_parser.add_argument("spec")
+    submit_parser.add_argument("--priority", type=int, default=0)
+    submit_parser.add_argument("--watch", action="store_true", help="Follow the job's progress")
+
+    status_parser = commands.add_parser("status", help="Show one job, or list them all")
+    status_parser.add_argument("job_id", nargs="?")
+
+    watch_parser = commands.add_parser("watch", help="Follow a job's progress")
+    watch_parser.add_argument("job_id")
+
+    cancel_parser = commands.add_parser("cancel", help="Cancel a queued job")
+    cancel_parser.add_argument("job_id")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.state_dir, args.workers)
+        return 0
+
+    client = JobClient(args.url)
+    if args.command == "submit":
+        # Resolve the spec here, relative paths are relative to the spec file like in batch mode
+        job = load_job_spec(args.spec)
+        job_id = client.submit(job, args.priority, name=os.path.basename(args.spec))
+        print(job_id)
+        if not args.watch:
+            return 0
+        args.job_id = job_id
+    if args.command == "status":
+        print(json.dumps(client.status(args.job_id) if args.job_id else client.list_jobs(), indent=2))
+        return 0
+    if args.command == "cancel":
+        cancelled = client.cancel(args.job_id)
+        print("cancelled" if cancelled else "not cancelled, the job is already running or finished")
+        return 0 if cancelled else 1
+
+    status = None
+    for event in client.events(args.job_id):
+        print(json.dumps(event))
+        status = event.get("status") if event["stage"] == "finished" else status
+    return 0 if status == "done" else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import shutil
+import itertools
+
+import numpy as np
+
+from list_module import content_hash
+from chopper_module import SampleChopper
+from peaks_module import PeakPyramid
+
+SESSION_VERSION = 1
+SESSION_EXTENSION = ".session"  # A session is a folder: session.json, arrays.npz and samples/
+
+
+def source_reference(file_path, digest=None):
+    """Path, size, mtime and content hash of a source, enough to tell later whether it changed."""
+    stat = os.stat(file_path)
+    return {
+        "path": os.path.abspath(file_path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "hash": digest or content_hash(file_path),
+    }
+
+
+def source_unchanged(reference):
+    """True if the referenced source still has the same contents, hashing only when size or mtime moved."""
+    path = reference["path"]
+    if not os.path.exists(path):
+        return False
+    stat = os.stat(path)
+    if stat.st_size == reference["size"] and stat.st_mtime_ns == reference["mtime_ns"]:
+        return True
+    return stat.st_size == reference["size"] and content_hash(path) == reference["hash"]
+
+
+def save_session(session_dir, chopper, markers, region_ends, sample_manager, settings, source=None):
+    """
+    Writes a session folder. It is written next to the target first and swapped in when complete.
+
+    :param chopper: SampleChopper of the loaded source or None. Its onset envelope and peak pyramid
+        are stored, so reopening needs no decode.
+    :param region_ends: {marker: region end} from split on silence.
+    :param settings: Processor and slider settings as a JSON-serializable dict.
+    :param source: The reference returned by a previous save or load, reused when the source file
+        hasn't changed, so the source isn't rehashed on every save.
+
+    Virtual chops are saved as their source reference and frame range, every other sample as a
+    file in samples/. Raises ValueError if session_dir exists and isn't a session, it is replaced.
+    """
+    if os.path.exists(session_dir) and not os.path.exists(os.path.join(session_dir, "session.json")):
+        raise ValueError(f"{session_dir} exists and is not a session, not replacing it")
+
+    temp_dir = f"{session_dir}.saving"
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(temp_dir, "samples"))
+
+    if chopper is not None:
+        if source and source["path"] == os.path.abspath(chopper.file_path) and source_unchanged(source):
+            source = source_reference(chopper.file_path, source["hash"])
+        else:
+            source = source_reference(chopper.file_path)
+        source.update(sample_rate=chopper.sample_rate, duration=chopper.full_duration)
+    else:
+        source = None
+
+    store = sample_manager.store
+    samples, written, chop_sources = [], {}, {}
+    for sample_name in sample_manager.get_sample_names():
+        handle = sample_manager.sample_handle(sample_name)
+        if handle is None:
+            continue
+        sample = {"name": sample_name, "tag": sample_manager.tags.get(sample_name, "")}
+        chop = store.info(handle).slice
+        if chop is not None:
+            path, start, end, _, stamp = chop
+            if path not in chop_sources:
+                chop_sources[path] = chop_source_reference(path, stamp, source)
+            if chop_sources[path] is None:
+                print(f"Not saving {sample_name}, its source {path} changed since it was chopped")
+                continue
+            sample["chop"] = {"source": path, "start": start, "end": end}
+        else:
+            # Written from the sample store, in-memory chops reach the disk here for the first time
+            sample_manager.write_sample(sample_name, os.path.join(temp_dir, "samples", sample_name))
+            sample["file"] = sample_name
+            written[handle] = sample_name
+        samples.append(sample)
+
+    markers = sorted(float(marker) for marker in markers)
+    arrays = {
+        "markers": np.asarray(markers, dtype=np.float64),
+        "region_ends": np.asarray([region_ends.get(marker, np.nan) for marker in markers], dtype=np.float64),
+    }
+    if chopper is not None:
+        if chopper.onset_envelope is not None:
+            arrays["onset_envelope"] = chopper.onset_envelope
+            arrays["onset_method"] = np.array(chopper.onset_envelope_method or "librosa")
+        arrays.update(chopper.peaks.to_arrays())
+    np.savez(os.path.join(temp_dir, "arrays.npz"), **arrays)
+
+    with open(os.path.join(temp_dir, "session.json"), 'w') as f:
+        json.dump({
+            "version": SESSION_VERSION,
+            "saved": time.time(),
+            "source": source,
+            "samples": samples,
+            "chop_sources": {path: reference for path, reference in chop_sources.items() if reference is not None},
+            "analysis": sample_manager.analysis,
+            "settings": settings,
+        }, f, indent=2)
+
+    shutil.rmtree(session_dir, ignore_errors=True)
+    os.rename(temp_dir, session_dir)
+
+    # Samples restored from the folder just replaced are read from its files, point them at the new ones
+    samples_dir = os.path.abspath(os.path.join(session_dir, "samples"))
+    for handle, file_name in written.items():
+        file_path = store.info(handle).file_path
+        if file_path is not None and os.path.dirname(os.path.abspath(file_path)) == samples_dir:
+            store.relocate(handle, os.path.join(samples_dir, file_name))
+    print(f"Session saved to {session_dir}")
+    return source
+
+
+def chop_source_reference(path, stamp, source=None):
+    """Reference of the source virtual chops were cut from, or None if it changed since (stamp is (size, mtime)).
+
+    The session source's reference is reused when the chops come from it, so it isn't hashed twice.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if (stat.st_size, stat.st_mtime_ns) != tuple(stamp):
+        return None
+    if source is not None and source["path"] == path and (source["size"], source["mtime_ns"]) == tuple(stamp):
+        return {key: source[key] for key in ("path", "size", "mtime_ns", "hash")}
+    return source_reference(path)
+
+
+def load_session(session_dir):
+    """
+    Reads a session folder without touching any audio.
+
+    Returns a dict with the session.json contents plus markers, region_ends, onset_envelope and
+    peaks. source_ok says whether the source is still there and unchanged; when it isn't, the
+    cached onset envelope and peaks are dropped since they describe other audio.
+    """
+    with open(os.path.join(session_dir, "session.json")) as f:
+        session = json.load(f)
+    if session.get("version") != SESSION_VERSION:
+        raise ValueError(f"Unsupported session version: {session.get('version')}")
+
+    with np.load(os.path.join(session_dir, "arrays.npz")) as npz:
+        arrays = {key: npz[key] for key in npz.files}
+
+    markers = [float(marker) for marker in arrays["markers"]]
+    session["markers"] = markers
+    session["region_ends"] = {marker: float(end) for marker, end in zip(markers, arrays["region_ends"])
+                              if not np.isnan(end)}
+    session["source_ok"] = session["source"] is not None and source_unchanged(session["source"])
+    session["onset_envelope"] = arrays.get("onset_envelope") if session["source_ok"] else None
+    session["onset_method"] = str(arrays.get("onset_method", "librosa"))  # Sessions from before onset_module are librosa
+    session["peaks"] = PeakPyramid.from_arrays(arrays) if session["source_ok"] else None
+    session["dir"] = session_dir
+    return session
+
+
+def restore_chopper(session):
+    """Builds a lazily decoding chopper for the session's source with the cached analysis, or None."""
+    if not session["source_ok"]:
+        return None
+    chopper = SampleChopper(session["source"]["path"], lazy=True)
+    chopper.digest = session["source"]["hash"]
+    chopper.onset_envelope = session["onset_envelope"]
+    chopper.onset_envelope_method = session["onset_method"]
+    if session["peaks"] is not None:
+        chopper.peaks = session["peaks"]
+    return chopper
+
+
+def restore_samples(session, sample_manager):
+    """Puts the session's samples back into the list with their names, tags and analysis, decoding nothing.
+
+    Sample files are read from the session folder when first used, and virtual chops become
+    virtual chops of their source again if it is unchanged. Returns (sample name, tag) pairs like
+    SampleListManager.load_samples.
+    """
+    samples_dir = os.path.join(session["dir"], "samples")
+    unchanged = {path: source_unchanged(reference) for path, reference in session.get("chop_sources", {}).items()}
+
+    # Consecutive chops of one source are added together, keeping the saved order
+    restored = []
+    for path, group in itertools.groupby(session["samples"], key=lambda sample: sample.get("chop", {}).get("source")):
+        group = list(group)
+        if path is None:
+            sample_manager.add_sample_files([(sample["name"], os.path.join(samples_dir, sample["file"]))
+                                             for sample in group])
+            restored += group
+        elif unchanged.get(path):
+            sample_manager.add_virtual_chops(path, [(sample["name"], sample["chop"]["start"], sample["chop"]["end"])
+                                                    for sample in group])
+            restored += group
+        else:
+            print(f"Not restoring {len(group)} chops of {path}, it is missing or changed since the session was saved")
+
+    items = []
+    for sample in restored:
+        sample_manager.tags[sample["name"]] = sample["tag"]
+        items.append((sample["name"], sample["tag"]))
+    sample_manager.update_tag_file()
+
+    sample_manager.analysis.update(session["analysis"])
+    sample_manager.update_analysis_file()
+    return items
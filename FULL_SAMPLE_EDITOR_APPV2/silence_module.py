@@ -1,18 +1,166 @@
 import os
 import numpy as np
-import librosa
 import soundfile as sf
+from trace_module import span, traced
+from buffer_module import decode, encode, apply_fades, writable
+
+# Frame settings used by librosa.effects.split, the edge scan uses the same ones so both trim modes agree
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+SCAN_FRAMES = 256  # Frames measured per step of the edge scan
+AMIN_POWER = 1e-10  # Same floor librosa applies before converting energy to dB
+LOUDEST_TOLERANCE = 1e-3  # Relative error allowed for float32 frame sums, well above their worst case
+
+
+def frame_energy(read, num_samples, first_frame, last_frame, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH):
+    """Mean square of the centered frames [first_frame, last_frame), matching librosa.feature.rms.
+
+    read(start, stop) returns the samples in that range as (frames,) or (frames, channels).
+    Frames reaching past either end of the audio are zero padded. Multi-channel audio
+    returns the loudest channel for each frame.
+    """
+    pad = frame_length // 2
+    num_frames = last_frame - first_frame
+    start = first_frame * hop_length - pad
+    stop = start + (num_frames - 1) * hop_length + frame_length
+
+    # Squares in float32 with the zero padding written around them, one buffer the size of the chunk
+    segment = read(max(start, 0), min(stop, num_samples))
+    left = max(0, -start)
+    squares = np.zeros((stop - start,) + segment.shape[1:], dtype=np.float32)
+    np.square(segment, out=squares[left:left + len(segment)])
+
+    if frame_length % hop_length == 0:
+        # Frames are whole hops: sum each hop in float64, then each frame is a few neighbouring hops
+        hops_per_frame = frame_length // hop_length
+        hop_energy = squares.reshape((-1, hop_length) + squares.shape[1:]).sum(axis=1, dtype=np.float64)
+        energy = hop_energy[:num_frames].copy()
+        for k in range(1, hops_per_frame):
+            energy += hop_energy[k:k + num_frames]
+        energy /= frame_length
+    else:
+        cumulative = np.zeros((len(squares) + 1,) + squares.shape[1:])
+        np.cumsum(squares, axis=0, dtype=np.float64, out=cumulative[1:])
+        offsets = np.arange(num_frames) * hop_length
+        energy = (cumulative[offsets + frame_length] - cumulative[offsets]) / frame_length
+    return energy.max(axis=1) if energy.ndim > 1 else energy
+
+
+def frame_energy_all(read, num_samples, chunk_frames=SCAN_FRAMES * 16):
+    """Mean square of every centered frame, computed in chunks so the temporary arrays stay small."""
+    num_frames = 1 + num_samples // HOP_LENGTH
+    chunks = []
+    for first in range(0, num_frames, chunk_frames):
+        chunks.append(frame_energy(read, num_samples, first, min(first + chunk_frames, num_frames)))
+    return np.concatenate(chunks)
+
+
+def loudest_frame_energy(read, num_samples, chunk_frames=SCAN_FRAMES * 16):
+    """Mean square of the loudest centered frame, the same value as frame_energy_all(...).max().
+
+    Every hop is summed in float32 with one fused np.einsum, a few times faster than the float64
+    sums of frame_energy, and only the frames within LOUDEST_TOLERANCE of the loudest of those
+    are measured again with frame_energy for the exact value.
+    """
+    num_frames = 1 + num_samples // HOP_LENGTH
+    hops_per_frame = FRAME_LENGTH // HOP_LENGTH
+    pad = FRAME_LENGTH // 2
+    estimate = np.empty(num_frames, dtype=np.float32)
+    for first in range(0, num_frames, chunk_frames):
+        last = min(first + chunk_frames, num_frames)
+        start = first * HOP_LENGTH - pad
+        stop = start + (last - first - 1 + hops_per_frame) * HOP_LENGTH
+        segment = read(max(start, 0), min(stop, num_samples))
+        padded = np.zeros((stop - start,) + segment.shape[1:], dtype=np.float32)
+        left = max(0, -start)
+        padded[left:left + len(segment)] = segment
+
+        hops = padded.reshape((-1, HOP_LENGTH) + padded.shape[1:])
+        hop_energy = np.einsum("ij...,ij...->i...", hops, hops)
+        energy = hop_energy[:last - first].copy()
+        for k in range(1, hops_per_frame):
+            energy += hop_energy[k:k + last - first]
+        estimate[first:last] = energy.max(axis=1) if energy.ndim > 1 else energy
+
+    # Measure exactly, chunk by chunk, the span of frames that could be the loudest
+    candidates = estimate >= estimate.max() * (1 - LOUDEST_TOLERANCE)
+    loudest = 0.0
+    for first in range(0, num_frames, chunk_frames):
+        near = np.flatnonzero(candidates[first:first + chunk_frames])
+        if near.size:
+            loudest = max(loudest, float(frame_energy(read, num_samples, first + near[0], first + near[-1] + 1).max()))
+    return loudest
+
+
+def find_audible_edges(read, num_samples, threshold_db, reference="max"):
+    """Returns (start, end) sample indices of the audible part, or None if everything is below threshold_db.
+
+    Scans frame energy in blocks from the start until the first audible frame and from the end
+    back to the last one, so with reference="absolute" (dBFS) the work is proportional to the
+    silence being removed. With reference="max" the threshold is relative to the loudest frame
+    like librosa.effects.split, which can be anywhere in the clip; it is found first with the
+    float32 pass of loudest_frame_energy.
+    """
+    num_frames = 1 + num_samples // HOP_LENGTH
+
+    if reference == "max":
+        ref_energy = loudest_frame_energy(read, num_samples)
+    else:
+        ref_energy = 1.0
+    limit = max(ref_energy, AMIN_POWER) * 10 ** (threshold_db / 10)
+
+    # Forward scan for the first audible frame
+    first_audible = None
+    for first in range(0, num_frames, SCAN_FRAMES):
+        last = min(first + SCAN_FRAMES, num_frames)
+        audible = np.flatnonzero(np.maximum(frame_energy(read, num_samples, first, last), AMIN_POWER) > limit)
+        if audible.size:
+            first_audible = first + audible[0]
+            break
+
+    if first_audible is None:
+        return None
+
+    # Backward scan for the last audible frame, never past the first one
+    last_audible = first_audible
+    for last in range(num_frames, first_audible, -SCAN_FRAMES):
+        first = max(last - SCAN_FRAMES, first_audible)
+        audible = np.flatnonzero(np.maximum(frame_energy(read, num_samples, first, last), AMIN_POWER) > limit)
+        if audible.size:
+            last_audible = first + audible[-1]
+            break
+
+    return first_audible * HOP_LENGTH, min((last_audible + 1) * HOP_LENGTH, num_samples)
+
+
+def audible_edges(energy, num_samples, threshold_db, reference="max"):
+    """find_audible_edges from an energy array measured once with frame_energy_all, for trying many thresholds."""
+    ref_energy = float(energy.max()) if reference == "max" else 1.0
+    limit = max(ref_energy, AMIN_POWER) * 10 ** (threshold_db / 10)
+    audible = np.flatnonzero(np.maximum(energy, AMIN_POWER) > limit)
+    if not audible.size:
+        return None
+    return audible[0] * HOP_LENGTH, min((audible[-1] + 1) * HOP_LENGTH, num_samples)
+
 
 class SilenceProcessor:
     def __init__(self, silence_threshold=-40.0, fade_in_duration=0.0, fade_out_duration=0.0):
         self.silence_threshold = silence_threshold  # Silence threshold in dB
         self.fade_in_duration = fade_in_duration    # Fade-in duration in seconds
         self.fade_out_duration = fade_out_duration  # Fade-out duration in seconds
+        self.trim_mode = "edge"  # "edge" scans in from both ends, "split" uses librosa.effects.split
+        self.silence_reference = "max"  # "max" is relative to the loudest frame, "absolute" is dBFS
 
     def crop_silence(self, audio, sample_rate, buffer_duration=0.5):
         """Crops silence from the start and end of the audio based on the silence threshold."""
-        # Detect non-silent parts of the audio using librosa's effects.split
-        non_silent_intervals = librosa.effects.split(audio, top_db=-self.silence_threshold)
+        if self.trim_mode == "edge":
+            return self.crop_silence_edges(audio, sample_rate, buffer_duration)
+
+        import librosa  # Only split mode needs librosa, edge mode is plain numpy
+
+        # Detect non-silent parts of the audio using librosa's effects.split, which takes channels first
+        # and keeps a frame when any channel is above the threshold
+        non_silent_intervals = librosa.effects.split(audio.T, top_db=-self.silence_threshold)
 
         if len(non_silent_intervals) == 0:
             print("Audio is entirely silent, returning original")
@@ -30,43 +178,88 @@ class SilenceProcessor:
         print(f"Cropping from {start_idx/sample_rate:.2f}s to {end_idx/sample_rate:.2f}s")
         return cropped_audio
 
+    def crop_silence_edges(self, audio, sample_rate, buffer_duration=0.5):
+        """Crops silence by scanning in from both ends, same result as crop_silence in "split" mode."""
+        edges = find_audible_edges(lambda start, stop: audio[start:stop], len(audio),
+                                   self.silence_threshold, self.silence_reference)
+
+        if edges is None:
+            print("Audio is entirely silent, returning original")
+            return audio
+
+        buffer_samples = int(buffer_duration * sample_rate)
+        start_idx = max(0, edges[0] - buffer_samples)
+        end_idx = min(len(audio), edges[1] + buffer_samples)
+
+        print(f"Cropping from {start_idx/sample_rate:.2f}s to {end_idx/sample_rate:.2f}s")
+        return audio[start_idx:end_idx]
+
+    def crop_silence_file(self, file_path, output_path, buffer_duration=0.5, block_size=65536):
+        """Crops silence from a file by seeking to its edges, without decoding the audible middle for the scan."""
+        with span("silence.crop_file") as stage, sf.SoundFile(file_path) as source:
+            def read(start, stop):
+                source.seek(start)
+                return source.read(stop - start, dtype='float32')
+
+            num_samples = source.frames
+            edges = find_audible_edges(read, num_samples, self.silence_threshold, self.silence_reference)
+            if edges is None:
+                print("Audio is entirely silent, returning original")
+                edges = (0, num_samples)
+                buffer_duration = 0
+
+            buffer_samples = int(buffer_duration * source.samplerate)
+            start_idx = max(0, edges[0] - buffer_samples)
+            end_idx = min(num_samples, edges[1] + buffer_samples)
+
+            # Copy the kept region block by block
+            with sf.SoundFile(output_path, 'w', samplerate=source.samplerate, channels=source.channels,
+                              subtype=source.subtype, format=source.format) as out:
+                source.seek(start_idx)
+                remaining = end_idx - start_idx
+                while remaining > 0:
+                    block = source.read(min(block_size, remaining), dtype='float32')
+                    if len(block) == 0:
+                        break
+                    out.write(block)
+                    remaining -= len(block)
+
+            stage.wrote_file(output_path)
+            stage.add(samples=(end_idx - start_idx) * source.channels)
+            print(f"Cropping from {start_idx/source.samplerate:.2f}s to {end_idx/source.samplerate:.2f}s")
+        return output_path
+
     def apply_fade(self, audio, sample_rate):
-        """Applies fade-in and fade-out to the audio based on the set durations."""
+        """Applies fade-in and fade-out to the audio in place, based on the set durations."""
         fade_in_samples = int(self.fade_in_duration * sample_rate)
         fade_out_samples = int(self.fade_out_duration * sample_rate)
+        return apply_fades(audio, fade_in_samples, fade_out_samples)
 
-        total_samples = len(audio)
-
-        # Apply fade-in
-        if fade_in_samples > 0:
-            fade_in_curve = np.linspace(0.0, 1.0, fade_in_samples)
-            audio[:fade_in_samples] *= fade_in_curve
-
-        # Apply fade-out
-        if fade_out_samples > 0 and fade_out_samples <= total_samples:
-            fade_out_curve = np.linspace(1.0, 0.0, fade_out_samples)
-            audio[-fade_out_samples:] *= fade_out_curve
+    def process_buffer(self, audio, sample_rate):
+        """Crops silence and applies fade in/out to a float32 (frames,) or (frames, channels) buffer.
 
-        return audio
+        Every channel is kept. The crop is decided on the loudest channel of each frame, measured
+        chunk by chunk, so no downmixed copy of the buffer is made.
+        """
+        # Crop silence, a view into the buffer so the fades below don't copy it unless it is read-only
+        audio = self.crop_silence(audio, sample_rate)
+        return self.apply_fade(writable(audio), sample_rate)
 
+    @traced("silence.process_sample")
     def process_sample(self, file_path, temp_folder):
         """Processes the sample by cropping silence and applying fade in/out, saving to a temp folder."""
         try:
-            # Load the audio file
-            audio, sample_rate = librosa.load(file_path, sr=None)
-
-            # Crop silence
-            audio = self.crop_silence(audio, sample_rate)
-
-            # Apply fade in/out
-            audio = self.apply_fade(audio, sample_rate)
+            # Load the audio file as float32 with all its channels, then crop and fade it
+            subtype = sf.info(file_path).subtype
+            audio, sample_rate = decode(file_path)
+            audio = self.process_buffer(audio, sample_rate)
 
             # Generate processed file name
             base_name = os.path.basename(file_path)
             processed_file_path = os.path.join(temp_folder, f"processed_{base_name}")
 
-            # Save the processed audio
-            sf.write(processed_file_path, audio, sample_rate)
+            # Save the processed audio in the source's bit depth
+            encode(processed_file_path, audio, sample_rate, subtype=subtype)
             print(f"Processed and saved: {processed_file_path}")
 
             return processed_file_path  # Return the new path of the processed file
@@ -0,0 +1,265 @@
+import os
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+from buffer_module import decode
+from memory_module import get_budget
+from trace_module import span
+
+# STFT settings, the same as librosa's onset strength uses so both views share one transform
+N_FFT = 2048
+HOP_LENGTH = 512
+N_MELS = 128
+TILE_FRAMES = 256  # STFT frames per cached tile, about 3 s at 44.1 kHz
+STFT_CACHE_MB = 256  # Magnitude tiles kept in memory, least recently used are dropped first
+HEADER_BYTES = 1 << 16  # Start of the file hashed into its cache key, with the header and first audio
+
+
+@functools.lru_cache(maxsize=8)
+def stft_window(n_fft):
+    """Periodic Hann window like scipy.signal.get_window("hann", n_fft), which librosa.stft uses."""
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)).astype(np.float32)
+    window.flags.writeable = False
+    return window
+
+
+def file_key(file_path):
+    """Cheap cache key of a file: its path, size, mtime and a hash of its first HEADER_BYTES.
+
+    Any edit that goes through the file system changes the key, and it costs one small read
+    whatever the file size, unlike hashing the whole file.
+    """
+    stat = os.stat(file_path)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(HEADER_BYTES))
+    return digest.hexdigest()
+
+
+def stft_tile(read, num_samples, index, n_fft=N_FFT, hop_length=HOP_LENGTH, tile_frames=TILE_FRAMES):
+    """
+    Magnitude STFT of tile index as a (frames, n_fft // 2 + 1) float32 array.
+
+    Frames are centred like librosa.stft(center=True, pad_mode="constant"): frame t covers the
+    samples around t * hop_length, zero-padded beyond the ends of the audio. read(start, stop)
+    returns the mono float32 samples [start, stop).
+    """
+    first = index * tile_frames
+    last = min(first + tile_frames, num_frames(num_samples, hop_length))
+    start = first * hop_length - n_fft // 2
+    stop = (last - 1) * hop_length + n_fft // 2 + (n_fft % 2)
+    buffer = np.zeros(stop - start, dtype=np.float32)
+    read_start, read_stop = max(start, 0), min(stop, num_samples)
+    if read_stop > read_start:
+        buffer[read_start - start:read_stop - start] = read(read_start, read_stop)
+
+    frames = np.lib.stride_tricks.sliding_window_view(buffer, n_fft)[::hop_length]
+    return np.abs(np.fft.rfft(frames * stft_window(n_fft), axis=1)).astype(np.float32)
+
+
+def num_frames(num_samples, hop_length=HOP_LENGTH):
+    """STFT frames of a centred transform."""
+    return 1 + num_samples // hop_length
+
+
+class StftCache:
+    def __init__(self, limit=STFT_CACHE_MB * 2 ** 20, workers=1):
+        """
+        LRU cache of magnitude tiles keyed by (file hash, n_fft, hop, tile index), with a background worker.
+
+        Tiles are registered with the memory budget, which can evict them when decoded audio needs room.
+        """
+        self.limit = limit
+        self.used = 0
+        self._tiles = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="stft")
+
+    def get(self, key):
+        with self._lock:
+            tile = self._tiles.get(key)
+            if tile is not None:
+                self._tiles.move_to_end(key)
+            return tile
+
+    def put(self, key, tile):
+        tile.flags.writeable = False
+        get_budget().register(tile, "stft_cache", f"tile {key[-1]}", on_evict=lambda: self.evict(key))
+        with self._lock:
+            if key in self._tiles:
+                return
+            self._tiles[key] = tile
+            self.used += tile.nbytes
+            while self.used > self.limit and len(self._tiles) > 1:
+                _, dropped = self._tiles.popitem(last=False)
+                self.used -= dropped.nbytes
+
+    def evict(self, key):
+        with self._lock:
+            tile = self._tiles.pop(key, None)
+            if tile is not None:
+                self.used -= tile.nbytes
+
+    def compute(self, key, func):
+        """Returns the cached tile, computing it now unless the background worker already is."""
+        tile = self.get(key)
+        if tile is not None:
+            return tile
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            return future.result()
+        tile = func()
+        self.put(key, tile)
+        return tile
+
+    def request(self, key, func):
+        """Schedules a tile in the background unless it is cached or already scheduled. Returns True if cached."""
+        if self.get(key) is not None:
+            return True
+        with self._lock:
+            if key in self._pending:
+                return False
+            self._pending[key] = self._executor.submit(self._compute_pending, key, func)
+        return False
+
+    def _compute_pending(self, key, func):
+        try:
+            tile = func()
+            self.put(key, tile)
+            return tile
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self.used = 0
+
+
+_stft_cache = None
+
+
+def get_stft_cache():
+    """The STFT tile cache shared by the whole process."""
+    global _stft_cache
+    if _stft_cache is None:
+        _stft_cache = StftCache()
+    return _stft_cache
+
+
+class Spectrogram:
+    def __init__(self, file_path, audio=None, sample_rate=None, n_fft=N_FFT, hop_length=HOP_LENGTH,
+                 digest=None, cache=None):
+        """
+        Tiled STFT of one source, computed on demand and shared through the tile cache.
+
+        Tiles read only their own stretch of the file, so nothing has to be decoded as a whole.
+        Pass audio (mono float32) when the file is already decoded or libsndfile can't read it.
+        digest is the file's content hash if the caller already knows it (a session does), else
+        the tiles are keyed by file_key.
+        """
+        self.file_path = file_path
+        self.audio = audio
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.cache = cache or get_stft_cache()
+        if audio is not None:
+            self.sample_rate = sample_rate
+            self.num_samples = len(audio)
+        else:
+            info = sf.info(file_path)
+            self.sample_rate = info.samplerate
+            self.num_samples = info.frames
+        self.digest = digest or file_key(file_path)
+        self.num_frames = num_frames(self.num_samples, hop_length)
+        self.num_tiles = -(-self.num_frames // TILE_FRAMES)
+
+    def read(self, start, stop):
+        if self.audio is not None:
+            return self.audio[start:stop]
+        return decode(self.file_path, mono=True, start=start, stop=stop)[0]
+
+    def key(self, index):
+        return (self.digest, self.n_fft, self.hop_length, index)
+
+    def compute_tile(self, index):
+        with span("spectrogram.tile", tile=index):
+            return stft_tile(self.read, self.num_samples, index, self.n_fft, self.hop_length)
+
+    def tile(self, index):
+        """The magnitude tile, computed now if it isn't cached."""
+        return self.cache.compute(self.key(index), functools.partial(self.compute_tile, index))
+
+    def tiles_between(self, start_time, end_time):
+        """Indices of the tiles covering [start_time, end_time] seconds."""
+        first = max(0, int(start_time * self.sample_rate / self.hop_length) // TILE_FRAMES)
+        last = min(self.num_tiles, int(end_time * self.sample_rate / self.hop_length) // TILE_FRAMES + 1)
+        return range(first, last)
+
+    def request_view(self, start_time, end_time):
+        """Schedules the visible tiles in the background, returns how many are still missing."""
+        return sum(not self.cache.request(self.key(index), functools.partial(self.compute_tile, index))
+                   for index in self.tiles_between(start_time, end_time))
+
+    def view(self, start_time, end_time, max_columns=2000, max_rows=512):
+        """
+        Returns (db, extent) for the visible part: a (freq, time) dB image of the cached tiles, zeros
+        where a tile isn't ready yet, decimated to about max_columns x max_rows, and its
+        (left, right, bottom, top) extent in seconds and Hz for imshow.
+        """
+        indices = self.tiles_between(start_time, end_time)
+        if not indices:
+            return np.zeros((1, 1), dtype=np.float32), (start_time, end_time, 0, self.sample_rate / 2)
+
+        # Decimate every tile before joining them, a zoomed-out view of a long source spans hundreds of tiles
+        first_frame = indices[0] * TILE_FRAMES
+        frames = min(indices[-1] * TILE_FRAMES + TILE_FRAMES, self.num_frames) - first_frame
+        column_step = max(1, frames // max_columns)
+        row_step = max(1, (self.n_fft // 2 + 1) // max_rows)
+        parts = []
+        for index in indices:
+            offset = (first_frame - index * TILE_FRAMES) % column_step
+            tile = self.cache.get(self.key(index))
+            if tile is None:
+                tile_frames = min(TILE_FRAMES, self.num_frames - index * TILE_FRAMES)
+                columns = len(range(offset, tile_frames, column_step))
+                parts.append(np.zeros((columns, len(range(0, self.n_fft // 2 + 1, row_step))), dtype=np.float32))
+            else:
+                parts.append(tile[offset::column_step, ::row_step])
+
+        magnitude = np.concatenate(parts)
+        db = 20 * np.log10(np.maximum(magnitude, 1e-5, dtype=np.float32)).T
+        left = first_frame * self.hop_length / self.sample_rate
+        return db, (left, left + frames * self.hop_length / self.sample_rate, 0, self.sample_rate / 2)
+
+    def onset_strength(self):
+        """
+        Onset strength envelope from the cached STFT, the same as librosa.onset.onset_strength(y=audio, sr=sr).
+
+        The mel spectrogram is reduced tile by tile, so the full-resolution STFT of a long source is
+        never held at once.
+        """
+        import librosa
+
+        mel_basis = librosa.filters.mel(sr=self.sample_rate, n_fft=self.n_fft, n_mels=N_MELS).astype(np.float32)
+        mel = np.empty((N_MELS, self.num_frames), dtype=np.float32)
+        for index in range(self.num_tiles):
+            tile = self.tile(index)
+            first = index * TILE_FRAMES
+            mel[:, first:first + len(tile)] = mel_basis @ np.square(tile).T
+        return librosa.onset.onset_strength(S=librosa.power_to_db(mel, ref=np.max), sr=self.sample_rate,
+                                            n_fft=self.n_fft, hop_length=self.hop_length)
@@ -0,0 +1,112 @@
+import sys
+import argparse
+import importlib
+import threading
+import subprocess
+
+# Modules the app only needs once audio is loaded, imported in the background while the window is idle.
+# librosa itself loads lazily, librosa.onset and scipy.signal are where the seconds go.
+WARM_MODULES = ["numpy", "soundfile", "scipy.signal", "librosa", "librosa.onset", "librosa.effects",
+                "matplotlib.figure", "matplotlib.backends.backend_qt5agg"]
+
+# Cold import budget for the UI module, in seconds
+STARTUP_BUDGET = 1.0
+
+# Heavy modules that must stay out of the UI module's cold import, they load lazily or with warm_imports
+LAZY_MODULES = ["librosa", "matplotlib", "pydub"]
+
+_warm_thread = None
+
+
+def warm_imports(modules=WARM_MODULES):
+    """Imports the heavy modules on a daemon thread so the first chop or export does not stall the UI.
+
+    Only starts one thread per process, and a missing optional module is skipped rather than raised.
+    """
+    global _warm_thread
+    if _warm_thread is not None:
+        return _warm_thread
+
+    def run():
+        for module in modules:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                pass
+
+    _warm_thread = threading.Thread(target=run, name="warm-imports", daemon=True)
+    _warm_thread.start()
+    return _warm_thread
+
+
+def import_time_report(module="UI_Sample_Editor_app", top=15):
+    """Imports module in a fresh interpreter with -X importtime and returns the slowest imports.
+
+    Returns a list of (cumulative seconds, self seconds, module name), slowest first.
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                             capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr.strip().splitlines()[-1]}")
+
+    rows = []
+    for line in process.stderr.splitlines():
+        # Lines look like "import time:       412 |      10234 |   scipy.signal"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us) / 1e6, int(self_us) / 1e6, name.strip()))
+
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def measure_startup(module="UI_Sample_Editor_app", runs=3):
+    """Returns the best cold import time of module over a few fresh interpreters, in seconds."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    timings = []
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{process.stderr.strip().splitlines()[-1]}")
+        timings.append(float(process.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def check_startup_budget(module="UI_Sample_Editor_app", budget=STARTUP_BUDGET):
+    """Returns (passed, seconds) for the cold import time of module against budget."""
+    seconds = measure_startup(module)
+    return seconds <= budget, seconds
+
+
+def eager_imports(module="UI_Sample_Editor_app", lazy=LAZY_MODULES):
+    """Imports module in a fresh interpreter and returns the lazy modules it loaded anyway."""
+    code = f"import sys; import {module}; print(' '.join(sys.modules))"
+    process = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{process.stderr.strip().splitlines()[-1]}")
+    loaded = set(process.stdout.split())
+    return [name for name in lazy if name in loaded]
+
+
+def main(argv=None):
+    """Prints the import time report, exits non-zero over the startup budget or when a lazy module loads eagerly."""
+    parser = argparse.ArgumentParser(description="Measure how long the app takes to import.")
+    parser.add_argument("--module", default="UI_Sample_Editor_app", help="Module to import cold")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET, help="Allowed import time in seconds")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list")
+    args = parser.parse_args(argv)
+
+    for cumulative, self_time, name in import_time_report(args.module, args.top):
+        print(f"{cumulative * 1000:9.1f} ms {self_time * 1000:9.1f} ms  {name}")
+
+    passed, seconds = check_startup_budget(args.module, args.budget)
+    print(f"{args.module} imports in {seconds * 1000:.0f} ms (budget {args.budget * 1000:.0f} ms)")
+    eager = eager_imports(args.module)
+    if eager:
+        print(f"{args.module} imports {', '.join(eager)} at load, they should load lazily")
+    return 0 if passed and not eager else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
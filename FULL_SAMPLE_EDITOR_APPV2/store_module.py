@@ -0,0 +1,342 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import itertools
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+from buffer_module import as_samples, decode, encode
+from memory_module import get_budget, get_decoded_cache
+from decoder_module import get_decoder
+from trace_module import span
+
+# Budget in MB for sample buffers held in memory, beyond it the least recently used are spilled to disk
+SAMPLE_STORE_ENV = "SAMPLE_EDITOR_STORE_MB"
+STORE_MB = 512  # Default when SAMPLE_EDITOR_STORE_MB isn't set
+
+
+def default_store_limit():
+    """Store limit in bytes from SAMPLE_EDITOR_STORE_MB, else STORE_MB."""
+    return int(float(os.environ.get(SAMPLE_STORE_ENV) or STORE_MB) * 2 ** 20)
+
+
+def read_file(file_path):
+    """Decodes a file with all its channels, returns (audio, sample_rate, subtype).
+
+    Formats libsndfile can't read go through the decoder's ffmpeg pool, subtype is None for those.
+    """
+    try:
+        subtype = sf.info(file_path).subtype
+        audio, sample_rate = decode(file_path)
+    except RuntimeError:
+        audio, sample_rate = get_decoder().decode(file_path)
+        subtype = None
+    return audio, sample_rate, subtype
+
+
+def output_subtype(file_path, subtype):
+    """subtype if the format of file_path (by its extension) can hold it, else None for libsndfile's default."""
+    extension = os.path.splitext(file_path)[1][1:].upper()
+    file_format = {"AIF": "AIFF"}.get(extension, extension)
+    if subtype and file_format in sf.available_formats() and sf.check_format(file_format, subtype):
+        return subtype
+    return None
+
+
+class StoredSample:
+    def __init__(self, handle, label, sample_rate=None, subtype=None, file_path=None):
+        """
+        One entry of the store. Buffer entries own their audio and spill it when it leaves memory,
+        file entries stand for a file on disk and simply read it again, and slice entries (virtual
+        chops) are a frame range of a source file, served as a view of its decoded audio.
+        """
+        self.handle = handle
+        self.label = label
+        self.audio = None  # Resident float32 buffer, read-only, or None
+        self.sample_rate = sample_rate
+        self.subtype = subtype  # libsndfile subtype to write the sample with, e.g. "PCM_24"
+        self.file_path = file_path  # File entries only
+        self.slice = None  # Slice entries only: (source path, start frame, end frame, mono, (size, mtime))
+        self.spill_path = None  # .npy copy of a buffer entry that had to leave memory
+        self.source = None  # (path, (size, mtime)) of the file a buffer was decoded from, while it is unchanged
+        self.digest = None
+        self.version = 0  # Store-wide stamp of the contents, a new one whenever they are replaced
+        self.budget_entry = None
+
+    @property
+    def resident(self):
+        return self.audio is not None
+
+
+class SampleStore:
+    def __init__(self, spill_dir=None, limit=None):
+        """
+        Sample buffers addressed by handle, kept in memory up to limit bytes.
+
+        Beyond the limit, or when the memory budget needs room, the least recently used buffers
+        leave memory: buffers are spilled to spill_dir as raw float32 .npy files (no encode, read
+        back in one go) and file entries are just dropped. Nothing is written before that, so chops
+        can be auditioned, processed and exported without a temp file.
+        """
+        self.spill_dir = spill_dir or os.path.join(tempfile.gettempdir(), f"sample_editor_store_{os.getpid()}")
+        self.limit = limit if limit is not None else default_store_limit()
+        self.used = 0
+        self.spills = 0  # Buffers written to the spill folder so far
+        self.reloads = 0  # Buffers read back from the spill folder so far
+        self._entries = OrderedDict()  # handle -> StoredSample, least recently used first
+        self._ids = itertools.count(1)
+        self._versions = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def put(self, audio, sample_rate, subtype=None, label="", source_path=None):
+        """Stores a buffer and returns its handle. The store keeps the array, callers must not modify it.
+
+        source_path names the file the buffer was decoded from, which is then copied instead of
+        re-encoded for as long as neither changes.
+        """
+        entry = StoredSample(f"s{next(self._ids)}", label, int(sample_rate), subtype)
+        entry.version = next(self._versions)
+        if source_path is not None:
+            stat = os.stat(source_path)
+            entry.source = (source_path, (stat.st_size, stat.st_mtime_ns))
+        with self._lock:
+            self._entries[entry.handle] = entry
+        self._set_resident(entry, as_samples(audio))
+        return entry.handle
+
+    def put_file(self, file_path, label=""):
+        """Adds a handle for a file on disk without reading any audio."""
+        entry = StoredSample(f"s{next(self._ids)}", label or os.path.basename(file_path), file_path=file_path)
+        entry.version = next(self._versions)
+        with self._lock:
+            self._entries[entry.handle] = entry
+        return entry.handle
+
+    def put_slices(self, file_path, slices):
+        """
+        Adds virtual chops of a source file, one handle per (start frame, end frame, label).
+
+        Only the header is read, so this takes the same time for any source length and writes
+        nothing. The source is decoded once, through the shared decoded-audio cache, when the
+        first of them is used.
+        """
+        info = sf.info(file_path)
+        stat = os.stat(file_path)
+        source = (os.path.abspath(file_path), info.channels == 1, (stat.st_size, stat.st_mtime_ns))
+        handles = []
+        with self._lock:
+            for start, end, label in slices:
+                entry = StoredSample(f"s{next(self._ids)}", label, info.samplerate, info.subtype)
+                entry.slice = (source[0], max(0, int(start)), min(info.frames, int(end)), source[1], source[2])
+                entry.version = next(self._versions)
+                self._entries[entry.handle] = entry
+                handles.append(entry.handle)
+        return handles
+
+    def info(self, handle):
+        """The StoredSample of a handle, for its sample rate, subtype and label."""
+        with self._lock:
+            entry = self._entries.get(handle)
+        if entry is None:
+            raise KeyError(f"Unknown sample handle {handle}")
+        return entry
+
+    def get(self, handle):
+        """Returns (audio, sample_rate), reading a spilled buffer or a file entry back in when needed.
+
+        Virtual chops return a view into their decoded source, nothing is copied.
+        """
+        entry = self.info(handle)
+        if entry.slice is not None:
+            return self._slice_view(entry), entry.sample_rate
+        with self._lock:
+            self._entries.move_to_end(handle)
+            if entry.resident:
+                if entry.budget_entry is not None:
+                    get_budget().touch(entry.budget_entry)
+                return entry.audio, entry.sample_rate
+
+        with span("store.load", spilled=entry.spill_path is not None) as stage:
+            if entry.spill_path is not None:
+                audio = np.load(entry.spill_path)
+                stage.read_file(entry.spill_path)
+                self.reloads += 1
+            else:
+                audio, entry.sample_rate, entry.subtype = read_file(entry.file_path)
+                stage.read_file(entry.file_path)
+        self._set_resident(entry, audio)
+        return entry.audio, entry.sample_rate
+
+    def replace(self, handle, audio, sample_rate=None):
+        """Swaps in new contents for a handle, e.g. after processing. File entries and virtual chops become buffers."""
+        entry = self.info(handle)
+        with self._lock:
+            self._drop(entry)
+            self._remove_spill(entry)
+            entry.file_path = None
+            entry.slice = None
+            entry.source = None
+            entry.digest = None
+            entry.version = next(self._versions)
+            if sample_rate is not None:
+                entry.sample_rate = int(sample_rate)
+        self._set_resident(entry, as_samples(audio))
+
+    def materialize(self, handle):
+        """Turns a virtual chop into a buffer of its own, e.g. before it is edited or its source goes away."""
+        entry = self.info(handle)
+        if entry.slice is not None:
+            self.replace(handle, self._slice_view(entry).copy())
+
+    def version(self, handle):
+        """Stamp of a handle's current contents. It changes when they are replaced, not when they are spilled or reloaded."""
+        return self.info(handle).version
+
+    def is_virtual(self, handle):
+        return self.info(handle).slice is not None
+
+    def relocate(self, handle, file_path):
+        """Points a file entry at the new path of its file, after a rename."""
+        entry = self.info(handle)
+        if entry.file_path is not None:
+            entry.file_path = file_path
+
+    def backing_file(self, handle):
+        """A file holding exactly this sample, its file entry or unchanged source, or None."""
+        entry = self.info(handle)
+        if entry.file_path is not None:
+            return entry.file_path if os.path.exists(entry.file_path) else None
+        if entry.source is not None:
+            path, stamp = entry.source
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            return path if (stat.st_size, stat.st_mtime_ns) == stamp else None
+        return None
+
+    def write(self, handle, file_path, subtype=None):
+        """Writes a sample to file_path, in its own subtype unless another is given.
+
+        A sample with a backing file of the same format is copied byte for byte instead.
+        """
+        entry = self.info(handle)
+        source = self.backing_file(handle)
+        if os.path.lexists(file_path) and source != file_path:
+            os.remove(file_path)  # It may be a hardlink from an earlier export, never write through it
+        if source is not None and subtype is None and \
+                os.path.splitext(source)[1].lower() == os.path.splitext(file_path)[1].lower():
+            shutil.copyfile(source, file_path)
+            return file_path
+
+        audio, sample_rate = self.get(handle)
+        with span("store.write") as stage:
+            encode(file_path, audio, sample_rate, subtype=output_subtype(file_path, subtype or entry.subtype))
+            stage.wrote_file(file_path)
+        return file_path
+
+    def digest(self, handle):
+        """Hash of a buffer's samples and rate, kept until its contents are replaced."""
+        entry = self.info(handle)
+        if entry.digest is None:
+            audio, sample_rate = self.get(handle)
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(str(sample_rate).encode())
+            digest.update(np.ascontiguousarray(audio).data)
+            entry.digest = digest.hexdigest()
+        return entry.digest
+
+    def spill(self, handle):
+        """Moves a buffer out of memory, writing it to the spill folder unless it is already there or a file."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None or not entry.resident:
+                return
+            if entry.file_path is None and entry.spill_path is None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                spill_path = os.path.join(self.spill_dir, f"{handle}.npy")
+                with span("store.spill") as stage:
+                    np.save(spill_path, entry.audio)
+                    stage.wrote_file(spill_path)
+                entry.spill_path = spill_path
+                self.spills += 1
+            self._drop(entry)
+
+    def discard(self, handle):
+        """Forgets a handle and deletes its spill file. File entries leave their file alone."""
+        with self._lock:
+            entry = self._entries.pop(handle, None)
+            if entry is not None:
+                self._drop(entry)
+                self._remove_spill(entry)
+
+    def clear(self):
+        """Discards every handle and removes the spill folder."""
+        with self._lock:
+            for handle in list(self._entries):
+                self.discard(handle)
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def format_report(self):
+        resident = sum(entry.resident for entry in self._entries.values())
+        return (f"sample store: {len(self._entries)} samples, {resident} in memory using {self.used / 2 ** 20:.1f} of "
+                f"{self.limit / 2 ** 20:.0f} MB, {self.spills} spilled, {self.reloads} read back")
+
+    def _slice_view(self, entry):
+        """The frames of a virtual chop, a read-only view into the cached decode of its source."""
+        path, start, end, mono, stamp = entry.slice
+        stat = os.stat(path)
+        if (stat.st_size, stat.st_mtime_ns) != stamp:
+            raise RuntimeError(f"{path} changed since {entry.label} was chopped from it")
+        # Mono sources share the chopper's cache entry, the others are decoded once with all channels
+        audio, _ = get_decoded_cache().load(path, mono=mono)
+        return audio[start:end]
+
+    def _set_resident(self, entry, audio):
+        audio.flags.writeable = False  # Shared with every caller of get(), nobody may modify it in place
+        # Registered outside the store lock, the budget may call back into spill() to make room
+        budget_entry = get_budget().register(audio, "sample_store", entry.label,
+                                             on_evict=lambda: self.spill(entry.handle))
+        with self._lock:
+            if entry.handle not in self._entries:
+                return  # Discarded meanwhile
+            self._drop(entry)
+            entry.audio = audio
+            entry.budget_entry = budget_entry
+            self.used += audio.nbytes
+            self._entries.move_to_end(entry.handle)
+
+            # Least recently used buffers make room, never the one just stored
+            for other in list(self._entries.values()):
+                if self.used <= self.limit:
+                    break
+                if other is not entry and other.resident:
+                    self.spill(other.handle)
+
+    def _drop(self, entry):
+        if entry.resident:
+            self.used -= entry.audio.nbytes
+            entry.audio = None
+            entry.budget_entry = None
+
+    @staticmethod
+    def _remove_spill(entry):
+        if entry.spill_path is not None:
+            if os.path.exists(entry.spill_path):
+                os.remove(entry.spill_path)
+            entry.spill_path = None
+
+
+_sample_store = None
+
+
+def get_sample_store():
+    """The sample store shared by the whole process."""
+    global _sample_store
+    if _sample_store is None:
+        _sample_store = SampleStore()
+    return _sample_store
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# The app is a folder of flat modules, tests import them the way the entry scripts do
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture
+def app_dir(monkeypatch):
+    """Runs the test from the app folder, where fresh interpreters find the app modules."""
+    monkeypatch.chdir(APP_DIR)
+    return APP_DIR
@@ -0,0 +1,157 @@
+"""
+The float32 policy of buffer_module on the hot paths.
+
+Output dtypes are checked directly. Hidden float64 copies are caught by their size: a float64
+copy of a buffer is twice the float32 buffer, so each path has a peak allocation, measured with
+tracemalloc, that stays below what one such copy would add.
+"""
+import tracemalloc
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from buffer_module import SAMPLE_DTYPE, decode, apply_fades, apply_gain
+from loudness_module import LoudnessAnalyzer
+from resample_module import Resampler
+from silence_module import SilenceProcessor
+from utility_module import UtilityProcessor, BLOCK_SIZE
+
+SAMPLE_RATE = 44100
+
+
+def traced_peak(func, *args):
+    """Runs func under tracemalloc and returns (result, peak bytes allocated while it ran).
+
+    func is called once beforehand on copies of its arrays, so lazy imports and caches filled on
+    first use aren't counted.
+    """
+    func(*(arg.copy() if isinstance(arg, np.ndarray) else arg for arg in args))
+    tracemalloc.start()
+    try:
+        result = func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+@pytest.fixture(scope="module")
+def mono():
+    audio = (0.3 * np.random.default_rng(3).standard_normal(10 * SAMPLE_RATE)).astype(SAMPLE_DTYPE)
+    audio[:SAMPLE_RATE] = 0  # Leading silence for the crop
+    audio.flags.writeable = False
+    return audio
+
+
+@pytest.fixture(params=["mono", "stereo"])
+def buffer(request, mono):
+    """A writable float32 buffer, (frames,) or (frames, 2)."""
+    return mono.copy() if request.param == "mono" else np.stack([mono, mono], axis=1)
+
+
+@pytest.fixture
+def utility():
+    processor = UtilityProcessor()
+    processor.true_peak_ceiling = None
+    return processor
+
+
+def test_decode_is_float32(tmp_path, mono):
+    mono_path, stereo_path = str(tmp_path / "mono.wav"), str(tmp_path / "stereo.wav")
+    sf.write(mono_path, mono, SAMPLE_RATE, subtype='PCM_24')
+    sf.write(stereo_path, np.stack([mono, mono], axis=1), SAMPLE_RATE, subtype='PCM_16')
+
+    audio, _ = decode(mono_path)
+    assert audio.dtype == SAMPLE_DTYPE
+    audio, _ = decode(stereo_path)
+    assert audio.dtype == SAMPLE_DTYPE and audio.shape == (len(mono), 2)
+    audio, _ = decode(stereo_path, mono=True)
+    assert audio.dtype == SAMPLE_DTYPE and audio.shape == (len(mono),)
+
+
+def test_fades_and_gain_work_in_place(buffer):
+    # The only allocations are the cached fade curves, a tenth of the buffer each at most
+    frames = len(buffer)
+    result, peak = traced_peak(apply_fades, buffer, frames // 10, frames // 10)
+    assert result is buffer and result.dtype == SAMPLE_DTYPE
+    assert peak < buffer.nbytes * 0.25
+
+    result, peak = traced_peak(apply_gain, buffer, 0.5)
+    assert result is buffer and result.dtype == SAMPLE_DTYPE
+    assert peak < 1024
+
+
+def test_apply_fade_works_in_place(buffer):
+    processor = SilenceProcessor(fade_in_duration=0.01, fade_out_duration=0.1)
+    result, peak = traced_peak(processor.apply_fade, buffer, SAMPLE_RATE)
+    assert result is buffer and result.dtype == SAMPLE_DTYPE
+    assert peak < buffer.nbytes * 0.25
+
+
+def test_process_buffer_stays_float32(buffer):
+    # Crop and fade: a view of the buffer plus float32 chunks of frame energies. The "split" trim
+    # mode is left out, librosa.effects.split makes float64 copies of its own
+    processor = SilenceProcessor(fade_in_duration=0.01, fade_out_duration=0.1)
+    result, peak = traced_peak(processor.process_buffer, buffer, SAMPLE_RATE)
+    assert result.dtype == SAMPLE_DTYPE and result.shape[1:] == buffer.shape[1:]
+    assert np.shares_memory(result, buffer)
+    assert len(result) < len(buffer)
+    assert peak < buffer.nbytes * 1.5
+
+
+def test_normalize_buffer_rms_works_in_place(buffer, utility):
+    # One float32 |x| for the sample peak
+    (result, gain), peak = traced_peak(utility.normalize_buffer, buffer, SAMPLE_RATE)
+    assert gain is not None and result is buffer and result.dtype == SAMPLE_DTYPE
+    assert peak < buffer.nbytes * 1.5
+
+
+def test_normalize_buffer_true_peak_oversamples_in_float32(buffer, utility):
+    # The true peak adds the 4x oversampled copy, which would be 8x in float64
+    utility.true_peak_ceiling = -1.0
+    (result, gain), peak = traced_peak(utility.normalize_buffer, buffer, SAMPLE_RATE)
+    assert gain is not None and result is buffer and result.dtype == SAMPLE_DTYPE
+    assert peak < buffer.nbytes * 4.5
+
+
+def test_normalize_buffer_lufs_stays_float32(buffer, utility):
+    utility.normalize_mode = "lufs"
+    utility.true_peak_ceiling = -1.0
+    (result, gain), peak = traced_peak(utility.normalize_buffer, buffer, SAMPLE_RATE)
+    assert gain is not None and result is buffer and result.dtype == SAMPLE_DTYPE
+    assert peak < buffer.nbytes * 5.5
+
+
+def test_loudness_filters_in_float32(buffer):
+    # Loudness stacks the clips, oversamples them 4x for the true peak and filters them, all in float32
+    clips = [buffer.reshape(len(buffer), -1)]
+    (measurement,), peak = traced_peak(LoudnessAnalyzer(workers=1).analyze_batch, clips, SAMPLE_RATE)
+    assert measurement["lufs"] is not None
+    assert peak < buffer.nbytes * 5.5
+
+
+def test_resample_stays_float32(mono):
+    resampled, peak = traced_peak(Resampler().resample, mono, SAMPLE_RATE, 48000)
+    assert resampled.dtype == SAMPLE_DTYPE
+    assert peak < mono.nbytes * 2.5
+
+
+def test_process_sample_decodes_once(tmp_path, mono):
+    # Decode, crop, fade and encode: the decoded buffer plus one float32 chunk of frame energies
+    path = str(tmp_path / "mono.wav")
+    sf.write(path, mono, SAMPLE_RATE, subtype='PCM_24')
+    processor = SilenceProcessor(fade_in_duration=0.01, fade_out_duration=0.1)
+    output, peak = traced_peak(processor.process_sample, path, str(tmp_path))
+    assert output is not None
+    assert peak < mono.nbytes * 2.5
+
+
+def test_normalize_sample_streams_blocks(tmp_path, mono, utility):
+    # Streaming normalize holds a block (and its 4x oversampled copy) at a time whatever the file size
+    path = str(tmp_path / "mono.wav")
+    sf.write(path, mono, SAMPLE_RATE, subtype='PCM_24')
+    utility.true_peak_ceiling = -1.0
+    block_bytes = BLOCK_SIZE * np.dtype(SAMPLE_DTYPE).itemsize
+    _, peak = traced_peak(utility.normalize_sample, path, -12, str(tmp_path / "normalized.wav"))
+    assert peak < block_bytes * 8
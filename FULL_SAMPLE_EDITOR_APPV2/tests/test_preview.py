@@ -0,0 +1,92 @@
+"""
+PreviewChain only redoes the stages whose settings or sample changed, for every kind of sample.
+"""
+import numpy as np
+import pytest
+import soundfile as sf
+
+from list_module import SampleListManager
+from preview_module import PreviewChain
+from silence_module import SilenceProcessor
+from store_module import SampleStore
+from utility_module import UtilityProcessor
+
+SAMPLE_RATE = 44100
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """A list with an imported buffer and a virtual chop of the same audio, padded with silence."""
+    audio = np.zeros(4 * SAMPLE_RATE, dtype=np.float32)
+    audio[SAMPLE_RATE:3 * SAMPLE_RATE] = 0.2 * np.random.default_rng(5).standard_normal(2 * SAMPLE_RATE)
+    source = str(tmp_path / "source.wav")
+    sf.write(source, audio, SAMPLE_RATE, subtype='FLOAT')
+
+    manager = SampleListManager(str(tmp_path / "temp"), store=SampleStore(spill_dir=str(tmp_path / "spill")))
+    manager.add_sample_buffers([("buffer.wav", audio.copy(), SAMPLE_RATE, None)])
+    manager.add_virtual_chops(source, [("chop.wav", 0, len(audio))])
+    return manager
+
+
+@pytest.fixture
+def chain():
+    utility = UtilityProcessor()
+    utility.normalize_enabled = True
+    utility.normalize_mode = "rms"
+    return PreviewChain(SilenceProcessor(fade_in_duration=0.01, fade_out_duration=0.05), utility)
+
+
+@pytest.mark.parametrize("sample_name", ["buffer.wav", "chop.wav"])
+def test_fade_change_reuses_crop(manager, chain, sample_name):
+    chain.render(manager, sample_name)
+    assert chain.recomputed == ["energy", "crop", "fade", "levels", "gain"]
+
+    chain.silence_processor.fade_out_duration = 0.2
+    chain.render(manager, sample_name)
+    assert chain.recomputed == ["fade", "levels", "gain"]
+
+
+@pytest.mark.parametrize("sample_name", ["buffer.wav", "chop.wav"])
+def test_target_change_only_reapplies_gain(manager, chain, sample_name):
+    chain.render(manager, sample_name)
+    chain.utility_processor.target_db = -6
+    chain.render(manager, sample_name)
+    assert chain.recomputed == ["gain"]
+
+    chain.render(manager, sample_name)
+    assert chain.recomputed == []
+
+
+def test_threshold_change_reuses_energy(manager, chain):
+    chain.render(manager, "chop.wav")
+    chain.silence_processor.silence_threshold = -20
+    chain.render(manager, "chop.wav")
+    assert chain.recomputed == ["crop", "fade", "levels", "gain"]
+
+
+def test_replaced_sample_is_rendered_again(manager, chain):
+    first, _ = chain.render(manager, "chop.wav")
+    handle = manager.sample_handle("chop.wav")
+    audio, _ = manager.read_sample("chop.wav")
+    manager.store.replace(handle, audio[::-1].copy())
+
+    second, _ = chain.render(manager, "chop.wav")
+    assert chain.recomputed == ["energy", "crop", "fade", "levels", "gain"]
+    assert not np.array_equal(first, second)
+
+
+def test_spilled_sample_keeps_its_stages(manager, chain):
+    chain.render(manager, "buffer.wav")
+    manager.store.spill(manager.sample_handle("buffer.wav"))
+    chain.render(manager, "buffer.wav")
+    assert chain.recomputed == []
+
+
+def test_matches_the_export_chain(manager, chain):
+    # Crop and fade, then normalize, as export runs them
+    for sample_name in ("buffer.wav", "chop.wav"):
+        preview, _ = chain.render(manager, sample_name)
+        audio, sample_rate = manager.read_sample(sample_name)
+        expected = chain.silence_processor.process_buffer(audio, sample_rate)
+        expected, _ = chain.utility_processor.normalize_buffer(expected, sample_rate)
+        np.testing.assert_array_equal(preview, expected)
@@ -0,0 +1,104 @@
+"""
+Bulk renames through SampleListManager.rename_samples, and recovery from a journal left by a crash.
+"""
+import os
+
+import pytest
+
+from list_module import SampleListManager
+from store_module import SampleStore
+
+NAMES = ["a.wav", "b.wav", "c.wav"]
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """A list of three file samples, each file holding its own original name."""
+    originals = []
+    for name in NAMES:
+        path = tmp_path / "import" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(name.encode())
+        originals.append(str(path))
+    manager = make_manager(tmp_path)
+    manager.load_samples(originals)
+    for name in NAMES:
+        manager.update_tag(name, f"tag_{name}")
+    return manager
+
+
+def make_manager(tmp_path):
+    return SampleListManager(str(tmp_path / "temp"), store=SampleStore(spill_dir=str(tmp_path / "spill")))
+
+
+def contents(manager):
+    """{sample name: original name held by its file}, read through the manager's own paths."""
+    result = {}
+    for name in manager.get_sample_names():
+        with open(manager.file_paths[name], 'rb') as f:
+            result[name] = f.read().decode()
+    return result
+
+
+def start_rename(manager, plan, phase, finished):
+    """Leaves the files and journal as a crash in the given phase would, after `finished` moves of that phase."""
+    steps = []
+    for i, (old, new) in enumerate(plan.items()):
+        folder = os.path.dirname(manager.file_paths[old])
+        steps.append([manager.file_paths[old], os.path.join(folder, f".renaming_{i}"), os.path.join(folder, new)])
+    manager.write_rename_journal(phase, steps)
+    moves = [(source, temp) for source, temp, _ in steps]
+    if phase == 2:
+        for source, temp in moves:
+            os.rename(source, temp)
+        moves = [(temp, target) for _, temp, target in steps]
+    for origin, destination in moves[:finished]:
+        os.rename(origin, destination)
+
+
+def test_swap(manager):
+    manager.rename_samples({"a.wav": "b.wav", "b.wav": "a.wav"})
+    assert contents(manager) == {"a.wav": "b.wav", "b.wav": "a.wav", "c.wav": "c.wav"}
+    assert manager.tags["a.wav"] == "tag_b.wav" and manager.tags["b.wav"] == "tag_a.wav"
+    assert not os.path.exists(manager.rename_journal_path)
+
+
+def test_three_cycle(manager):
+    manager.rename_samples({"a.wav": "b.wav", "b.wav": "c.wav", "c.wav": "a.wav"})
+    assert contents(manager) == {"b.wav": "a.wav", "c.wav": "b.wav", "a.wav": "c.wav"}
+    # The list keeps its order, now under the new names
+    assert [os.path.basename(path) for path in manager.samples] == ["b.wav", "c.wav", "a.wav"]
+    assert sorted(os.listdir(manager.temp_folder)) == NAMES + ["sample_tags.txt"]
+
+
+def test_failed_move_rolls_back(manager, monkeypatch):
+    before = (contents(manager), dict(manager.file_paths), list(manager.samples), dict(manager.tags))
+    rename = os.rename
+    from_temp = []
+
+    def failing_rename(origin, destination):
+        # Phase 2 moves out of the temp names, the second of those fails with one target already in place
+        if ".renaming_" in os.path.basename(origin):
+            from_temp.append(origin)
+            if len(from_temp) == 2:
+                raise OSError("disk full")
+        rename(origin, destination)
+
+    monkeypatch.setattr(os, "rename", failing_rename)
+    with pytest.raises(OSError):
+        manager.rename_samples({"a.wav": "b.wav", "b.wav": "c.wav", "c.wav": "a.wav"})
+    monkeypatch.undo()
+
+    assert (contents(manager), manager.file_paths, manager.samples, manager.tags) == before
+    assert not os.path.exists(manager.rename_journal_path)
+    assert not [name for name in os.listdir(manager.temp_folder) if name.startswith(".renaming_")]
+
+
+@pytest.mark.parametrize("phase, finished", [(1, 0), (1, 2), (2, 0), (2, 1), (2, 3)])
+def test_interrupted_rename_is_rolled_back(tmp_path, manager, phase, finished):
+    start_rename(manager, {"a.wav": "b.wav", "b.wav": "c.wav", "c.wav": "a.wav"}, phase, finished)
+
+    # The next start on the same temp folder finds the journal
+    make_manager(tmp_path)
+    assert contents(manager) == {name: name for name in NAMES}
+    assert sorted(os.listdir(manager.temp_folder)) == NAMES + ["sample_tags.txt"]
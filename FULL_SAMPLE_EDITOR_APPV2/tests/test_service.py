@@ -0,0 +1,262 @@
+"""
+JobService run in process, with a runner standing in for batch_module.run_job.
+
+The runner is the service's own extension point; these tests swap it for one that records what
+it was given, reports progress and waits on a gate, so the queue can be held in a known state.
+"""
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import service_module
+from service_module import JobService, JobRequestHandler, JobClient
+
+TIMEOUT = 10  # Seconds any single wait may take before the test fails instead of hanging
+
+
+class Runner:
+    def __init__(self, gated=False, steps=0, fail=False):
+        """Records the name of every job it runs, holding each one until release() when gated."""
+        self.ran = []
+        self.running = 0
+        self.most_running = 0
+        self.steps = steps
+        self.fail = fail
+        self.started = threading.Semaphore(0)
+        self._gate = threading.Event()
+        if not gated:
+            self._gate.set()
+        self._lock = threading.Lock()
+
+    def release(self):
+        self._gate.set()
+
+    def __call__(self, job, progress):
+        with self._lock:
+            self.ran.append(os.path.basename(job["sources"][0]))
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        self.started.release()
+        try:
+            assert self._gate.wait(TIMEOUT)
+            for step in range(self.steps):
+                progress({"stage": "chop", "step": step})
+            if self.fail:
+                raise RuntimeError("source is unreadable")
+            return {"sources": 1, "failed": 0}
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """Names a job source after its file, so the runner's record shows which job ran."""
+    def make(name):
+        path = tmp_path / "sources" / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"")
+        return {"sources": [str(path)]}
+    return make
+
+
+def make_service(tmp_path, runner, workers=1):
+    return JobService(str(tmp_path / "state"), workers=workers, runner=runner)
+
+
+def wait_all(service, job_ids):
+    records = [service.wait(job_id, timeout=TIMEOUT) for job_id in job_ids]
+    assert all(record["status"] in ("done", "failed", "cancelled") for record in records)
+    return records
+
+
+def test_higher_priority_runs_first(tmp_path, sources):
+    runner = Runner()
+    service = make_service(tmp_path, runner)
+    job_ids = [service.submit(sources("low_1"), priority=0), service.submit(sources("high"), priority=5),
+               service.submit(sources("low_2"), priority=0), service.submit(sources("middle"), priority=2)]
+    service.start()
+    wait_all(service, job_ids)
+    service.stop()
+    assert runner.ran == ["high", "middle", "low_1", "low_2"]  # Equal priorities keep submission order
+
+
+def test_worker_pool_is_bounded(tmp_path, sources):
+    runner = Runner(gated=True)
+    service = make_service(tmp_path, runner, workers=2)
+    job_ids = [service.submit(sources(f"job_{i}")) for i in range(5)]
+    service.start()
+    for _ in range(2):
+        assert runner.started.acquire(timeout=TIMEOUT)
+    assert not runner.started.acquire(timeout=0.2)  # The third waits for a free worker
+    assert [service.get(job_id)["status"] for job_id in job_ids].count("running") == 2
+
+    runner.release()
+    records = wait_all(service, job_ids)
+    service.stop()
+    assert [record["status"] for record in records] == ["done"] * 5
+    assert runner.most_running == 2
+
+
+def test_state_survives_a_restart(tmp_path, sources):
+    runner = Runner(gated=True)
+    service = make_service(tmp_path, runner)
+    running_id = service.submit(sources("interrupted"))
+    queued_id = service.submit(sources("waiting"), priority=3)
+    cancelled_id = service.submit(sources("cancelled"))
+    assert service.cancel(cancelled_id)
+    service.start()
+    assert runner.started.acquire(timeout=TIMEOUT)  # "waiting" is running, as the higher priority
+
+    # A second service on the same state folder is what a restart after a crash finds in jobs.json
+    with open(os.path.join(str(tmp_path / "state"), "jobs.json")) as f:
+        assert {record["id"]: record["status"] for record in json.load(f)["jobs"]}[queued_id] == "running"
+    restarted_runner = Runner()
+    restarted = make_service(tmp_path, restarted_runner)
+    runner.release()
+    service.stop()
+
+    record = restarted.get(queued_id)
+    assert record["status"] == "queued" and record["events"][-1]["stage"] == "requeued"
+    assert restarted.get(running_id)["status"] == "queued"
+    assert restarted.get(cancelled_id)["status"] == "cancelled"
+
+    restarted.start()
+    wait_all(restarted, [running_id, queued_id])
+    restarted.stop()
+    assert restarted_runner.ran == ["waiting", "interrupted"]  # Requeued jobs keep their priority
+
+    # Finished jobs are history after the next restart, nothing runs again
+    history = make_service(tmp_path, Runner())
+    assert [job["status"] for job in history.list_jobs()] == ["cancelled", "done", "done"]
+
+
+def test_cancel_only_stops_queued_jobs(tmp_path, sources):
+    runner = Runner(gated=True)
+    service = make_service(tmp_path, runner)
+    running_id = service.submit(sources("running"))
+    queued_id = service.submit(sources("queued"))
+    service.start()
+    assert runner.started.acquire(timeout=TIMEOUT)
+
+    assert not service.cancel(running_id)
+    assert service.cancel(queued_id)
+    assert not service.cancel(queued_id)
+    runner.release()
+    done, cancelled = wait_all(service, [running_id, queued_id])
+    service.stop()
+
+    assert done["status"] == "done"
+    assert cancelled["status"] == "cancelled" and cancelled["started"] is None
+    assert runner.ran == ["running"]
+    assert not service.cancel(running_id)
+    with pytest.raises(KeyError):
+        service.cancel("no-such-job")
+
+
+def test_runner_errors_fail_the_job(tmp_path, sources):
+    service = make_service(tmp_path, Runner(fail=True))
+    job_id = service.submit(sources("broken"))
+    service.start()
+    record = service.wait(job_id, timeout=TIMEOUT)
+    service.stop()
+    assert record["status"] == "failed"
+    assert record["error"] == "RuntimeError: source is unreadable"
+    assert record["events"][-1] == {"stage": "finished", "status": "failed", "error": record["error"],
+                                    "time": record["events"][-1]["time"]}
+
+
+def test_staging_folder_is_removed_after_the_job(tmp_path):
+    service = make_service(tmp_path, Runner())
+    staged = service.create_staging()
+    source = os.path.join(staged, "staged.wav")
+    open(source, 'wb').close()
+    job_id = service.submit({"sources": [source]}, staged=staged)
+    service.start()
+    record = service.wait(job_id, timeout=TIMEOUT)
+    service.stop()
+    assert record["status"] == "done"
+    assert not os.path.exists(staged) and not os.path.exists(record["job"]["work_dir"])
+
+
+def test_only_its_own_staging_folders_are_taken(tmp_path, sources):
+    service = make_service(tmp_path, Runner())
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    for staged in (str(outside), service.staging_root, service.state_dir,
+                   os.path.join(service.create_staging(), "..", "..", "..", "outside")):
+        with pytest.raises(ValueError):
+            service.submit(sources("stray"), staged=staged)
+    assert outside.exists() and service.list_jobs() == []
+
+
+def test_cancel_removes_the_staging_folder(tmp_path, sources):
+    service = make_service(tmp_path, Runner())
+    staged = service.create_staging()
+    assert service.cancel(service.submit(sources("cancelled"), staged=staged))
+    assert not os.path.exists(staged)
+
+
+def test_failed_cleanup_still_finishes_the_job(tmp_path, sources, monkeypatch):
+    def failing_rmtree(path):
+        raise PermissionError(f"{path} is in use")
+
+    monkeypatch.setattr(service_module.shutil, "rmtree", failing_rmtree)
+    service = make_service(tmp_path, Runner())
+    staged = service.create_staging()
+    job_ids = [service.submit(sources("first"), staged=staged), service.submit(sources("second"))]
+    service.start()
+    records = wait_all(service, job_ids)
+    service.stop()
+    assert [record["status"] for record in records] == ["done", "done"]  # The worker kept going
+
+
+def test_progress_events_stream_in_order(tmp_path, sources):
+    runner = Runner(gated=True, steps=3)
+    service = make_service(tmp_path, runner)
+    job_id = service.submit(sources("progress"))
+    service.start()
+    assert runner.started.acquire(timeout=TIMEOUT)
+
+    events = service.wait_events(job_id, after=0, timeout=TIMEOUT)
+    assert [event["stage"] for event in events] == ["queued", "started"]
+    assert service.wait_events(job_id, after=len(events), timeout=0.1) == []  # Nothing new while held
+    runner.release()
+    while events[-1]["stage"] != "finished":
+        events += service.wait_events(job_id, after=len(events), timeout=TIMEOUT)
+    service.stop()
+
+    assert [event["stage"] for event in events] == ["queued", "started", "chop", "chop", "chop", "finished"]
+    assert [event["step"] for event in events if event["stage"] == "chop"] == [0, 1, 2]
+
+
+def test_progress_streams_over_http(tmp_path, sources):
+    runner = Runner(gated=True, steps=2)
+    service = make_service(tmp_path, runner)
+    service.start()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), JobRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = JobClient(f"http://127.0.0.1:{server.server_address[1]}", timeout=TIMEOUT)
+        job_id = client.submit(sources("remote"), priority=1)
+        stream = client.events(job_id)
+        assert next(stream)["stage"] == "queued"
+        runner.release()
+        stages = [event["stage"] for event in stream]
+        assert stages == ["started", "chop", "chop", "finished"]
+        assert client.status(job_id)["status"] == "done"
+
+        staged = client.create_staging()
+        assert os.path.dirname(staged) == service.staging_root
+        with pytest.raises(RuntimeError, match="400"):
+            client.submit(sources("remote"), staged=str(tmp_path))
+        assert tmp_path.exists()
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.stop()
@@ -0,0 +1,25 @@
+import pytest
+
+from startup_module import STARTUP_BUDGET, check_startup_budget, eager_imports
+
+# Everything the UI module imports at load apart from Qt, so the lazy imports are checked without a display
+UI_DEPENDENCIES = ("chopper_module, list_module, utility_module, silence_module, signature_module, "
+                   "loudness_module, rename_module, startup_module, trace_module, memory_module, service_module, "
+                   "pipeline_module, session_module, buffer_module, store_module, thumbnail_module, preview_module")
+
+pytestmark = pytest.mark.usefixtures("app_dir")
+
+
+def test_ui_dependencies_import_no_heavy_modules():
+    assert eager_imports(UI_DEPENDENCIES) == []
+
+
+def test_ui_starts_within_budget():
+    pytest.importorskip("PyQt5")
+    passed, seconds = check_startup_budget("UI_Sample_Editor_app")
+    assert passed, f"UI_Sample_Editor_app took {seconds:.2f} s to import, budget {STARTUP_BUDGET} s"
+
+
+def test_ui_imports_no_heavy_modules():
+    pytest.importorskip("PyQt5")
+    assert eager_imports("UI_Sample_Editor_app") == []
@@ -0,0 +1,196 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from trace_module import span
+
+# Folder of the on-disk thumbnail cache, shared by every session and keyed by content hash
+THUMBNAIL_ENV = "SAMPLE_EDITOR_THUMBNAILS"
+DEFAULT_THUMBNAIL_DIR = os.path.join(os.path.expanduser("~"), ".sample_editor_thumbnails")
+THUMBNAIL_COLUMNS = 96  # Min/max pairs per thumbnail, 192 bytes on disk
+THUMBNAIL_WORKERS = 2  # Background threads generating thumbnails
+MEMORY_THUMBNAILS = 20000  # Summaries kept in memory, about 4 MB
+
+
+def summarize(audio, columns=THUMBNAIL_COLUMNS):
+    """
+    Peak summary of a float32 (frames,) or (frames, channels) buffer as int8 of shape (2, columns).
+
+    Row 0 holds the minimum and row 1 the maximum of every column over all channels, scaled so
+    full scale is 127. A buffer shorter than columns spreads each frame over several columns.
+    """
+    summary = np.zeros((2, columns), dtype=np.int8)
+    if len(audio) == 0:
+        return summary
+    starts = np.unique((np.arange(columns) * len(audio)) // columns)
+    mins = np.minimum.reduceat(audio, starts, axis=0)
+    maxs = np.maximum.reduceat(audio, starts, axis=0)
+    if audio.ndim > 1:
+        mins, maxs = mins.min(axis=1), maxs.max(axis=1)
+    positions = np.searchsorted(starts, (np.arange(columns) * len(audio)) // columns)
+    summary[0] = np.clip(np.round(mins[positions] * 127), -127, 127)
+    summary[1] = np.clip(np.round(maxs[positions] * 127), -127, 127)
+    return summary
+
+
+def thumbnail_pixmap(summary, width, height, color=(30, 60, 200)):
+    """Draws a summary as a width x height QPixmap, one vertical line per column. GUI thread only."""
+    from PyQt5.QtCore import Qt, QLineF
+    from PyQt5.QtGui import QPixmap, QPainter, QPen, QColor
+
+    pixmap = QPixmap(width, height)
+    pixmap.fill(Qt.transparent)
+    painter = QPainter(pixmap)
+    painter.setPen(QPen(QColor(*color), 1))
+    middle = height / 2
+    scale = middle / 127
+    x = np.arange(summary.shape[1]) * width / summary.shape[1]
+    tops = middle - summary[1].astype(np.float32) * scale
+    bottoms = middle - summary[0].astype(np.float32) * scale
+    painter.drawLines([QLineF(left, top, left, max(bottom, top + 1)) for left, top, bottom in
+                       zip(x.tolist(), tops.tolist(), bottoms.tolist())])
+    painter.end()
+    return pixmap
+
+
+class ThumbnailCache:
+    def __init__(self, cache_dir=None, workers=THUMBNAIL_WORKERS, columns=THUMBNAIL_COLUMNS):
+        """
+        Waveform thumbnails of list samples, made by background workers and cached on disk.
+
+        Callers ask by key (the sample name) and never wait: get() only looks in memory, and
+        request() schedules the work. A worker hashes the sample, reads its summary from disk when
+        any session has made one for the same content, and otherwise decodes the sample once and
+        writes the summary for next time. Requests for rows that scrolled out of view are dropped
+        with prune() before they start.
+        """
+        self.cache_dir = cache_dir or os.environ.get(THUMBNAIL_ENV) or DEFAULT_THUMBNAIL_DIR
+        self.columns = columns
+        self.generated = 0  # Summaries computed from audio so far
+        self.loaded = 0  # Summaries read from the disk cache so far
+        self._by_key = {}  # key -> content hash
+        self._failed = set()  # Keys whose sample couldn't be read, not retried
+        self._summaries = OrderedDict()  # content hash -> summary, least recently used first
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+
+    def path(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.{self.columns}.peaks")
+
+    def get(self, key):
+        """The summary of key if it is ready, else None. Never touches the disk or the audio."""
+        with self._lock:
+            digest = self._by_key.get(key)
+            summary = self._summaries.get(digest) if digest is not None else None
+            if summary is not None:
+                self._summaries.move_to_end(digest)
+            return summary
+
+    def request(self, key, digest, load):
+        """
+        Schedules the thumbnail of key unless it is ready or already scheduled. Returns True once
+        there is nothing left to wait for: the summary is ready, or it failed and get() stays None.
+
+        digest() returns the content hash and load() the (audio, sample_rate) of the sample, both
+        are called on a worker thread.
+        """
+        if self.get(key) is not None:
+            return True
+        with self._lock:
+            if key in self._failed:
+                return True
+            if key not in self._pending:
+                self._pending[key] = self._executor.submit(self._make, key, digest, load)
+        return False
+
+    def prune(self, keys):
+        """Cancels the scheduled thumbnails not in keys (e.g. the visible rows) that haven't started yet."""
+        keys = set(keys)
+        with self._lock:
+            for key, future in list(self._pending.items()):
+                if key not in keys and future.cancel():
+                    del self._pending[key]
+
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def forget(self, key=None):
+        """Drops what a key (or, without one, every key) points to, e.g. after a rename or clearing the list.
+
+        The summaries stay cached, so the same content comes back without being decoded again.
+        """
+        with self._lock:
+            if key is None:
+                self._by_key.clear()
+                self._failed.clear()
+            else:
+                self._by_key.pop(key, None)
+                self._failed.discard(key)
+
+    def _make(self, key, digest, load):
+        try:
+            digest = digest()
+            if digest is None:
+                raise KeyError("sample is gone")
+            with self._lock:
+                summary = self._summaries.get(digest)
+            if summary is None:
+                summary = self._read(digest)
+            if summary is None:
+                with span("thumbnail.generate") as stage:
+                    audio, _ = load()
+                    summary = summarize(audio, self.columns)
+                    stage.add(samples=audio.size)
+                self._write(digest, summary)
+                self.generated += 1
+            with self._lock:
+                self._summaries[digest] = summary
+                self._summaries.move_to_end(digest)
+                while len(self._summaries) > MEMORY_THUMBNAILS:
+                    self._summaries.popitem(last=False)
+                self._by_key[key] = digest
+        except Exception as e:
+            print(f"Thumbnail for {key} failed: {e}")
+            with self._lock:
+                self._failed.add(key)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _read(self, digest):
+        try:
+            with open(self.path(digest), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) != 2 * self.columns:
+            return None  # Truncated by a crash mid-write, it is made again
+        self.loaded += 1
+        return np.frombuffer(data, dtype=np.int8).reshape(2, self.columns)
+
+    def _write(self, digest, summary):
+        path = self.path(digest)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(summary.tobytes())
+            os.replace(temp_path, path)  # Readers see the whole summary or none of it
+        except OSError as e:
+            print(f"Could not cache thumbnail {digest}: {e}")
+
+
+_thumbnail_cache = None
+
+
+def get_thumbnail_cache():
+    """The thumbnail cache shared by the whole process."""
+    global _thumbnail_cache
+    if _thumbnail_cache is None:
+        _thumbnail_cache = ThumbnailCache()
+    return _thumbnail_cache
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import atexit
+import threading
+import functools
+import tracemalloc
+
+# Counters a span can carry, summed per stage in the summary
+COUNTERS = ["bytes_read", "bytes_written", "samples"]
+
+# Spans open on each thread, used to carry tracemalloc peaks from nested spans up to their parents
+_open_spans = threading.local()
+
+# Setting this to a file path traces the whole app run and writes the Chrome trace there at exit
+TRACE_ENV = "SAMPLE_EDITOR_TRACE"
+TRACE_MEMORY_ENV = "SAMPLE_EDITOR_TRACE_MEMORY"  # Set to 1 to also record tracemalloc peaks per span
+
+
+class _NullSpan:
+    """Stands in for a span while tracing is off, every method is a no-op."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def add(self, **counters):
+        pass
+
+    def read_file(self, path):
+        pass
+
+    def wrote_file(self, path):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.counters = {}
+
+    def __enter__(self):
+        if self.tracer.memory:
+            # Peak since the last reset belongs to the parent span, stash it there before resetting
+            stack = _open_spans.__dict__.setdefault("stack", [])
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = current
+            self.child_peak = 0
+            stack.append(self)
+        self.start_ns = time.perf_counter_ns()
+        self.cpu_start_ns = time.thread_time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_ns = time.perf_counter_ns() - self.start_ns
+        cpu_ns = time.thread_time_ns() - self.cpu_start_ns
+        if self.tracer.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            self.counters["peak_memory"] = max(0, peak - self.start_memory)
+            _open_spans.stack.pop()
+            if _open_spans.stack:
+                parent = _open_spans.stack[-1]
+                parent.child_peak = max(parent.child_peak, peak)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.start_ns, wall_ns, cpu_ns, self.counters, self.args)
+        return False
+
+    def add(self, **counters):
+        """Adds to the span's counters, e.g. span.add(samples=len(audio))."""
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + int(value)
+
+    def read_file(self, path):
+        """Counts the size of a file the stage read."""
+        self.add(bytes_read=os.path.getsize(path))
+
+    def wrote_file(self, path):
+        """Counts the size of a file the stage wrote."""
+        self.add(bytes_written=os.path.getsize(path))
+
+
+class Tracer:
+    def __init__(self, memory=False):
+        """Collects finished spans of one run, safe to use from several threads.
+
+        With memory=True every span also records its tracemalloc peak above the memory in use when it
+        started, as the peak_memory counter. tracemalloc slows allocations down, so it is off by default.
+        """
+        self.events = []
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._lock = threading.Lock()
+
+    def record(self, name, start_ns, wall_ns, cpu_ns, counters, args):
+        event = {
+            "name": name,
+            "start_ns": start_ns,  # perf_counter is system-wide, so worker processes share the time axis
+            "wall_ns": wall_ns,
+            "cpu_ns": cpu_ns,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "counters": counters,
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def merge(self, events):
+        """Adds events recorded by another process, e.g. a batch worker."""
+        with self._lock:
+            self.events.extend(events)
+
+    def summary(self):
+        """Aggregates the events per span name: count, wall and CPU seconds and summed counters."""
+        stages = {}
+        for event in self.events:
+            stage = stages.setdefault(event["name"], {"count": 0, "wall": 0.0, "cpu": 0.0,
+                                                      **{key: 0 for key in COUNTERS}})
+            stage["count"] += 1
+            stage["wall"] += event["wall_ns"] / 1e9
+            stage["cpu"] += event["cpu_ns"] / 1e9
+            for key, value in event["counters"].items():
+                if key == "peak_memory":
+                    stage[key] = max(stage.get(key, 0), value)  # Peaks don't add up, keep the largest
+                else:
+                    stage[key] = stage.get(key, 0) + value
+        return stages
+
+    def format_summary(self):
+        """Formats summary() as a table, slowest stage first."""
+        stages = sorted(self.summary().items(), key=lambda item: -item[1]["wall"])
+        lines = [f"{'stage':<32}{'count':>7}{'wall s':>10}{'cpu s':>10}{'read MB':>10}{'written MB':>12}"
+                 f"{'samples':>14}{'peak MB':>10}"]
+        for name, stage in stages:
+            peak = f"{stage['peak_memory'] / 2 ** 20:.1f}" if "peak_memory" in stage else "-"
+            lines.append(f"{name:<32}{stage['count']:>7}{stage['wall']:>10.3f}{stage['cpu']:>10.3f}"
+                         f"{stage['bytes_read'] / 2 ** 20:>10.1f}{stage['bytes_written'] / 2 ** 20:>12.1f}"
+                         f"{stage['samples']:>14}{peak:>10}")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path):
+        """Writes the events in Chrome trace-event format, viewable in chrome://tracing or Perfetto."""
+        trace_events = []
+        origin_ns = min((event["start_ns"] for event in self.events), default=0)
+        for event in self.events:
+            trace_events.append({
+                "name": event["name"],
+                "cat": event["name"].split(".")[0],
+                "ph": "X",
+                "ts": (event["start_ns"] - origin_ns) / 1000,
+                "dur": event["wall_ns"] / 1000,
+                "pid": event["pid"],
+                "tid": event["tid"],
+                "args": {"cpu_ms": event["cpu_ns"] / 1e6, **event["counters"], **event["args"]},
+            })
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+        print(f"Trace written to {path}")
+
+
+_tracer = None
+
+
+def enable(memory=False):
+    """Starts collecting spans into a new tracer and returns it, see Tracer for memory."""
+    global _tracer
+    _tracer = Tracer(memory)
+    return _tracer
+
+
+def disable():
+    """Stops collecting spans and returns the tracer that was active, if any."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def span(name, **args):
+    """Context manager timing one stage. Returns a shared no-op object when tracing is off."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def traced(name):
+    """Decorator form of span() for methods that are a stage as a whole."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with Span(_tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def enable_from_env():
+    """Enables tracing when SAMPLE_EDITOR_TRACE is set, writing the trace and printing the summary at exit."""
+    path = os.environ.get(TRACE_ENV)
+    if not path:
+        return None
+    tracer = enable(memory=os.environ.get(TRACE_MEMORY_ENV) == "1")
+
+    def finish():
+        tracer.export_chrome_trace(path)
+        print(tracer.format_summary())
+
+    atexit.register(finish)
+    return tracer
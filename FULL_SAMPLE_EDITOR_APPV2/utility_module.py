@@ -1,54 +1,202 @@
-import librosa
+import os
+import shutil
 import soundfile as sf
 import numpy as np
+from resample_module import Resampler, oversampling_filter
+from loudness_module import LoudnessAnalyzer
+from trace_module import span, traced
+from buffer_module import apply_gain, writable
+
+# Frames read per block by the streaming normalizer, memory use depends on this and not on file size
+BLOCK_SIZE = 65536
+
+# Frames repeated between blocks so the oversampled true peak isn't missed at block boundaries
+TRUE_PEAK_OVERLAP = 64
 
 class UtilityProcessor:
     def __init__(self):
         self.target_sample_rate = 44100  # Default sample rate
         self.normalize_enabled = False
         self.target_db = -3  # Default normalization level in dB
+        self.normalize_mode = "rms"  # "rms" uses target_db, "lufs" uses target_lufs
+        self.target_lufs = -14.0  # Integrated loudness target for the "lufs" mode
+        self.resample_quality = "hq"  # One of resample_module.QUALITY_PRESETS
+        self.true_peak_ceiling = None  # Optional true-peak ceiling in dBTP, gain is reduced so it is never exceeded
 
     def process_sample(self, file_path, output_path):
         """Processes a sample by resampling and normalizing if enabled."""
         if self.normalize_enabled:
-            self.normalize_sample(file_path, output_path)
-        else:
-            self.resample_sample(file_path, output_path)
+            if self.normalize_mode == "lufs":
+                self.normalize_sample_lufs(file_path, self.target_lufs, output_path=output_path)
+            else:
+                self.normalize_sample(file_path, self.target_db, output_path)
+            file_path = output_path
+        self.resample_sample(file_path, self.target_sample_rate, output_path)
 
-    def resample_sample(self, file_path, target_sample_rate):
-        """Resample the audio file to the target sample rate."""
+    def resample_sample(self, file_path, target_sample_rate, output_path=None):
+        """Resample the audio file to the target sample rate, skipping files already at that rate."""
         try:
-            # Load the original audio file
-            audio_data, original_sample_rate = librosa.load(file_path, sr=None)
-            
-            # Resample the audio to the target sample rate
-            resampled_audio = librosa.resample(y=audio_data, orig_sr=original_sample_rate, target_sr=target_sample_rate)
-            
-            # Save the resampled audio back to the file
-            sf.write(file_path, resampled_audio, target_sample_rate)
-            print(f"Successfully resampled {file_path} to {target_sample_rate} Hz")
+            with span("utility.resample", rate=int(target_sample_rate)) as stage:
+                # Reads only the header when the rate already matches
+                if Resampler(self.resample_quality).resample_file(file_path, target_sample_rate, output_path):
+                    stage.read_file(file_path)
+                    stage.wrote_file(output_path or file_path)
+                    print(f"Successfully resampled {file_path} to {target_sample_rate} Hz")
         except Exception as e:
             print(f"Error while resampling: {e}")
-            
-    def normalize_sample(self, sample_path, target_db):
-        """Normalizes the sample to the specified target dB level."""
+
+    def resample_samples(self, file_paths, target_sample_rate):
+        """Resample many files at once, grouped by their source sample rate."""
         try:
-            # Convert the target_db to a float (ensure it's numeric)
-            target_db = float(target_db)
-            
-            audio_data, sample_rate = sf.read(sample_path)
-            
-            # Calculate the gain needed to reach the target dB level
-            rms = np.sqrt(np.mean(audio_data**2))
-            current_db = 20 * np.log10(rms)
-            gain = 10 ** ((target_db - current_db) / 20)
-            
-            # Apply the gain
-            normalized_audio = audio_data * gain
-            
-            # Save the normalized audio back to the file
-            sf.write(sample_path, normalized_audio, sample_rate)
+            stats = Resampler(self.resample_quality).resample_files(file_paths, target_sample_rate)
+            print(f"Resampled {stats['resampled']} samples to {target_sample_rate} Hz, {stats['skipped']} already matched")
+            return stats
+        except Exception as e:
+            print(f"Error while resampling: {e}")
+            return None
+
+    @traced("utility.normalize")
+    def normalize_sample(self, sample_path, target_db, output_path=None):
+        """Normalizes the sample to the specified target dB level, streaming it block by block."""
+        try:
+            # Pass one: RMS and peak, without holding the whole file in memory
+            levels = self.measure_levels(sample_path, true_peak=self.true_peak_ceiling is not None)
+
+            gain = self.rms_gain(levels, target_db)
+            if gain is None:
+                # log10(0) would give an infinite gain, leave silent files untouched
+                print(f"{sample_path} is entirely silent, skipping normalization")
+                if output_path and output_path != sample_path:
+                    shutil.copyfile(sample_path, output_path)
+                return
+
+            # Pass two: apply the gain block by block into the output
+            self.apply_gain(sample_path, gain, output_path)
             print(f"Successfully normalized {sample_path} to {target_db} dB")
-        
+
+        except Exception as e:
+            print(f"Error while normalizing: {e}")
+
+    @traced("utility.normalize")
+    def normalize_sample_lufs(self, sample_path, target_lufs, measurement=None, output_path=None):
+        """Normalizes the sample to an integrated loudness, reusing a cached measurement when one is given."""
+        try:
+            # Only analyse here if the export didn't already have a measurement for this sample
+            if measurement is None:
+                measurement = LoudnessAnalyzer(workers=1).analyze_files([sample_path])[sample_path]
+
+            gain = self.lufs_gain(measurement, target_lufs)
+            if gain is None:
+                print(f"{sample_path} is below the loudness gate, skipping normalization")
+                if output_path and output_path != sample_path:
+                    shutil.copyfile(sample_path, output_path)
+                return
+
+            self.apply_gain(sample_path, gain, output_path)
+            print(f"Successfully normalized {sample_path} to {target_lufs} LUFS")
+
         except Exception as e:
             print(f"Error while normalizing: {e}")
+
+    def rms_gain(self, levels, target_db):
+        """Gain that brings levels["rms"] to target_db without passing the true-peak ceiling, None for silence."""
+        if levels["rms"] == 0:
+            return None
+        gain = 10 ** ((float(target_db) - 20 * np.log10(levels["rms"])) / 20)
+
+        # Pull the gain back if it would push the true peak over the ceiling
+        if self.true_peak_ceiling is not None and levels["true_peak"] > 0:
+            gain = min(gain, 10 ** (self.true_peak_ceiling / 20) / levels["true_peak"])
+        return gain
+
+    def lufs_gain(self, measurement, target_lufs):
+        """Gain that brings a loudness measurement to target_lufs without passing the true-peak ceiling, None below the gate."""
+        if measurement["lufs"] is None:
+            return None
+        gain = 10 ** ((float(target_lufs) - measurement["lufs"]) / 20)
+
+        # Pull the gain back if it would push the true peak over the ceiling
+        if self.true_peak_ceiling is not None and measurement["true_peak_db"] is not None:
+            gain = min(gain, 10 ** ((self.true_peak_ceiling - measurement["true_peak_db"]) / 20))
+        return gain
+
+    @traced("utility.normalize")
+    def normalize_buffer(self, audio, sample_rate, measurement=None):
+        """Normalizes a float32 buffer by RMS or loudness, like normalize_sample and normalize_sample_lufs.
+
+        Scales it in place, or a copy if it is read-only, and returns (audio, applied gain or None).
+        """
+        if self.normalize_mode == "lufs":
+            if measurement is None:
+                measurement = LoudnessAnalyzer(workers=1).analyze_batch([audio.reshape(len(audio), -1)], sample_rate)[0]
+            gain = self.lufs_gain(measurement, self.target_lufs)
+        else:
+            gain = self.rms_gain(self.buffer_levels(audio, true_peak=self.true_peak_ceiling is not None), self.target_db)
+
+        if gain is None:
+            print("Sample is silent or below the loudness gate, skipping normalization")
+            return audio, None
+        return apply_gain(writable(audio), gain), gain
+
+    def resample_buffer(self, audio, sample_rate):
+        """Resamples a float32 buffer to target_sample_rate, returning it untouched if it is already there."""
+        with span("utility.resample", rate=int(self.target_sample_rate)):
+            return Resampler(self.resample_quality).resample(audio, sample_rate, self.target_sample_rate)
+
+    def buffer_levels(self, audio, true_peak=False):
+        """RMS, sample peak and optionally true peak (linear) of a float32 buffer, like measure_levels."""
+        flat = audio.ravel()
+        rms = float(np.sqrt(np.dot(flat, flat) / flat.size)) if flat.size else 0.0
+        peak = float(np.max(np.abs(flat))) if flat.size else 0.0
+        return {"rms": rms, "peak": peak, "true_peak": max(self.true_peak(audio), peak) if true_peak else peak}
+
+    def measure_levels(self, sample_path, true_peak=False, block_size=BLOCK_SIZE):
+        """Streams the file once and returns its RMS, sample peak and optionally its true peak (linear)."""
+        sum_squares = 0.0
+        count = 0
+        peak = 0.0
+        max_true_peak = 0.0
+
+        overlap = TRUE_PEAK_OVERLAP if true_peak else 0
+        with span("utility.measure_levels") as stage:
+            for block in sf.blocks(sample_path, blocksize=block_size, overlap=overlap, dtype='float32'):
+                # Skip the frames repeated from the previous block so they aren't counted twice
+                new_frames = block[overlap:] if count else block
+                sum_squares += float(np.dot(new_frames.ravel(), new_frames.ravel()))
+                count += new_frames.size
+                if new_frames.size:
+                    peak = max(peak, float(np.max(np.abs(new_frames))))
+                if true_peak:
+                    max_true_peak = max(max_true_peak, self.true_peak(block))
+            stage.read_file(sample_path)
+            stage.add(samples=count)
+
+        rms = float(np.sqrt(sum_squares / count)) if count else 0.0
+        return {"rms": rms, "peak": peak, "true_peak": max(max_true_peak, peak)}
+
+    @staticmethod
+    def true_peak(block, oversample=4):
+        """Estimates the inter-sample peak of a block by oversampling it."""
+        if len(block) == 0:
+            return 0.0
+        from scipy import signal
+
+        upsampled = signal.resample_poly(block, oversample, 1, axis=0, window=oversampling_filter(oversample))
+        return float(max(upsampled.max(), -upsampled.min()))
+
+    def apply_gain(self, sample_path, gain, output_path=None, block_size=BLOCK_SIZE):
+        """Streams the file through a constant gain into output_path (in place if not given)."""
+        output_path = output_path or sample_path
+        info = sf.info(sample_path)
+
+        # Write next to the output and swap it in at the end, so in-place runs never read their own output
+        temp_path = f"{output_path}.normalizing"
+        with span("utility.apply_gain") as stage:
+            stage.read_file(sample_path)
+            with sf.SoundFile(temp_path, 'w', samplerate=info.samplerate, channels=info.channels,
+                              subtype=info.subtype, format=info.format) as out:
+                for block in sf.blocks(sample_path, blocksize=block_size, dtype='float32'):
+                    out.write(apply_gain(block, gain))
+            os.replace(temp_path, output_path)
+            stage.wrote_file(output_path)
+            stage.add(samples=info.frames * info.channels)
@@ -0,0 +1,165 @@
+import numpy as np
+from PyQt5.QtCore import Qt, QLineF, QRectF
+from PyQt5.QtGui import QPainter, QPen, QColor, QImage
+from PyQt5.QtWidgets import QWidget
+
+# Pen styles for the matplotlib linestyles the app uses
+LINE_STYLES = {'-': Qt.SolidLine, '--': Qt.DashLine, ':': Qt.DotLine}
+LINE_COLORS = {'r': QColor(220, 40, 40), 'red': QColor(220, 40, 40), 'b': QColor(30, 60, 200),
+               'blue': QColor(30, 60, 200)}
+WAVEFORM_COLOR = QColor(30, 60, 200)
+
+# Anchor colours of the spectrogram palette, dark to bright like matplotlib's magma
+PALETTE_ANCHORS = [(0, 0, 4), (59, 15, 112), (140, 41, 129), (222, 73, 104), (254, 159, 109), (252, 253, 191)]
+
+
+def palette():
+    """256-entry colour table for 8-bit spectrogram images."""
+    anchors = np.array(PALETTE_ANCHORS, dtype=np.float64)
+    positions = np.linspace(0, 255, len(anchors))
+    channels = [np.interp(np.arange(256), positions, anchors[:, i]).astype(np.uint32) for i in range(3)]
+    return [int(0xFF000000 | (r << 16) | (g << 8) | b) for r, g, b in zip(*channels)]
+
+
+class VerticalLine:
+    def __init__(self, widget, x, color='r', linestyle='--', linewidth=1):
+        """A marker or playhead line, with the two methods the app calls on matplotlib's Line2D."""
+        self.widget = widget
+        self.x = x
+        self.pen = QPen(LINE_COLORS.get(color, QColor(color)), linewidth, LINE_STYLES.get(linestyle, Qt.SolidLine))
+
+    def set_xdata(self, xdata):
+        """Moves the line, [None] hides it."""
+        self.x = xdata[0]
+
+    def remove(self):
+        if self in self.widget.lines:
+            self.widget.lines.remove(self)
+
+
+class ClickEvent:
+    def __init__(self, widget, xdata, gui_event):
+        """The fields of matplotlib's MouseEvent the app's click handler reads."""
+        self.inaxes = widget
+        self.xdata = xdata
+        self.guiEvent = gui_event
+
+
+class WaveformWidget(QWidget):
+    def __init__(self, parent=None):
+        """
+        Waveform view painted with QPainter straight from the peak pyramid.
+
+        Every repaint reduces the visible range to one min/max pair per pixel column, so its cost
+        depends on the widget width, not on the file length or zoom. The widget implements the few
+        Axes and FigureCanvas methods the app calls (clear, axvline, imshow, get_xlim, set_xlim, draw,
+        mpl_connect), so it can stand in for the matplotlib canvas.
+        """
+        super().__init__(parent)
+        self.setMinimumHeight(200)
+        self.figure = self  # ax.figure.canvas.draw() in the app
+        self.canvas = self
+        self.peaks = None
+        self.audio = None
+        self.image = None  # (QImage, (left, right, bottom, top))
+        self.lines = []
+        self._xlim = None
+        self._click_handlers = []
+
+    # Axes-like methods
+
+    def clear(self):
+        self.peaks = None
+        self.audio = None
+        self.image = None
+        self.lines = []
+        self._xlim = None
+
+    def plot_peaks(self, peaks, audio=None):
+        """Shows a PeakPyramid, with the decoded audio (if any) used when zoomed in past its finest level."""
+        self.peaks = peaks
+        self.audio = audio
+
+    def imshow(self, data, extent, vmin=None, vmax=None, **kwargs):
+        """Shows a (rows, columns) image with origin='lower' over extent, mapped to an 8-bit palette."""
+        vmin = float(data.min()) if vmin is None else vmin
+        vmax = float(data.max()) if vmax is None else vmax
+        scaled = np.clip((data - vmin) * (255 / max(vmax - vmin, 1e-9)), 0, 255).astype(np.uint8)
+        pixels = scaled[::-1].tobytes()  # Row 0 is the lowest frequency, the top row of a QImage is the highest
+        image = QImage(pixels, scaled.shape[1], scaled.shape[0], scaled.shape[1], QImage.Format_Indexed8)
+        image.setColorTable(palette())
+        self.image = (image.copy(), extent)  # copy() so the image doesn't point into the bytes buffer
+
+    def axvline(self, x, color='r', linestyle='-', linewidth=1):
+        line = VerticalLine(self, x, color, linestyle, linewidth)
+        self.lines.append(line)
+        return line
+
+    def get_xlim(self):
+        if self._xlim is not None:
+            return self._xlim
+        if self.peaks is not None:
+            return (0.0, self.peaks.duration)
+        if self.image is not None:
+            return tuple(self.image[1][:2])
+        return (0.0, 1.0)
+
+    def set_xlim(self, left, right=None):
+        if right is None:
+            left, right = left
+        self._xlim = (float(left), float(right))
+
+    # Canvas-like methods
+
+    def draw(self):
+        self.update()
+
+    def mpl_connect(self, name, handler):
+        if name == 'button_press_event':
+            self._click_handlers.append(handler)
+
+    # Qt events
+
+    def x_to_time(self, x):
+        left, right = self.get_xlim()
+        return left + (right - left) * x / max(self.width(), 1)
+
+    def time_to_x(self, time):
+        left, right = self.get_xlim()
+        return (time - left) * self.width() / max(right - left, 1e-12)
+
+    def mousePressEvent(self, event):
+        click = ClickEvent(self, self.x_to_time(event.x()), event)
+        for handler in self._click_handlers:
+            handler(click)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        width, height = self.width(), self.height()
+        left, right = self.get_xlim()
+
+        if self.image is not None:
+            image, (image_left, image_right, _, _) = self.image
+            target = QRectF(self.time_to_x(image_left), 0, self.time_to_x(image_right) - self.time_to_x(image_left),
+                            height)
+            painter.drawImage(target, image)
+
+        if self.peaks is not None and width > 0:
+            mins, maxs = self.peaks.columns(left, right, width, self.audio)
+            middle = height / 2
+            scale = -middle * 0.95
+            visible = np.flatnonzero(~np.isnan(mins))
+            tops = middle + maxs[visible] * scale
+            bottoms = middle + mins[visible] * scale
+            painter.setPen(QPen(WAVEFORM_COLOR, 1))
+            painter.drawLines([QLineF(x, top, x, bottom) for x, top, bottom in
+                               zip(visible.tolist(), tops.tolist(), bottoms.tolist())])
+
+        for line in self.lines:
+            if line.x is None or not left <= line.x <= right:
+                continue  # Clipped, only lines inside the view are drawn
+            x = self.time_to_x(line.x)
+            painter.setPen(line.pen)
+            painter.drawLine(QLineF(x, 0, x, height))
+        painter.end()